@@ -0,0 +1,257 @@
+"""Extract business cards from a directory or manifest without the Streamlit UI.
+
+Results are appended to a JSONL file, one line per card, as soon as each
+card finishes. The JSONL output doubles as the checkpoint: rerunning the
+same command skips every card that already has a successful line, so a
+killed run resumes without paying for finished cards again.
+
+    python batch_extract.py scans/ --output cards.jsonl --csv cards.csv --workers 8
+    python batch_extract.py scans/ --output cards.jsonl --vcf contacts.vcf --parquet cards.parquet
+    python batch_extract.py --manifest files.txt --output cards.jsonl --metrics metrics.prom
+    python batch_extract.py scans/ --output cards.jsonl --store
+    python batch_extract.py scans/ --output cards.jsonl --csv merged.csv --dedupe
+"""
+import argparse
+from concurrent.futures import ThreadPoolExecutor, as_completed
+import json
+import os
+import sys
+import time
+
+from utils.card_dedupe import dedupe_cards
+from utils.card_export import parquet_available, write_export
+from utils.card_store import STORE_PATH, CardStore
+from utils.image_prep import prepare_image
+from utils.metrics import registry
+from utils.vision_parser import (
+    CARD_BATCH_SIZE, DETAIL_MODES, OUTPUT_MODE, OUTPUT_MODES, VISION_DETAIL, extract_cards_info, get_cleanup_queue
+)
+
+
+IMAGE_EXTENSIONS = ('.png', '.jpg', '.jpeg')
+
+
+def find_images(directory):
+    """All card images below a directory, in a stable order"""
+    paths = []
+    for root, _, files in os.walk(directory):
+        for name in files:
+            if name.lower().endswith(IMAGE_EXTENSIONS):
+                paths.append(os.path.join(root, name))
+    return sorted(paths)
+
+
+def read_manifest(manifest):
+    """Image paths listed one per line (blank lines and # comments are ignored)"""
+    base = os.path.dirname(os.path.abspath(manifest))
+    with open(manifest, encoding='utf-8') as f:
+        lines = [line.strip() for line in f]
+    return [os.path.join(base, line) for line in lines if line and not line.startswith('#')]
+
+
+def source_key(path):
+    """Checkpoint key for an input file: path, size and modification time"""
+    stat = os.stat(path)
+    return f"{os.path.abspath(path)}:{stat.st_size}:{stat.st_mtime_ns}"
+
+
+def load_checkpoint(output):
+    """Records already written to the output, and the keys of finished cards
+
+    A partially written last line (from a killed run) is cut off so new
+    lines can be appended cleanly.
+    """
+    records, finished = [], set()
+    if not os.path.exists(output):
+        return records, finished
+
+    with open(output, 'rb+') as f:
+        good_end = 0
+        for line in f:
+            try:
+                record = json.loads(line)
+            except ValueError:
+                break
+            if not line.endswith(b'\n'):
+                break
+            good_end += len(line)
+            records.append(record)
+            if record.get('processing_status') == 'success':
+                finished.add(record.get('source_key'))
+        f.truncate(good_end)
+    return records, finished
+
+
+def process_batch(paths, keys, output_mode=None, detail=None):
+    """
+    Extract a group of files; returns one record per path (safe to run in a worker thread)
+
+    keys are the files' source keys, taken when the run was planned. Never
+    raises: files that cannot be read or extracted get failed records.
+    """
+    records = [None] * len(paths)
+    prepared = {}
+    for n, path in enumerate(paths):
+        try:
+            with open(path, 'rb') as f:
+                prepared[n] = prepare_image(f.read())
+        except Exception as e:
+            records[n] = failed_record(path, e)
+
+    try:
+        results = extract_cards_info(
+            list(prepared.values()), batch_size=len(paths), output_mode=output_mode, detail=detail
+        )
+    except Exception as e:
+        results = [e] * len(prepared)
+    for n, result in zip(prepared, results):
+        if isinstance(result, Exception):
+            records[n] = failed_record(paths[n], result)
+        else:
+            records[n] = result
+            records[n]['processing_status'] = 'success'
+
+    for n, path in enumerate(paths):
+        finish_record(records[n], path, keys[n], prepared[n].stats if n in prepared else None)
+    return records
+
+
+def finish_record(record, path, key, image_stats=None):
+    record['filename'] = os.path.basename(path)
+    record['source_key'] = key
+    record['image_stats'] = image_stats
+    return record
+
+
+def failed_record(path, error):
+    """Same minimal failure record the Streamlit app produces"""
+    return {
+        'processing_status': 'failed',
+        'error_message': str(error),
+        'company_name': f'Error processing image: {os.path.basename(path)}'
+    }
+
+
+def latest_records(records):
+    """Last record per input file, in first-seen order (a retried card supersedes its failure)"""
+    latest = {}
+    for record in records:
+        latest.pop(record.get('source_key'), None)
+        latest[record.get('source_key')] = record
+    return list(latest.values())
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('directory', nargs='?', help="Directory to scan for .png/.jpg/.jpeg files")
+    parser.add_argument('--manifest', help="Text file listing one image path per line")
+    parser.add_argument('--output', required=True, help="JSONL results file (also the resume checkpoint)")
+    parser.add_argument('--csv', help="Also write the flattened CSV export here when done")
+    parser.add_argument('--vcf', help="Also write a vCard contact file here when done")
+    parser.add_argument('--parquet', help="Also write the flattened columns as Parquet here when done "
+                                          "(needs pyarrow: pip install '.[parquet]')")
+    parser.add_argument('--dedupe', action='store_true',
+                        help="Merge cards of the same contact or company in the CSV, vCard and Parquet exports")
+    parser.add_argument('--workers', type=int, default=4, help="Requests processed in parallel")
+    parser.add_argument('--batch-size', type=int, default=CARD_BATCH_SIZE, help="Cards per model request")
+    parser.add_argument('--output-mode', choices=OUTPUT_MODES, default=OUTPUT_MODE,
+                        help="json_schema uses strict structured output with a short prompt")
+    parser.add_argument('--detail', choices=DETAIL_MODES, default=VISION_DETAIL,
+                        help="adaptive reads at low detail and re-reads cards failing the checks at high detail")
+    parser.add_argument('--store', nargs='?', const=STORE_PATH or 'cards.sqlite3', metavar='PATH',
+                        help="Also save successful cards to the searchable SQLite card store (default: the app's store)")
+    parser.add_argument('--metrics', help="Write stage timings, tokens and retries here (Prometheus text format)")
+    args = parser.parse_args()
+
+    if bool(args.directory) == bool(args.manifest):
+        parser.error("give either a directory or --manifest")
+    if args.parquet and not parquet_available():
+        # Fail before any card is extracted rather than after the run
+        parser.error("--parquet needs pyarrow: pip install '.[parquet]'")
+    paths = find_images(args.directory) if args.directory else read_manifest(args.manifest)
+    if args.metrics:
+        registry.install()
+    store = CardStore(args.store) if args.store else None
+
+    records, finished = load_checkpoint(args.output)
+    # A file that is missing or unreadable fails on its own instead of stopping the run
+    keys, unreadable = {}, []
+    for path in paths:
+        try:
+            keys[path] = source_key(path)
+        except OSError as e:
+            unreadable.append(finish_record(failed_record(path, e), path, os.path.abspath(path)))
+    pending = [path for path in keys if keys[path] not in finished]
+    print(f"{len(paths)} cards, {len(keys) - len(pending)} already done, {len(pending)} to process, "
+          f"{len(unreadable)} unreadable", file=sys.stderr)
+
+    batches = [pending[i:i + args.batch_size] for i in range(0, len(pending), args.batch_size)]
+    start = time.monotonic()
+    done = failed = 0
+    with open(args.output, 'a', encoding='utf-8') as out, \
+            ThreadPoolExecutor(max_workers=args.workers) as executor:
+
+        def checkpoint(batch_records):
+            nonlocal done, failed
+            for record in batch_records:
+                out.write(json.dumps(record, ensure_ascii=False) + '\n')
+                records.append(record)
+                done += 1
+                failed += record['processing_status'] == 'failed'
+            if store:
+                store.put_many([record for record in batch_records if record['processing_status'] == 'success'])
+            # Each finished batch is durable before it counts as checkpointed
+            out.flush()
+            os.fsync(out.fileno())
+
+        checkpoint(unreadable)
+        total = len(unreadable) + len(pending)
+        futures = [
+            executor.submit(process_batch, batch, [keys[path] for path in batch], args.output_mode, args.detail)
+            for batch in batches
+        ]
+        written = set()
+        try:
+            for future in as_completed(futures):
+                checkpoint(future.result())
+                written.add(future)
+                print(f"\r{done}/{total} processed, {failed} failed, "
+                      f"{done / (time.monotonic() - start):.1f} cards/s", end='', file=sys.stderr)
+        except KeyboardInterrupt:
+            for future in futures:
+                future.cancel()
+            running = [future for future in futures if future not in written and not future.cancelled()]
+            print(f"\nInterrupted, saving {len(running)} batches already sent to the model "
+                  f"(Ctrl-C again to drop them)", file=sys.stderr)
+            # Requests in flight are paid for; checkpoint them so a resume does not send them again
+            for future in as_completed(running):
+                checkpoint(future.result())
+            print("Rerun the same command to resume", file=sys.stderr)
+            raise SystemExit(130)
+    print(file=sys.stderr)
+
+    # Exports are written row by row from the latest record of each card
+    latest = latest_records(records)
+    if args.dedupe:
+        latest, groups = dedupe_cards(latest)
+        print(f"Merged {sum(len(group) for group in groups)} cards into {len(groups)} records", file=sys.stderr)
+    for export_format, path in (('CSV', args.csv), ('vCard', args.vcf), ('Parquet', args.parquet)):
+        if not path:
+            continue
+        if export_format == 'Parquet':
+            f = open(path, 'wb')
+        else:
+            f = open(path, 'w', encoding='utf-8', newline='')
+        with f:
+            write_export(latest, export_format, f)
+
+    # Make sure staged S3 objects are gone before exiting
+    get_cleanup_queue().flush()
+
+    if args.metrics:
+        with open(args.metrics, 'w', encoding='utf-8') as f:
+            f.write(registry.render())
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,90 @@
+"""Check the S3 cleanup queue against moto's in-process S3.
+
+Stages --objects keys in a mocked bucket, deletes them through
+S3CleanupQueue and checks that the bucket ends up empty. The first
+--throttled DeleteObjects calls answer every key with SlowDown, so the run
+also shows how long a throttled key waits before its retry and that it is
+still deleted; every key is enqueued twice in a row to check that duplicates
+in a batch are deleted once. Needs moto (pip install moto), which is not a
+dependency of the app:
+
+    python -m benchmarks.bench_cleanup --objects 2500 --throttled 2
+"""
+import argparse
+import os
+import time
+
+from utils.s3_cleanup import S3CleanupQueue
+
+
+class ThrottledS3:
+    """Wraps a boto3 S3 client, answering the first `failures` DeleteObjects calls with SlowDown"""
+
+    def __init__(self, client, failures):
+        self.client = client
+        self.failures = failures
+        self.calls = 0
+        self.attempts = {}  # key -> times it was sent
+
+    def delete_objects(self, Bucket, Delete):
+        self.calls += 1
+        for obj in Delete['Objects']:
+            self.attempts.setdefault(obj['Key'], []).append(time.monotonic())
+        if self.failures > 0:
+            self.failures -= 1
+            return {'Errors': [
+                {'Key': obj['Key'], 'Code': 'SlowDown', 'Message': 'Please reduce your request rate.'}
+                for obj in Delete['Objects']
+            ]}
+        return self.client.delete_objects(Bucket=Bucket, Delete=Delete)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--objects', type=int, default=2500)
+    parser.add_argument('--throttled', type=int, default=2, help="DeleteObjects calls answered with SlowDown")
+    parser.add_argument('--retry-delay', type=float, default=0.5)
+    parser.add_argument('--max-attempts', type=int, default=4)
+    args = parser.parse_args()
+
+    import boto3
+    from moto import mock_aws
+
+    # moto never talks to AWS, but boto3 still wants credentials and a region
+    for name, value in (('AWS_ACCESS_KEY_ID', 'testing'), ('AWS_SECRET_ACCESS_KEY', 'testing'),
+                        ('AWS_DEFAULT_REGION', 'us-east-1')):
+        os.environ.setdefault(name, value)
+
+    with mock_aws():
+        s3 = boto3.client('s3')
+        bucket = 'card-staging'
+        s3.create_bucket(Bucket=bucket)
+        keys = [f"card_{n:06d}.jpg" for n in range(args.objects)]
+        for key in keys:
+            s3.put_object(Bucket=bucket, Key=key, Body=b'jpeg')
+
+        client = ThrottledS3(s3, args.throttled)
+        cleanup = S3CleanupQueue(lambda: client, bucket, linger=0.05,
+                                 max_attempts=args.max_attempts, retry_delay=args.retry_delay)
+        start = time.perf_counter()
+        for key in keys:
+            cleanup.enqueue(key)
+            cleanup.enqueue(key)
+        cleanup.flush()
+        wall = time.perf_counter() - start
+        cleanup.close()
+
+        left = s3.list_objects_v2(Bucket=bucket).get('KeyCount', 0)
+        stats = cleanup.stats()
+        waits = [later - earlier for times in client.attempts.values() for earlier, later in zip(times, times[1:])]
+        print(f"{args.objects} objects (each enqueued twice) in {wall:.2f}s, "
+              f"{client.calls} DeleteObjects calls, {sum(map(len, client.attempts.values()))} keys sent")
+        print(f"  deleted {stats['deleted']}, retried {stats['retried']}, failed {stats['failed']}, "
+              f"pending {stats['pending']}")
+        if waits:
+            print(f"  wait before a retry: shortest {min(waits):.2f}s, longest {max(waits):.2f}s")
+        print(f"  left in bucket {left}")
+
+
+if __name__ == '__main__':
+    main()
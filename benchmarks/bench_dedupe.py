@@ -0,0 +1,162 @@
+"""Time duplicate detection and merging on synthetic cards with known duplicates.
+
+Cards are drawn from a pool of synthetic companies; every card of a company
+shares its domain and some of its emails and phone numbers, written with the
+formatting noise seen on real cards (country codes, spacing, case, www.).
+Company names are drawn from --names distinct names, so different companies
+share a name and only their city or pincode tells them apart.
+The run reports the time spent on blocking keys, union-find grouping and
+merging, pair precision and recall against the true companies, and what a
+pairwise comparison of every card would cost at the same size:
+
+    python -m benchmarks.bench_dedupe --cards 100000 --companies 40000 --names 10000
+"""
+import argparse
+from collections import Counter
+import random
+import time
+
+from utils.card_dedupe import blocking_keys, dedupe_cards, find_duplicates
+
+
+WORDS = ['Acme', 'Globex', 'Initech', 'Umbrella', 'Hooli', 'Stark', 'Wayne', 'Tyrell', 'Cyberdyne', 'Soylent',
+         'Vandelay', 'Wonka', 'Oscorp', 'Massive', 'Dynamic', 'Pied', 'Piper', 'Aperture', 'Black', 'Mesa']
+FIRST = ['Priya', 'Rahul', 'Anita', 'Vikram', 'Sara', 'John', 'Mei', 'Omar', 'Lena', 'Ravi', 'Kiran', 'Arjun']
+LAST = ['Sharma', 'Patel', 'Iyer', 'Khan', 'Smith', 'Chen', 'Garcia', 'Nair', 'Rao', 'Singh']
+CITIES = ['Mumbai', 'Delhi', 'Bengaluru', 'Chennai', 'Kolkata', 'Hyderabad', 'Pune', 'Ahmedabad', 'Jaipur', 'Surat',
+          'Lucknow', 'Kanpur', 'Nagpur', 'Indore', 'Bhopal', 'Patna', 'Vadodara', 'Ludhiana', 'Agra', 'Nashik']
+
+
+def make_company(n, names, rnd):
+    # Names repeat across companies; domains, phones and premises do not
+    name = rnd.choice(names)
+    domain = name.lower().replace(' ', '') + f"-{n}.com"
+    phone = f"{rnd.randint(20, 99)}{rnd.randint(10000000, 99999999)}"
+    people = [
+        (f"{rnd.choice(FIRST)} {rnd.choice(LAST)}", f"9{rnd.randint(100000000, 999999999)}")
+        for _ in range(rnd.randint(1, 3))
+    ]
+    city = rnd.choice(CITIES)
+    pincode = f"{rnd.randint(110, 855)}{rnd.randint(0, 999):03d}"
+    return {'name': name, 'domain': domain, 'phone': phone, 'people': people, 'city': city, 'pincode': pincode}
+
+
+def noisy_phone(digits, rnd):
+    """The same number as it might be printed on different cards"""
+    style = rnd.randrange(4)
+    if style == 0:
+        return f"+91 {digits[:2]} {digits[2:6]} {digits[6:]}"
+    if style == 1:
+        return f"0{digits[:2]}-{digits[2:]}"
+    if style == 2:
+        return f"(+91) {digits[:5]} {digits[5:]}"
+    return digits
+
+
+def make_card(company, rnd, index):
+    """One scanned card of a company, with noise in how shared values are written"""
+    person, mobile = rnd.choice(company['people'])
+    first = person.split()[0].lower()
+    website = rnd.choice([company['domain'], 'www.' + company['domain'], 'https://www.' + company['domain'] + '/'])
+    card = {
+        'company_name': rnd.choice([company['name'], company['name'] + ' Pvt. Ltd.', company['name'].upper()]),
+        'contact_person': [{
+            'name': rnd.choice([person, person.upper()]),
+            'position': rnd.choice(['Director', 'Sales Manager', None]),
+            'personal_phone': [noisy_phone(mobile, rnd)],
+            'personal_email': [rnd.choice([f"{first}@{company['domain']}", f"{first.upper()}@{company['domain'].upper()}",
+                                       f"{first}.{index}@gmail.com"])],
+        }],
+        'company_address': [{
+            'city': rnd.choice([company['city'], company['city'].upper()]),
+            'pincode': company['pincode'] if rnd.random() < 0.5 else None,
+        }] if rnd.random() < 0.7 else None,
+        'company_email': [f"info@{company['domain']}"] if rnd.random() < 0.5 else None,
+        'company_phone': [noisy_phone(company['phone'], rnd)] if rnd.random() < 0.7 else None,
+        'company_fax': None,
+        'company_website': [website] if rnd.random() < 0.6 else None,
+        'company_gstin': None,
+        'company_details_if_any': None,
+        'processing_status': 'success',
+        'filename': f"card{index}.jpg",
+    }
+    return card
+
+
+def pairs(sizes):
+    return sum(size * (size - 1) // 2 for size in sizes)
+
+
+def pair_scores(groups, truth, total):
+    """Precision and recall over card pairs placed in the same group"""
+    predicted = [0] * total
+    for number, group in enumerate(groups, start=1):
+        for index in group:
+            predicted[index] = number
+    # Ungrouped cards are singletons and contribute no pairs
+    both = Counter((truth[i], predicted[i]) for i in range(total) if predicted[i])
+    true_pairs = pairs(Counter(truth).values())
+    found_pairs = pairs(len(group) for group in groups)
+    correct = pairs(both.values())
+    return (correct / found_pairs if found_pairs else 1.0), (correct / true_pairs if true_pairs else 1.0)
+
+
+def pairwise_seconds(cards, sample):
+    """Seconds for comparing the key sets of every pair of the first `sample` cards"""
+    keys = [blocking_keys(card) for card in cards[:sample]]
+    start = time.perf_counter()
+    for i in range(len(keys)):
+        for j in range(i + 1, len(keys)):
+            keys[i].isdisjoint(keys[j])
+    return time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--cards', type=int, default=100_000)
+    parser.add_argument('--companies', type=int, default=40_000)
+    parser.add_argument('--names', type=int, default=10_000, help="Distinct company names shared by the companies")
+    parser.add_argument('--pairwise-sample', type=int, default=2000,
+                        help="Cards compared pairwise to extrapolate the quadratic cost")
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    rnd = random.Random(args.seed)
+    names = [f"{rnd.choice(WORDS)} {rnd.choice(WORDS)} {n}" for n in range(args.names)]
+    companies = [make_company(n, names, rnd) for n in range(args.companies)]
+    truth = [rnd.randrange(args.companies) for _ in range(args.cards)]
+    cards = [make_card(companies[company], rnd, index) for index, company in enumerate(truth)]
+    shared = Counter(company['name'] for company in companies)
+    print(f"{args.cards} cards from {args.companies} companies, "
+          f"{len(set(truth))} distinct companies scanned, "
+          f"{sum(count > 1 for count in shared.values())} names used by more than one company")
+
+    start = time.perf_counter()
+    for card in cards:
+        blocking_keys(card)
+    keys_seconds = time.perf_counter() - start
+
+    start = time.perf_counter()
+    groups = find_duplicates(cards)
+    group_seconds = time.perf_counter() - start
+
+    start = time.perf_counter()
+    records, _ = dedupe_cards(cards)
+    dedupe_seconds = time.perf_counter() - start
+
+    precision, recall = pair_scores(groups, truth, len(cards))
+    print(f"  blocking keys    {keys_seconds:8.2f}s")
+    print(f"  find_duplicates  {group_seconds:8.2f}s  ({len(groups)} groups, "
+          f"{sum(len(group) for group in groups)} cards)")
+    print(f"  dedupe_cards     {dedupe_seconds:8.2f}s  ({len(records)} records)")
+    print(f"  pair precision {precision:.4f}, recall {recall:.4f}")
+
+    sample = min(args.pairwise_sample, len(cards))
+    seconds = pairwise_seconds(cards, sample)
+    estimate = seconds * (len(cards) / sample) ** 2
+    print(f"  pairwise compare of {sample} cards took {seconds:.2f}s, "
+          f"~{estimate / 60:.0f} min extrapolated to {len(cards)} cards")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,83 @@
+"""Compare prompt/completion tokens and latency of the json_object and json_schema output modes.
+
+By default the fake client from benchmarks/fakes.py is used, which bills
+prompt tokens from the prompt text, the schema and a fixed cost per image;
+its completions are canned, so only the prompt side and per-token latency
+are meaningful. Pass --live with a directory of card photos to measure the
+real provider (needs OPENAI_API_KEY):
+
+    python -m benchmarks.bench_output_modes --cards 20
+    python -m benchmarks.bench_output_modes --live scans/ --cards 10
+"""
+import argparse
+import os
+import statistics
+import time
+
+from benchmarks.bench_stages import percentile
+from benchmarks.fakes import FakeOpenAIClient, synthetic_card
+from utils import vision_parser
+from utils.image_prep import prepare_image
+from utils.metrics import collect
+
+
+def load_images(args):
+    if not args.live:
+        return [prepare_image(synthetic_card(1600, 900, seed=i)) for i in range(args.cards)]
+    names = sorted(name for name in os.listdir(args.live) if name.lower().endswith(('.png', '.jpg', '.jpeg')))
+    images = []
+    for name in names[:args.cards]:
+        with open(os.path.join(args.live, name), 'rb') as f:
+            images.append(prepare_image(f.read()))
+    return images
+
+
+def run_mode(output_mode, images):
+    """Per-card latency and token counts for one output mode"""
+    latencies, prompt_tokens, completion_tokens, failures = [], [], [], 0
+    for image in images:
+        start = time.perf_counter()
+        with collect() as metrics:
+            try:
+                vision_parser.extract_card_info(image, output_mode=output_mode, use_cache=False)
+            except Exception:
+                failures += 1
+                continue
+        latencies.append(time.perf_counter() - start)
+        prompt_tokens.append(metrics.values['prompt_tokens'])
+        completion_tokens.append(metrics.values['completion_tokens'])
+    return latencies, prompt_tokens, completion_tokens, failures
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--cards', type=int, default=10)
+    parser.add_argument('--live', metavar='DIR', help="Use the real provider on the images in DIR")
+    parser.add_argument('--model-latency', type=float, default=0.6, help="Fake client only")
+    parser.add_argument('--token-latency', type=float, default=0.005,
+                        help="Fake client only: seconds per completion token")
+    args = parser.parse_args()
+
+    if not args.live:
+        vision_parser.client = FakeOpenAIClient(
+            rtt=0.03, model_latency=args.model_latency, output_token_latency=args.token_latency
+        )
+    images = load_images(args)
+    print(f"{len(images)} cards, {'live provider' if args.live else 'fake client'}, transport {vision_parser.IMAGE_TRANSPORT}")
+    print(f"{'mode':<12} {'prompt tok':>11} {'compl. tok':>11} {'p50 (s)':>8} {'p95 (s)':>8} {'failed':>7}")
+
+    for output_mode in vision_parser.OUTPUT_MODES:
+        latencies, prompt_tokens, completion_tokens, failures = run_mode(output_mode, images)
+        if not latencies:
+            print(f"{output_mode:<12} {'':>11} {'':>11} {'':>8} {'':>8} {failures:>7}")
+            continue
+        print(
+            f"{output_mode:<12} {statistics.mean(prompt_tokens):>11.0f} {statistics.mean(completion_tokens):>11.0f} "
+            f"{percentile(latencies, 50):>8.2f} {percentile(latencies, 95):>8.2f} {failures:>7}"
+        )
+    # Wait for any staged S3 objects to be deleted
+    vision_parser.get_cleanup_queue().flush()
+
+
+if __name__ == '__main__':
+    main()
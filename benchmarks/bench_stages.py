@@ -0,0 +1,190 @@
+"""Break extract_card_info latency down by stage using the local stand-ins.
+
+Synthetic cards of several sizes are extracted in parallel against the fake
+OpenAI and S3 clients from benchmarks/fakes.py. Every stage timed with
+utils.metrics.timed_stage (prepare, inline_encode, head, upload, presign, model,
+parse, delete) is reported with throughput and p50/p95/p99, per stage and end
+to end. Each run is saved as JSON under --output-dir and compared with the
+previous run (or --baseline) so regressions between versions stand out:
+
+    python -m benchmarks.bench_stages --cards 40 --sizes 800x500,1600x900,4000x3000
+    python -m benchmarks.bench_stages --transport inline --error-rate 0.05
+"""
+import argparse
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+import glob
+import json
+import os
+import subprocess
+import threading
+import time
+
+from benchmarks.fakes import FakeOpenAIClient, FakeS3Client, synthetic_card
+from utils import metrics, vision_parser
+from utils.scheduler import RequestScheduler
+
+
+PERCENTILES = (50, 95, 99)
+
+# Stages listed in the order they happen; anything else timed is appended
+STAGE_ORDER = ['prepare', 'inline_encode', 'head', 'upload', 'presign', 'model', 'parse', 'delete']
+
+
+def percentile(values, pct):
+    """Nearest-rank percentile of a non-empty list"""
+    ordered = sorted(values)
+    rank = max(1, -(-len(ordered) * pct // 100))
+    return ordered[int(rank) - 1]
+
+
+def summarize(values):
+    summary = {'count': len(values), 'mean': sum(values) / len(values)}
+    for pct in PERCENTILES:
+        summary[f'p{pct}'] = percentile(values, pct)
+    return summary
+
+
+def parse_sizes(text):
+    return [tuple(int(n) for n in size.split('x')) for size in text.split(',')]
+
+
+def git_commit():
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run(images, transport, workers):
+    """Extract every image; returns (stage timings, end-to-end latencies, errors, wall time)"""
+    stages = defaultdict(list)
+    lock = threading.Lock()
+
+    def record(stage, seconds):
+        with lock:
+            stages[stage].append(seconds)
+
+    def extract(image):
+        start = time.perf_counter()
+        try:
+            vision_parser.extract_card_info(image, transport=transport, use_cache=False)
+            error = None
+        except Exception as e:
+            error = str(e)
+        return time.perf_counter() - start, error
+
+    metrics.stage_listeners.append(record)
+    try:
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            results = list(executor.map(extract, images))
+        wall = time.perf_counter() - start
+        # Staged objects are deleted in the background, wait so 'delete' is counted
+        vision_parser.get_cleanup_queue().flush()
+    finally:
+        metrics.stage_listeners.remove(record)
+
+    latencies = [latency for latency, error in results if error is None]
+    errors = [error for _, error in results if error is not None]
+    return stages, latencies, errors, wall
+
+
+def load_previous(output_dir, baseline):
+    """The baseline file if given, else the most recent saved run"""
+    if baseline:
+        path = baseline
+    else:
+        runs = sorted(glob.glob(os.path.join(output_dir, 'stages-*.json')))
+        if not runs:
+            return None, None
+        path = runs[-1]
+    with open(path, encoding='utf-8') as f:
+        return path, json.load(f)
+
+
+def change(current, previous):
+    if not previous:
+        return ''
+    return f"{(current - previous) / previous * 100:>+7.1f}%"
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--cards', type=int, default=30, help="Cards per image size")
+    parser.add_argument('--sizes', default='800x500,1600x900,4000x3000', help="Comma separated WIDTHxHEIGHT")
+    parser.add_argument('--transport', choices=vision_parser.IMAGE_TRANSPORTS, default='s3')
+    parser.add_argument('--workers', type=int, default=8)
+    parser.add_argument('--rtt', type=float, default=0.05, help="Network round-trip time in seconds")
+    parser.add_argument('--bandwidth', type=float, default=2_000_000, help="Uplink bandwidth in bytes/s")
+    parser.add_argument('--model-latency', type=float, default=0.8)
+    parser.add_argument('--jitter', type=float, default=0.2, help="Latency jitter as a fraction (0.2 = +/-20%%)")
+    parser.add_argument('--error-rate', type=float, default=0.0, help="Fraction of fake model and upload calls that fail")
+    parser.add_argument('--rps', type=float, default=50.0, help="Scheduler request rate for the run")
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--output-dir', default=os.path.join('benchmarks', 'results'))
+    parser.add_argument('--baseline', help="Saved result to compare against (default: the latest run)")
+    parser.add_argument('--no-save', action='store_true', help="Print the report without saving it")
+    args = parser.parse_args()
+
+    s3 = FakeS3Client(rtt=args.rtt, bandwidth=args.bandwidth,
+                      error_rate=args.error_rate, jitter=args.jitter, seed=args.seed)
+    model = FakeOpenAIClient(rtt=args.rtt, bandwidth=args.bandwidth, model_latency=args.model_latency,
+                             error_rate=args.error_rate, jitter=args.jitter, seed=args.seed + 1)
+    vision_parser.s3_client = s3
+    vision_parser.client = model
+    # Keep the production rate limit from dominating the measurement; retries stay on
+    vision_parser.request_scheduler = RequestScheduler(
+        rate=args.rps, max_concurrent=args.workers, base_delay=0.05, max_delay=1.0
+    )
+
+    config = {key: value for key, value in vars(args).items()
+              if key not in ('output_dir', 'baseline', 'no_save')}
+    result = {'commit': git_commit(), 'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'),
+              'config': config, 'sizes': {}}
+
+    for width, height in parse_sizes(args.sizes):
+        images = [synthetic_card(width, height, seed=i) for i in range(args.cards)]
+        stages, latencies, errors, wall = run(images, args.transport, args.workers)
+        order = [stage for stage in STAGE_ORDER if stage in stages]
+        order += sorted(stage for stage in stages if stage not in STAGE_ORDER)
+        result['sizes'][f'{width}x{height}'] = {
+            'throughput': len(latencies) / wall,
+            'errors': len(errors),
+            'end_to_end': summarize(latencies) if latencies else None,
+            'stages': {stage: summarize(stages[stage]) for stage in order},
+        }
+
+    previous_path, previous = load_previous(args.output_dir, args.baseline)
+    if previous:
+        print(f"Comparing p95 with {previous_path} (commit {previous.get('commit')})")
+    print(f"transport={args.transport} workers={args.workers} cards/size={args.cards} "
+          f"error_rate={args.error_rate} model_requests={model.calls} s3_calls={s3.calls}\n")
+
+    for size, report in result['sizes'].items():
+        before = (previous or {}).get('sizes', {}).get(size, {})
+        print(f"{size}: {report['throughput']:.2f} cards/s, {report['errors']} failed "
+              f"{change(report['throughput'], before.get('throughput'))}")
+        print(f"  {'stage':<14} {'count':>6} {'p50 (ms)':>9} {'p95 (ms)':>9} {'p99 (ms)':>9} {'p95 vs prev':>12}")
+        rows = list(report['stages'].items())
+        if report['end_to_end']:
+            rows.append(('end_to_end', report['end_to_end']))
+        for stage, summary in rows:
+            old = before.get('end_to_end') if stage == 'end_to_end' else before.get('stages', {}).get(stage)
+            print(f"  {stage:<14} {summary['count']:>6} {summary['p50'] * 1000:>9.1f} "
+                  f"{summary['p95'] * 1000:>9.1f} {summary['p99'] * 1000:>9.1f} "
+                  f"{change(summary['p95'], (old or {}).get('p95')):>12}")
+        print()
+
+    if not args.no_save:
+        os.makedirs(args.output_dir, exist_ok=True)
+        path = os.path.join(args.output_dir, f"stages-{time.strftime('%Y%m%d-%H%M%S')}.json")
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump(result, f, indent=2)
+        print(f"Saved {path}")
+
+
+if __name__ == '__main__':
+    main()
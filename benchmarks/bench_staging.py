@@ -0,0 +1,73 @@
+"""Check content-addressed S3 staging against the local S3 stand-in.
+
+Cards are extracted in parallel over the S3 transport, with every unique
+image repeated --copies times and the fake provider failing --error-rate of
+its calls so requests are retried. The fake provider is wired to the fake S3
+client and rejects any URL whose object is already gone, so a deletion
+racing a reuse shows up as a fetch error. Reports uploads, existence checks,
+presigned URLs and URL cache hits against the number of extractions, and
+checks that nothing is left in the bucket afterwards:
+
+    python -m benchmarks.bench_staging --unique 10 --copies 4 --error-rate 0.1
+"""
+import argparse
+from concurrent.futures import ThreadPoolExecutor
+import time
+
+from benchmarks.fakes import FakeOpenAIClient, FakeS3Client, synthetic_card
+from utils import vision_parser
+from utils.image_prep import prepare_image
+from utils.scheduler import RequestScheduler
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--unique', type=int, default=10, help="Distinct card images")
+    parser.add_argument('--copies', type=int, default=4, help="Times each image is extracted")
+    parser.add_argument('--workers', type=int, default=8)
+    parser.add_argument('--rtt', type=float, default=0.05, help="Network round-trip time in seconds")
+    parser.add_argument('--model-latency', type=float, default=0.3)
+    parser.add_argument('--error-rate', type=float, default=0.1, help="Fraction of fake model calls that fail")
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    s3 = FakeS3Client(rtt=args.rtt)
+    model = FakeOpenAIClient(rtt=args.rtt, model_latency=args.model_latency,
+                             error_rate=args.error_rate, seed=args.seed, s3=s3)
+    vision_parser.s3_client = s3
+    vision_parser.client = model
+    vision_parser.request_scheduler = RequestScheduler(
+        rate=100.0, max_concurrent=args.workers, base_delay=0.05, max_delay=0.5
+    )
+
+    unique = [prepare_image(synthetic_card(1600, 900, seed=i)) for i in range(args.unique)]
+    images = [image for _ in range(args.copies) for image in unique]
+
+    def extract(image):
+        try:
+            vision_parser.extract_card_info(image, transport='s3', use_cache=False)
+            return None
+        except Exception as e:
+            return str(e)
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.workers) as executor:
+        errors = [error for error in executor.map(extract, images) if error]
+    wall = time.perf_counter() - start
+    vision_parser.get_cleanup_queue().flush()
+
+    stager = vision_parser.get_stager().stats()
+    cleanup = vision_parser.get_cleanup_queue().stats()
+    print(f"{len(images)} extractions of {args.unique} images in {wall:.2f}s, "
+          f"{model.calls} model calls, {len(errors)} failed")
+    print(f"  uploads         {s3.calls['upload_fileobj']:>5}  ({s3.uploaded_bytes / 1024:.0f} KiB)")
+    print(f"  head_object     {s3.calls['head_object']:>5}  ({stager['existing']} found existing)")
+    print(f"  presigned URLs  {s3.calls['generate_presigned_url']:>5}  ({stager['url_hits']} served from cache)")
+    print(f"  delete requests {cleanup['deleted']:>5}  ({cleanup['skipped']} skipped as reused, "
+          f"{cleanup['failed']} failed)")
+    print(f"  fetch errors    {model.fetch_errors:>5}  (URLs of deleted objects)")
+    print(f"  left in bucket  {len(s3.objects):>5}")
+
+
+if __name__ == '__main__':
+    main()
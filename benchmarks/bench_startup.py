@@ -0,0 +1,86 @@
+"""Measure cold import time and first render of the Streamlit app.
+
+Each measurement runs in a fresh interpreter so nothing is already cached:
+
+    python -m benchmarks.bench_startup --runs 5
+"""
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+
+
+IMPORT_SNIPPET = """
+import time
+start = time.perf_counter()
+import {module}
+print(time.perf_counter() - start)
+"""
+
+RENDER_SNIPPET = """
+import os, time
+os.environ.setdefault('APP_PASSWORD', 'bench')
+from streamlit.testing.v1 import AppTest
+start = time.perf_counter()
+at = AppTest.from_file('main.py', default_timeout=60)
+at.session_state['password_correct'] = True
+at.run()
+assert not at.exception, at.exception
+print(time.perf_counter() - start)
+"""
+
+
+def time_snippet(snippet, runs):
+    timings = []
+    for _ in range(runs):
+        output = subprocess.run(
+            [sys.executable, '-c', snippet],
+            capture_output=True, text=True, check=True,
+            env={**os.environ, 'PYTHONPATH': os.getcwd()}
+        ).stdout
+        timings.append(float(output.strip().splitlines()[-1]))
+    return timings
+
+
+def slowest_imports(module, count):
+    """Top cumulative entries from python -X importtime"""
+    stderr = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', f'import {module}'],
+        capture_output=True, text=True, check=True,
+        env={**os.environ, 'PYTHONPATH': os.getcwd()}
+    ).stderr
+    rows = []
+    for line in stderr.splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        _, cumulative, name = line[len('import time:'):].split('|')
+        # Nested imports are indented two spaces per level; keep the outer two levels
+        if len(name) - len(name.lstrip()) <= 3:
+            rows.append((int(cumulative), name.strip()))
+    return sorted(rows, reverse=True)[:count]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--runs', type=int, default=5)
+    parser.add_argument('--top', type=int, default=8, help="Slowest top-level imports to list")
+    args = parser.parse_args()
+
+    print(f"{'measurement':<28} {'median (ms)':>12} {'min (ms)':>10}")
+    measurements = {
+        'import utils.vision_parser': IMPORT_SNIPPET.format(module='utils.vision_parser'),
+        'import pandas': IMPORT_SNIPPET.format(module='pandas'),
+        'first render of main.py': RENDER_SNIPPET,
+    }
+    for name, snippet in measurements.items():
+        timings = time_snippet(snippet, args.runs)
+        print(f"{name:<28} {statistics.median(timings) * 1000:>12.0f} {min(timings) * 1000:>10.0f}")
+
+    print("\nSlowest imports pulled in by utils.vision_parser:")
+    for cumulative, name in slowest_imports('utils.vision_parser', args.top):
+        print(f"  {cumulative / 1000:>8.1f} ms  {name}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,59 @@
+"""Compare per-card latency of the inline and S3 image transports.
+
+Runs extract_card_info against the local stand-ins in benchmarks/fakes.py:
+
+    python -m benchmarks.bench_transport --cards 20 --width 1600 --height 900
+"""
+import argparse
+import statistics
+import time
+
+from benchmarks.fakes import FakeOpenAIClient, FakeS3Client, synthetic_card
+from utils import vision_parser
+from utils.image_prep import prepare_image
+
+
+def run_transport(transport, images):
+    """Return per-card latencies (seconds) for one transport"""
+    latencies = []
+    for image in images:
+        start = time.perf_counter()
+        vision_parser.extract_card_info(image, transport=transport, use_cache=False)
+        latencies.append(time.perf_counter() - start)
+    return latencies
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--cards', type=int, default=10)
+    parser.add_argument('--width', type=int, default=1600)
+    parser.add_argument('--height', type=int, default=900)
+    parser.add_argument('--rtt', type=float, default=0.05, help="Network round-trip time in seconds")
+    parser.add_argument('--bandwidth', type=float, default=2_000_000, help="Uplink bandwidth in bytes/s")
+    parser.add_argument('--model-latency', type=float, default=0.8)
+    args = parser.parse_args()
+
+    s3 = FakeS3Client(rtt=args.rtt, bandwidth=args.bandwidth)
+    vision_parser.s3_client = s3
+    vision_parser.client = FakeOpenAIClient(
+        rtt=args.rtt, bandwidth=args.bandwidth, model_latency=args.model_latency
+    )
+
+    images = [synthetic_card(args.width, args.height, seed=i) for i in range(args.cards)]
+    image_bytes = statistics.mean(len(prepare_image(image).data) for image in images)
+    print(f"{args.cards} cards, {args.width}x{args.height}, mean JPEG size {image_bytes / 1024:.0f} KiB")
+    print(f"{'transport':<10} {'mean (s)':>9} {'p50 (s)':>9} {'max (s)':>9}")
+
+    for transport in ('s3', 'inline'):
+        latencies = run_transport(transport, images)
+        print(
+            f"{transport:<10} {statistics.mean(latencies):>9.3f} "
+            f"{statistics.median(latencies):>9.3f} {max(latencies):>9.3f}"
+        )
+    # Staged objects are deleted in the background, wait for them before reporting
+    vision_parser.get_cleanup_queue().flush()
+    print(f"S3 calls: {s3.calls}")
+
+
+if __name__ == '__main__':
+    main()
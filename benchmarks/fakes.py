@@ -0,0 +1,261 @@
+"""Local stand-ins for the OpenRouter (OpenAI-compatible) and S3 clients.
+
+Latency is simulated with time.sleep so the benchmarks measure the shape of
+each transport without network access or credentials. Both clients can add
+random latency jitter and fail a fraction of calls to exercise the retry paths.
+"""
+import json
+import random
+import time
+from types import SimpleNamespace
+
+
+# Canned extraction result returned by the fake model
+SAMPLE_CARD = {
+    "company_name": "Acme Traders Pvt Ltd",
+    "contact_person": [
+        {
+            "name": "Priya Sharma",
+            "position": "Sales Manager",
+            "personal_phone": ["+91 98765 43210"],
+            "personal_email": ["priya@acmetraders.in"]
+        }
+    ],
+    "company_address": [
+        {
+            "remaining": "12 MG Road",
+            "city": "Pune",
+            "state": "Maharashtra",
+            "country": "India",
+            "pincode": "411001"
+        }
+    ],
+    "company_email": ["info@acmetraders.in"],
+    "company_phone": ["+91 20 2612 3456"],
+    "company_fax": None,
+    "company_website": ["www.acmetraders.in"],
+    "company_gstin": ["27AAACA1234A1Z5"],
+    "company_details_if_any": None
+}
+
+
+def transfer_time(num_bytes, rtt, bandwidth):
+    """Seconds needed to send num_bytes over a link with the given RTT and bandwidth (bytes/s)"""
+    return rtt + num_bytes / bandwidth
+
+
+# Tokens billed per attached image by vision detail (a low detail image is a
+# single 512px tile, high detail a card-sized image cut into four tiles)
+IMAGE_TOKENS = {'low': 85, 'high': 765}
+
+
+def count_prompt_tokens(messages, response_format=None):
+    """Rough prompt token count: ~4 characters per token of text and schema, IMAGE_TOKENS per image"""
+    text = image_tokens = 0
+    for message in messages:
+        for part in message['content']:
+            if part.get('type') == 'image_url':
+                image_tokens += IMAGE_TOKENS[part['image_url'].get('detail', 'high')]
+            else:
+                text += len(part.get('text', ''))
+    if response_format and response_format.get('type') == 'json_schema':
+        # Structured output schemas are injected into the prompt by the provider
+        text += len(json.dumps(response_format['json_schema']['schema'], separators=(',', ':')))
+    return text // 4 + image_tokens
+
+
+class FakeAPIError(Exception):
+    """Server-side failure shaped like openai.APIStatusError, so the scheduler retries it"""
+
+    def __init__(self, status_code=500, message="Simulated provider error"):
+        super().__init__(message)
+        self.status_code = status_code
+        self.response = None
+
+
+class FaultInjector:
+    """Shared latency jitter and random failures for the fake clients"""
+
+    def __init__(self, error_rate=0.0, jitter=0.0, seed=None):
+        self.error_rate = error_rate
+        self.jitter = jitter
+        self.errors = 0
+        self._rng = random.Random(seed)
+
+    def sleep(self, seconds):
+        """Sleep for seconds, stretched or shrunk by up to +/- jitter (a fraction)"""
+        if self.jitter:
+            seconds *= self._rng.uniform(1 - self.jitter, 1 + self.jitter)
+        time.sleep(max(0.0, seconds))
+
+    def should_fail(self):
+        if self.error_rate and self._rng.random() < self.error_rate:
+            self.errors += 1
+            return True
+        return False
+
+
+class FakeS3Client:
+    """Minimal S3 client stand-in supporting the calls made by vision_parser"""
+
+    def __init__(self, rtt=0.05, bandwidth=2_000_000, error_rate=0.0, jitter=0.0, seed=None):
+        self.rtt = rtt
+        self.bandwidth = bandwidth
+        self.faults = FaultInjector(error_rate, jitter, seed)
+        self.objects = {}
+        self.calls = {'head_object': 0, 'upload_fileobj': 0, 'generate_presigned_url': 0,
+                      'delete_object': 0, 'delete_objects': 0}
+        self.uploaded_bytes = 0
+
+    def head_object(self, Bucket, Key):
+        self.calls['head_object'] += 1
+        self.faults.sleep(self.rtt)
+        if (Bucket, Key) not in self.objects:
+            from botocore.exceptions import ClientError
+            raise ClientError({'Error': {'Code': '404', 'Message': 'Not Found'}}, 'HeadObject')
+        return {'ContentLength': len(self.objects[(Bucket, Key)])}
+
+    def upload_fileobj(self, fileobj, bucket, key):
+        data = fileobj.read()
+        self.calls['upload_fileobj'] += 1
+        self.faults.sleep(transfer_time(len(data), self.rtt, self.bandwidth))
+        if self.faults.should_fail():
+            from botocore.exceptions import ClientError
+            raise ClientError(
+                {'Error': {'Code': 'InternalError', 'Message': 'Simulated S3 error'}}, 'PutObject'
+            )
+        self.objects[(bucket, key)] = data
+        self.uploaded_bytes += len(data)
+
+    def generate_presigned_url(self, method, Params, ExpiresIn):
+        # Presigning is a local signature computation in boto3
+        self.calls['generate_presigned_url'] += 1
+        return f"https://{Params['Bucket']}.s3.local/{Params['Key']}?expires={ExpiresIn}"
+
+    def has_url(self, url):
+        """Whether a presigned URL from this client still points at an object"""
+        host, _, path = url.split('://', 1)[1].partition('/')
+        return (host.split('.s3.local')[0], path.split('?')[0]) in self.objects
+
+    def delete_object(self, Bucket, Key):
+        self.calls['delete_object'] += 1
+        self.faults.sleep(self.rtt)
+        self.objects.pop((Bucket, Key), None)
+
+    def delete_objects(self, Bucket, Delete):
+        self.calls['delete_objects'] += 1
+        self.faults.sleep(self.rtt)
+        for obj in Delete['Objects']:
+            self.objects.pop((Bucket, obj['Key']), None)
+        return {'Errors': []}
+
+
+class FakeOpenAIClient:
+    """OpenAI-compatible client stand-in exposing chat.completions.create"""
+
+    def __init__(self, rtt=0.05, bandwidth=2_000_000, model_latency=0.8,
+                 url_fetch_latency=0.15, result=None, error_rate=0.0, jitter=0.0, seed=None,
+                 output_token_latency=0.0, low_detail_results=(), results_by_model=None, s3=None):
+        self.rtt = rtt
+        self.bandwidth = bandwidth
+        self.model_latency = model_latency
+        self.output_token_latency = output_token_latency   # Extra seconds per completion token
+        self.url_fetch_latency = url_fetch_latency
+        self.result = result or SAMPLE_CARD
+        # Replies to low detail images cycle through these, if given (e.g. cards with a misread field)
+        self.low_detail_results = list(low_detail_results)
+        self._low_detail_calls = 0
+        # Per-model replies; a string is sent back verbatim (e.g. to simulate malformed JSON)
+        self.results_by_model = results_by_model or {}
+        # With a FakeS3Client, URLs of objects that no longer exist fail like a provider fetch error
+        self.s3 = s3
+        self.fetch_errors = 0
+        self.faults = FaultInjector(error_rate, jitter, seed)
+        self.calls = 0
+        self.chat = SimpleNamespace(completions=SimpleNamespace(create=self.create))
+
+    def create(self, model, messages, stream=False, response_format=None, **kwargs):
+        self.calls += 1
+        payload = json.dumps(messages)
+        prompt_tokens = count_prompt_tokens(messages, response_format)
+        delay = transfer_time(len(payload), self.rtt, self.bandwidth) + self.model_latency
+
+        # Remote image URLs have to be fetched by the provider before inference
+        images = [
+            part for message in messages for part in message['content']
+            if part.get('type') == 'image_url'
+        ]
+        for part in images:
+            url = part['image_url']['url']
+            if not url.startswith('data:'):
+                delay += self.url_fetch_latency
+                if self.s3 is not None and not self.s3.has_url(url):
+                    self.fetch_errors += 1
+                    raise FakeAPIError(400, f"Failed to fetch image: {url}")
+        if self.faults.should_fail():
+            # Failures come back after the request is sent but before inference finishes
+            self.faults.sleep(transfer_time(len(payload), self.rtt, self.bandwidth))
+            raise FakeAPIError()
+        if stream:
+            # Half the model latency before the first token, the rest spread over the chunks
+            self.faults.sleep(delay - self.model_latency / 2)
+            usage = (kwargs.get('stream_options') or {}).get('include_usage')
+            detail = images[0]['image_url'].get('detail', 'high') if images else 'high'
+            return self._stream(model, self._content(self._result_for(detail, model)), prompt_tokens if usage else None)
+
+        # Several images in one request are answered as {"cards": [...]}
+        cards = [self._result_for(part['image_url'].get('detail', 'high'), model) for part in images]
+        result = {'cards': cards} if len(cards) > 1 else (cards or [self.result])[0]
+        content = self._content(result)
+        completion_tokens = len(content) // 4
+        self.faults.sleep(delay + completion_tokens * self.output_token_latency)
+        return SimpleNamespace(
+            model=model,
+            choices=[SimpleNamespace(message=SimpleNamespace(content=content))],
+            usage=SimpleNamespace(
+                prompt_tokens=prompt_tokens,
+                completion_tokens=completion_tokens,
+                total_tokens=prompt_tokens + completion_tokens
+            )
+        )
+
+    def _result_for(self, detail, model):
+        if model in self.results_by_model:
+            return self.results_by_model[model]
+        if detail != 'low' or not self.low_detail_results:
+            return self.result
+        self._low_detail_calls += 1
+        return self.low_detail_results[(self._low_detail_calls - 1) % len(self.low_detail_results)]
+
+    @staticmethod
+    def _content(result):
+        return result if isinstance(result, str) else json.dumps(result)
+
+    def _stream(self, model, content, prompt_tokens=None, chunk_size=16):
+        chunks = [content[i:i + chunk_size] for i in range(0, len(content), chunk_size)]
+        for chunk in chunks:
+            time.sleep(self.model_latency / 2 / len(chunks))
+            yield SimpleNamespace(model=model, usage=None,
+                                  choices=[SimpleNamespace(delta=SimpleNamespace(content=chunk))])
+        if prompt_tokens is not None:
+            # Usage arrives in a final chunk without choices, as with stream_options.include_usage
+            completion_tokens = len(content) // 4
+            yield SimpleNamespace(model=model, choices=[], usage=SimpleNamespace(
+                prompt_tokens=prompt_tokens,
+                completion_tokens=completion_tokens,
+                total_tokens=prompt_tokens + completion_tokens
+            ))
+
+
+def synthetic_card(width=1600, height=900, seed=0):
+    """Generate a noisy card-like PIL image so JPEG sizes resemble real photos"""
+    import random
+    from PIL import Image, ImageDraw
+
+    rng = random.Random(seed)
+    image = Image.effect_noise((width, height), 40).convert('RGB')
+    draw = ImageDraw.Draw(image)
+    for line in range(8):
+        y = height // 10 * (line + 1)
+        draw.text((width // 12, y), f"Line {line} {rng.randint(0, 10 ** 8)}", fill=(0, 0, 0))
+    return image
@@ -1,12 +1,20 @@
 import streamlit as st
-from PIL import Image
-import pandas as pd
-from utils.vision_parser import extract_card_info
-from streamlit_cropper import st_cropper
+from utils.vision_parser import (
+    CARD_BATCH_SIZE, DETAIL_MODES, MODEL_CASCADE, OUTPUT_MODE, VISION_DETAIL, adaptive_savings, extract_cards_info,
+    get_cleanup_queue, get_result_cache, request_scheduler, stream_card_info
+)
+from utils.image_prep import apply_edit, make_preview, make_thumbnail, normalize_orientation, prepare_image, scale_box
+from utils.card_export import EXPORT_FORMATS, ExportCache, available_formats, item_value
+from utils.card_store import get_card_store
+from utils.job_queue import JOB_WORKERS, JobQueue
+from utils.metrics import ExtractionMetrics, collect, registry, serve
 import io
 import json
+import hashlib
 import hmac
+import math
 import os
+import time
 
 # Page configuration
 st.set_page_config(
@@ -48,30 +56,140 @@ Upload one or multiple business card images to extract contact information autom
 Supported formats: PNG, JPG, JPEG
 """)
 
+# Number of cards extracted in parallel (overridable from the sidebar)
+DEFAULT_WORKERS = int(os.environ.get('CARD_WORKERS', 4))
+
+# Card list pagination
+PAGE_SIZES = [10, 25, 50, 100]
+
+# Serve Prometheus metrics on this port when set (e.g. METRICS_PORT=9100)
+METRICS_PORT = int(os.environ.get('METRICS_PORT', 0))
+
+@st.cache_resource
+def start_metrics_server(port):
+    """One /metrics endpoint per server process"""
+    return serve(port)
+
+# Seconds between progress checks of a running extraction job
+JOB_POLL_SECONDS = float(os.environ.get('JOB_POLL_SECONDS', 1.0))
+
+@st.cache_resource
+def get_job_queue():
+    """Extraction jobs and their worker pool, shared by every session of this server process"""
+    job_queue = JobQueue(JOB_WORKERS)
+    registry.gauge('job_queue_depth', "Job tasks waiting for a worker", lambda: job_queue.stats()['queued_tasks'])
+    registry.gauge('job_workers_busy', "Job queue workers running a task", lambda: job_queue.stats()['busy'])
+    return job_queue
+
+job_queue = get_job_queue()
+
+# Process-wide stage histograms and token counters
+registry.install()
+if METRICS_PORT:
+    start_metrics_server(METRICS_PORT)
+
 # Initialize session state
 if 'processed_cards' not in st.session_state:
     st.session_state.processed_cards = []
-if 'editing_image' not in st.session_state:
-    st.session_state.editing_image = None
-
-def safe_get_value(item):
-    """Safely extract value from either a string or a dictionary"""
-    if isinstance(item, dict):
-        return next(iter(item.values()), "Not found")
-    return item if item else "Not found"
-
-def toggle_edit_mode(idx):
+if 'cards_by_key' not in st.session_state:
+    st.session_state.cards_by_key = {}
+if 'upload_hashes' not in st.session_state:
+    st.session_state.upload_hashes = {}
+if 'export_cache' not in st.session_state:
+    st.session_state.export_cache = ExportCache()
+if 'editing_images' not in st.session_state:
+    st.session_state.editing_images = set()
+if 'editor_previews' not in st.session_state:
+    st.session_state.editor_previews = {}
+if 'batch_metrics' not in st.session_state:
+    st.session_state.batch_metrics = None
+
+# Cards saved across sessions (None when CARD_STORE_PATH is empty)
+card_store = get_card_store()
+
+# Extraction runs on the job queue; the session only remembers its job ID
+if 'job_id' not in st.session_state:
+    st.session_state.job_id = st.query_params.get('job')
+if 'had_uploads' not in st.session_state:
+    st.session_state.had_uploads = False
+if 'job_run' not in st.session_state:
+    st.session_state.job_run = None
+
+def format_bytes(num_bytes):
+    """Human readable byte count"""
+    if num_bytes is None:
+        return "unknown"
+    for unit in ('B', 'KB', 'MB'):
+        if num_bytes < 1024 or unit == 'MB':
+            return f"{num_bytes:.0f} {unit}" if unit == 'B' else f"{num_bytes:.1f} {unit}"
+        num_bytes /= 1024
+
+def toggle_edit_mode(card_key):
     """Toggle edit mode for an image"""
-    if st.session_state.editing_image == idx:
-        st.session_state.editing_image = None
-    else:
-        st.session_state.editing_image = idx
+    st.session_state.editing_images ^= {card_key}
+    st.session_state.editor_previews.pop(card_key, None)
+
+def editor_preview(card):
+    """The card's bounded editing preview and scale, decoded once per editing session (not on every drag)"""
+    previews = st.session_state.editor_previews
+    if card['card_key'] not in previews:
+        previews[card['card_key']] = make_preview(card['image_bytes'])
+    return previews[card['card_key']]
+
+def save_edited_image(card_key, box, rotation):
+    """Apply the crop box (full resolution coordinates) and rotation, keep a compressed preview and clear edit mode"""
+    card = st.session_state.cards_by_key[card_key]
+    card['display_image'] = make_thumbnail(apply_edit(card['image_bytes'], box, rotation))
+    card['edit'] = {'box': box, 'rotation': rotation}
+    st.session_state.editing_images.discard(card_key)
+    st.session_state.editor_previews.pop(card_key, None)
+
+def save_to_store(cards):
+    """Write the successfully extracted cards to the persistent store"""
+    cards = [card for card in cards if card.get('processing_status') == 'success']
+    if card_store is None or not cards:
+        return
+    try:
+        card_store.put_many(cards)
+    except Exception as e:
+        st.warning(f"Could not save {len(cards)} cards to the card store: {str(e)}")
 
-def save_edited_image(idx, img):
-    """Save edited image and clear edit mode"""
-    st.session_state.processed_cards[idx]['display_image'] = img
-    st.session_state.editing_image = None
-    st.rerun()
+def reextract_card(card_key, box, rotation, output_mode, detail):
+    """Save the edit, then extract the edited card again in place of the original result"""
+    save_edited_image(card_key, box, rotation)
+    card = st.session_state.cards_by_key[card_key]
+    try:
+        prepared = prepare_image(apply_edit(card['image_bytes'], box, rotation))
+        result = extract_cards_info([prepared], output_mode=output_mode, detail=detail)[0]
+    except Exception as e:
+        result, prepared = e, None
+    if isinstance(result, Exception):
+        info = {'processing_status': 'failed', 'error_message': str(result),
+                'company_name': f"Error processing image: {card['filename']}"}
+    else:
+        info = result
+        info['processing_status'] = 'success'
+
+    # Keep the card's identity and stored images, replace the extracted fields
+    for key in ('card_key', 'filename', 'image_bytes', 'thumbnail', 'display_image', 'edit'):
+        info[key] = card.get(key)
+    # The upload is still the original, only the image sent to the model changed
+    info['image_stats'] = dict(card.get('image_stats') or {})
+    if prepared:
+        info['image_stats'].update(
+            {key: prepared.stats[key] for key in ('prepared_bytes', 'prepared_size')}
+        )
+    # A new dict (rather than an update in place) so cached export rows are rebuilt
+    cards = st.session_state.processed_cards
+    cards[next(n for n, other in enumerate(cards) if other is card)] = info
+    st.session_state.cards_by_key[card_key] = info
+    save_to_store([info])
+    # Keep the job in step so a refresh shows the new result
+    job = job_queue.get(st.session_state.job_id) if st.session_state.job_id else None
+    if job:
+        job_queue.record(job, card_key, info)
+    # Exports, filters and counts outside this card's fragment need the new result too
+    st.session_state.rerun_app = True
 
 def display_card_info(info, idx):
     """Display extracted information for a single card"""
@@ -82,115 +200,422 @@ def display_card_info(info, idx):
 
     with img_col:
         # Display image with edit button
-        st.image(
-            info.get('display_image', info['original_image']), 
-            caption=f"Business Card {idx + 1}",
-            use_container_width=True
-        )
-        st.button(
-            f"✏️ Edit Image Display #{idx + 1}", 
-            key=f"edit_btn_{idx}",
-            on_click=toggle_edit_mode,
-            args=(idx,)
-        )
+        preview = info.get('display_image') or info.get('thumbnail')
+        if preview:
+            st.image(
+                preview,
+                caption=f"Business Card {idx + 1}",
+                use_container_width=True
+            )
+        else:
+            st.caption("No preview available")
+        stats = info.get('image_stats')
+        if stats:
+            st.caption(
+                f"Sent {format_bytes(stats['prepared_bytes'])} ({stats['prepared_size']}), "
+                f"uploaded {format_bytes(stats['original_bytes'])} ({stats['original_size']})"
+            )
+        routing = info.get('routing')
+        if routing and len(routing) > 1:
+            # Only shown when the card needed more than the first model
+            st.caption("Model cascade: " + " → ".join(
+                f"{step['model']} ({step['outcome'].replace('_', ' ')})" for step in routing
+            ))
+        # Cards without a readable upload (e.g. a job task that crashed) cannot be edited
+        if preview and info.get('image_bytes'):
+            st.button(
+                f"✏️ Edit Image Display #{idx + 1}", 
+                key=f"edit_btn_{info['card_key']}",
+                on_click=toggle_edit_mode,
+                args=(info['card_key'],)
+            )
 
     with data_col:
-        # Company Information
-        st.markdown("#### 🏢 Company Information")
-        cols = st.columns(3)
-
+        display_card_fields(info)
+
+def display_card_fields(info):
+    """Display the extracted fields of a card (also used for partially streamed cards)"""
+    # Company Information
+    st.markdown("#### 🏢 Company Information")
+    cols = st.columns(3)
+
+    with cols[0]:
+        st.markdown("**Company Name**")
+        st.write(info.get('company_name') or "Not found")
+
+        st.markdown("**Company Phone**")
+        phones = info.get('company_phone') or []
+        for phone in phones:
+            st.write(phone)
+
+    with cols[1]:
+        st.markdown("**Company Email**")
+        emails = info.get('company_email') or []
+        for email in emails:
+            st.write(email)
+
+        st.markdown("**Company Website**")
+        websites = info.get('company_website') or []
+        for website in websites:
+            st.write(website)
+
+    with cols[2]:
+        st.markdown("**Additional Details**")
+        details = info.get('company_details_if_any') or []
+        for detail in details:
+            st.write(detail)
+
+    # Contact Person Information
+    st.markdown("#### 👤 Contact Person(s)")
+    contact_persons = info.get('contact_person') or []
+    for i, person in enumerate(contact_persons):
+        cols = st.columns(2)
         with cols[0]:
-            st.markdown("**Company Name**")
-            st.write(info.get('company_name') or "Not found")
+            st.write(f"**Name:** {person.get('name') or 'Not found'}")
+            st.write(f"**Position:** {person.get('position') or 'Not found'}")
+        with cols[1]:
+            phones = person.get('personal_phone') or []
+            emails = person.get('personal_email') or []
+            if phones:
+                st.write("**Phone(s):** " + ", ".join(phones))
+            if emails:
+                st.write("**Email(s):** " + ", ".join(emails))
+
+    # Address Information
+    st.markdown("#### 📍 Address")
+    addresses = info.get('company_address') or []
+    for addr in addresses:
+        cols = st.columns(5)
+        cols[0].write(f"**Street:** {addr.get('remaining') or 'Not found'}")
+        cols[1].write(f"**City:** {addr.get('city') or 'Not found'}")
+        cols[2].write(f"**State:** {addr.get('state') or 'Not found'}")
+        cols[3].write(f"**Country:** {addr.get('country') or 'Not found'}")
+        cols[4].write(f"**Pincode:** {addr.get('pincode') or 'Not found'}")
+
+def display_image_editor(card):
+    """Crop/rotate editor for one card's display image"""
+    st.markdown("### 🖼️ Edit Image Display")
+    card_key = card['card_key']
+    # Interaction happens on a bounded preview; full resolution is only decoded on save
+    preview, scale = editor_preview(card)
+
+    # Only needed while editing, keep it off the cold start path
+    from streamlit_cropper import st_cropper
+
+    # Create columns for edit controls
+    edit_cols = st.columns([3, 1])
+
+    # Image cropping (box in preview coordinates)
+    with edit_cols[0]:
+        box = st_cropper(
+            preview,
+            realtime_update=True,
+            box_color='#2196F3',
+            aspect_ratio=None,
+            return_type='box',
+            key=f"cropper_{card_key}"
+        )
 
-            st.markdown("**Company Phone**")
-            phones = info.get('company_phone', [])
-            for phone in phones:
-                st.write(safe_get_value(phone))
+    # Controls
+    with edit_cols[1]:
+        # Rotation control
+        rotation = st.selectbox(
+            "Rotate",
+            [0, 90, 180, 270],
+            key=f"rotate_{card_key}"
+        )
+        result = preview.crop((box['left'], box['top'], box['left'] + box['width'], box['top'] + box['height']))
+        if rotation:
+            result = result.rotate(rotation, expand=True)
+        st.image(result, caption="Preview", use_container_width=True)
+
+        # Save/Cancel buttons (callbacks run before this card's fragment reruns)
+        full_box = scale_box(box, scale)
+        st.button("✅ Save Changes", key=f"save_edit_{card_key}", on_click=save_edited_image,
+                  args=(card_key, full_box, rotation))
+        st.button("🔄 Save and Re-extract", key=f"reextract_{card_key}", on_click=reextract_card,
+                  args=(card_key, full_box, rotation, output_mode, vision_detail))
+        st.button("❌ Cancel", key=f"cancel_edit_{card_key}", on_click=toggle_edit_mode, args=(card_key,))
+
+@st.fragment
+def card_fragment(idx):
+    """Render one card in its own fragment so its buttons only rerun this card"""
+    if st.session_state.pop('rerun_app', False):
+        st.rerun(scope="app")
+    card = st.session_state.processed_cards[idx]
+    display_card_info(card, idx)
+    if card['card_key'] in st.session_state.editing_images:
+        display_image_editor(card)
+
+def failed_card_info(uploaded_file, error):
+    """Minimal info dict with error details for a card that could not be processed"""
+    return {
+        'processing_status': 'failed',
+        'error_message': str(error),
+        'company_name': f'Error processing image: {uploaded_file.name}'
+    }
+
+def finish_card_info(info, uploaded_file, image_bytes, prepared):
+    """Attach filename, preprocessing stats, the compressed upload and a thumbnail to info"""
+    info['filename'] = uploaded_file.name
+    info['image_stats'] = prepared.stats if prepared else None
+    # Keep encoded bytes rather than decoded images in the session
+    info['image_bytes'] = image_bytes
+    info['thumbnail'] = make_thumbnail(prepared.data) if prepared else None
+    return info
+
+def process_uploaded_files(files, output_mode, detail):
+    """
+    Extract information from a group of uploaded files (safe to run in a worker thread)
+
+    Never raises: cards that fail come back as failed infos with their upload attached.
+    """
+    # EXIF orientation is applied once here, everything downstream sees upright images
+    uploads = [normalize_orientation(uploaded_file.getvalue()) for uploaded_file in files]
+    infos = [None] * len(files)
+
+    # Downscale/recompress before extraction
+    prepared = {}
+    for n, uploaded_file in enumerate(files):
+        try:
+            prepared[n] = prepare_image(uploads[n])
+        except Exception as e:
+            infos[n] = failed_card_info(uploaded_file, e)
+
+    # Extract information, packing the whole group into as few requests as possible
+    try:
+        results = extract_cards_info(
+            list(prepared.values()), batch_size=len(files), output_mode=output_mode, detail=detail
+        )
+    except Exception as e:
+        # Every card still comes back with its upload, so it can be edited and re-extracted
+        results = [e] * len(prepared)
+    for n, result in zip(prepared, results):
+        if isinstance(result, Exception):
+            # If extraction fails, create a minimal info dict with error details
+            infos[n] = failed_card_info(files[n], result)
+        else:
+            infos[n] = result
+            infos[n]['processing_status'] = 'success'
 
-        with cols[1]:
-            st.markdown("**Company Email**")
-            emails = info.get('company_email', [])
-            for email in emails:
-                st.write(safe_get_value(email))
-
-            st.markdown("**Company Website**")
-            websites = info.get('company_website', [])
-            for website in websites:
-                st.write(safe_get_value(website))
-
-        with cols[2]:
-            st.markdown("**Additional Details**")
-            details = info.get('company_details_if_any', [])
-            for detail in details:
-                st.write(safe_get_value(detail))
-
-        # Contact Person Information
-        st.markdown("#### 👤 Contact Person(s)")
-        contact_persons = info.get('contact_person', [])
-        for i, person in enumerate(contact_persons):
-            cols = st.columns(2)
-            with cols[0]:
-                st.write(f"**Name:** {person.get('name') or 'Not found'}")
-                st.write(f"**Position:** {person.get('position') or 'Not found'}")
-            with cols[1]:
-                phones = person.get('personal_phone', [])
-                emails = person.get('personal_email', [])
-                if phones:
-                    st.write("**Phone(s):** " + ", ".join([safe_get_value(p) for p in phones]))
-                if emails:
-                    st.write("**Email(s):** " + ", ".join([safe_get_value(e) for e in emails]))
-
-        # Address Information
-        st.markdown("#### 📍 Address")
-        addresses = info.get('company_address', [])
-        for addr in addresses:
-            cols = st.columns(5)
-            cols[0].write(f"**Street:** {addr.get('remaining') or 'Not found'}")
-            cols[1].write(f"**City:** {addr.get('city') or 'Not found'}")
-            cols[2].write(f"**State:** {addr.get('state') or 'Not found'}")
-            cols[3].write(f"**Country:** {addr.get('country') or 'Not found'}")
-            cols[4].write(f"**Pincode:** {addr.get('pincode') or 'Not found'}")
-
-# Handle image editing if active
-if st.session_state.editing_image is not None:
-    idx = st.session_state.editing_image
-    if idx < len(st.session_state.processed_cards):
-        st.markdown("### 🖼️ Edit Image Display")
-        card = st.session_state.processed_cards[idx]
-        img = card['original_image']
-
-        # Create columns for edit controls
-        edit_cols = st.columns([3, 1])
-
-        # Image cropping
-        with edit_cols[0]:
-            cropped_img = st_cropper(
-                img,
-                realtime_update=True,
-                box_color='#2196F3',
-                aspect_ratio=None,
-                return_type='image'
-            )
+    return [
+        finish_card_info(infos[n], uploaded_file, uploads[n], prepared.get(n))
+        for n, uploaded_file in enumerate(files)
+    ]
 
-        # Controls
-        with edit_cols[1]:
-            # Rotation control
-            rotation = st.selectbox(
-                "Rotate",
-                [0, 90, 180, 270],
-                key=f"rotate_{idx}"
-            )
-            if rotation:
-                cropped_img = cropped_img.rotate(rotation, expand=True)
+def stream_uploaded_file(uploaded_file, idx):
+    """Extract a single uploaded file, rendering each field as soon as it streams in"""
+    image_bytes = normalize_orientation(uploaded_file.getvalue())
+    prepared = None
+    placeholder = st.empty()
+
+    try:
+        prepared = prepare_image(image_bytes)
+        info = {}
+        for field, value in stream_card_info(prepared, output_mode=output_mode, detail=vision_detail):
+            info[field] = value
+            with placeholder.container():
+                st.markdown(f"---\n### Business Card {idx + 1} (extracting...)")
+                display_card_fields(info)
+        info['processing_status'] = 'success'
+    except Exception as e:
+        info = failed_card_info(uploaded_file, e)
+    placeholder.empty()
+
+    return finish_card_info(info, uploaded_file, image_bytes, prepared)
+
+def assign_upload_keys(files):
+    """Stable identity for each upload: file name plus content hash
+
+    Hashes are memoized per upload so unchanged files are not re-hashed on
+    every rerun. Repeated identical uploads get distinct keys.
+    """
+    hashes = st.session_state.upload_hashes
+    current_ids = set()
+    keys = []
+    for uploaded_file in files:
+        file_id = getattr(uploaded_file, 'file_id', None) or id(uploaded_file)
+        current_ids.add(file_id)
+        if file_id not in hashes:
+            hashes[file_id] = hashlib.sha256(uploaded_file.getvalue()).hexdigest()[:16]
+        key = f"{uploaded_file.name}:{hashes[file_id]}"
+        suffix = 2
+        while key in keys:
+            key = f"{uploaded_file.name}:{hashes[file_id]}#{suffix}"
+            suffix += 1
+        keys.append(key)
+
+    # Forget uploads that are gone
+    for file_id in set(hashes) - current_ids:
+        del hashes[file_id]
+    return keys
+
+def attach_job_results(job, keys):
+    """Move the job's finished results for keys into the session, saving new cards to the store"""
+    cards_by_key = st.session_state.cards_by_key
+    attached = []
+    for key in keys:
+        if key in cards_by_key or key not in job.results:
+            continue
+        info = job.results[key]
+        if isinstance(info, Exception):
+            info = {
+                'processing_status': 'failed',
+                'error_message': str(info),
+                'company_name': f"Error processing image: {key.rsplit(':', 1)[0]}",
+                'filename': key.rsplit(':', 1)[0],
+            }
+            job_queue.record(job, key, info)
+        info['card_key'] = key
+        cards_by_key[key] = info
+        attached.append(info)
+        if info['processing_status'] == 'failed':
+            st.warning(f"Skipping {info['filename']} due to processing error: {info['error_message']}")
+    save_to_store(attached)
+
+@st.fragment(run_every=JOB_POLL_SECONDS)
+def job_progress(job_id, attached):
+    """Poll a running job; rerun the whole app once it has cards the session does not show yet"""
+    job = job_queue.get(job_id)
+    if job is None:
+        st.rerun()
+    done, total = job.progress()
+    stats = job_queue.stats()
+    st.progress(
+        done / total if total else 0.0,
+        text=f"Processed {done} of {total} cards... "
+             f"({job.running} requests running, {job.queued} waiting; {stats['queued_tasks']} queued on this server)"
+    )
+    if done > attached or not job.active:
+        st.rerun()
+
+def display_batch_metrics(batch):
+    """Where the time and tokens of the last processing run went"""
+    metrics = batch['metrics']
+    with st.expander(f"⏱️ Last run: {batch['cards']} cards in {batch['seconds']:.1f}s"):
+        values = metrics['values']
+        st.caption(
+            f"{values.get('model_calls', 0):.0f} model requests, {values.get('model_retries', 0):.0f} retries, "
+            f"{format_bytes(values.get('image_bytes', 0))} of images sent, "
+            f"{values.get('prompt_tokens', 0):.0f} prompt + {values.get('completion_tokens', 0):.0f} "
+            f"completion tokens ({', '.join(metrics['models']) or 'no model reply'})"
+        )
+        if values.get('low_pass_cards'):
+            escalated = values.get('detail_escalations', 0)
+            reviewed = escalated + values.get('low_detail_accepted', 0)
+            summary = f"Adaptive detail: {escalated:.0f} of {reviewed:.0f} cards escalated to high detail"
+            savings = adaptive_savings(values)
+            if savings:
+                # Negative savings mean the escalations cost more than they saved
+                tokens, seconds = savings['tokens'], savings['seconds']
+                summary += (
+                    f"; {'saved' if tokens >= 0 else 'spent an extra'} ~{abs(tokens):.0f} tokens and "
+                    f"{'saved' if seconds >= 0 else 'spent an extra'} ~{abs(seconds):.1f}s of model time "
+                    f"compared with high detail for every card"
+                )
+            st.caption(summary)
+
+        # Cards read by each model of the cascade, by outcome
+        routes, seconds = {}, {}
+        for name, labels, value in metrics['labeled']:
+            if name == 'cascade_routes':
+                routes.setdefault(labels['model'], {})[labels['outcome']] = value
+            elif name == 'cascade_seconds':
+                seconds[labels['model']] = value
+        if len(MODEL_CASCADE) > 1 and routes:
+            parts = []
+            for model in MODEL_CASCADE:
+                if model in routes:
+                    outcomes = routes[model]
+                    cards = sum(outcomes.values())
+                    detail = ", ".join(f"{count:.0f} {outcome.replace('_', ' ')}" for outcome, count in outcomes.items())
+                    timing = f", avg {seconds[model] / cards:.1f}s" if model in seconds else ""
+                    parts.append(f"{model} read {cards:.0f} cards ({detail}{timing})")
+            st.caption("Model cascade: " + "; ".join(parts))
+        # Stage times are summed over parallel workers, so they can exceed the wall time
+        st.table([
+            {
+                'stage': stage,
+                'calls': metrics['counts'][stage],
+                'total (s)': round(seconds, 2),
+                'mean (ms)': round(seconds / metrics['counts'][stage] * 1000, 1),
+            }
+            for stage, seconds in metrics['stages'].items()
+        ])
+
+# Processing settings
+max_workers = st.sidebar.number_input(
+    "Parallel extractions",
+    min_value=1,
+    max_value=16,
+    value=min(max(DEFAULT_WORKERS, 1), 16),
+    help="Model requests of this session's job running at the same time "
+         f"(the server runs at most {JOB_WORKERS} for all sessions)"
+)
+batch_size = st.sidebar.number_input(
+    "Cards per request",
+    min_value=1,
+    max_value=10,
+    value=min(max(CARD_BATCH_SIZE, 1), 10),
+    help="Business cards packed into one model request (1 sends each card separately)"
+)
+stream_results = st.sidebar.checkbox(
+    "Stream results",
+    value=False,
+    help="Show each card's fields as they arrive (processes cards one at a time)"
+)
+strict_schema = st.sidebar.checkbox(
+    "Strict schema output",
+    value=OUTPUT_MODE == 'json_schema',
+    help="Constrain replies to the card JSON schema and send a much shorter prompt"
+)
+output_mode = 'json_schema' if strict_schema else 'json_object'
+vision_detail = st.sidebar.selectbox(
+    "Vision detail",
+    DETAIL_MODES,
+    index=DETAIL_MODES.index(VISION_DETAIL),
+    help="Adaptive reads each card at low detail first and only re-reads it at high detail "
+         "when the name, email, phone numbers or GSTIN look wrong"
+)
 
-            # Save/Cancel buttons
-            if st.button("✅ Save Changes", key=f"save_edit_{idx}"):
-                save_edited_image(idx, cropped_img)
+def stored_card_row(card):
+    """One line of the saved card search results"""
+    people = card.get('contact_person') or []
+    emails = list(card.get('company_email') or [])
+    phones = list(card.get('company_phone') or [])
+    for person in people:
+        emails += person.get('personal_email') or []
+        phones += person.get('personal_phone') or []
+    return {
+        'Company': card.get('company_name'),
+        'People': ', '.join(person['name'] for person in people if person.get('name')),
+        'Email': ', '.join(str(item_value(email)) for email in emails),
+        'Phone': ', '.join(str(item_value(phone)) for phone in phones),
+        'File': card.get('filename'),
+        'Saved': time.strftime('%Y-%m-%d %H:%M', time.localtime(card['stored_at'])),
+    }
+
+def display_store_search(store):
+    """Search the cards saved by every session"""
+    with st.expander(f"🔎 Search saved cards ({store.count()})"):
+        query = st.text_input(
+            "Search",
+            key="store_query",
+            placeholder="Company, person, email, phone or any word on the card",
+            help="An email address or phone number is looked up exactly; other words match the start of words on the card"
+        )
+        started = time.perf_counter()
+        results = store.search(query)
+        elapsed = (time.perf_counter() - started) * 1000
+        st.caption(
+            f"{len(results)} matching cards in {elapsed:.1f} ms" if query.strip()
+            else f"{len(results)} most recently saved cards"
+        )
+        if results:
+            st.dataframe([stored_card_row(card) for card in results], use_container_width=True, hide_index=True)
 
-            if st.button("❌ Cancel", key=f"cancel_edit_{idx}"):
-                st.session_state.editing_image = None
-                st.rerun()
+if card_store:
+    display_store_search(card_store)
 
 # File uploader
 uploaded_files = st.file_uploader(
@@ -200,111 +625,135 @@ uploaded_files = st.file_uploader(
     help="Upload one or more business card images"
 )
 
+# A job from the URL (?job=...) survives a browser refresh: until new files
+# are uploaded its cards are shown again. Removing every file lets go of it.
+job = job_queue.get(st.session_state.job_id) if st.session_state.job_id else None
 if uploaded_files:
+    st.session_state.had_uploads = True
+elif st.session_state.had_uploads:
+    if job:
+        job_queue.cancel(job)
+    job = None
+if job is None and st.session_state.job_id:
+    st.session_state.job_id = None
+    if 'job' in st.query_params:
+        del st.query_params['job']
+
+# Reconcile the current uploads with already processed cards by content:
+# removed files are dropped and unchanged files are never re-extracted
+upload_keys = assign_upload_keys(uploaded_files) if uploaded_files else list(job.keys if job else [])
+cards_by_key = st.session_state.cards_by_key
+for key in set(cards_by_key) - set(upload_keys):
+    del cards_by_key[key]
+# Batches that only hold removed files are not worth a model request
+if job and uploaded_files and job.queued:
+    job_queue.cancel(job, keep=upload_keys)
+st.session_state.editing_images &= set(upload_keys)
+for key in set(st.session_state.editor_previews) - st.session_state.editing_images:
+    del st.session_state.editor_previews[key]
+if job:
+    attach_job_results(job, upload_keys)
+st.session_state.processed_cards = [cards_by_key[key] for key in upload_keys if key in cards_by_key]
+
+if upload_keys:
     try:
-        # Show progress bar
-        progress_text = "Processing business cards..."
-        total_files = len(uploaded_files)
-        progress_bar = st.progress(0, text=progress_text)
-
-        # Process each file
-        for idx, uploaded_file in enumerate(uploaded_files):
-            # Check if this file was already processed
-            if idx >= len(st.session_state.processed_cards):
-                # Update progress
-                progress = (idx + 1) / total_files
-                progress_bar.progress(progress, text=f"Processing card {idx + 1} of {total_files}...")
-
-                # Read and store the image
-                image = Image.open(uploaded_file)
-
-                try:
-                    # Extract information
-                    info = extract_card_info(image)
-                    info['processing_status'] = 'success'
-                except Exception as e:
-                    # If extraction fails, create a minimal info dict with error details
-                    info = {
-                        'processing_status': 'failed',
-                        'error_message': str(e),
-                        'company_name': f'Error processing image: {uploaded_file.name}'
-                    }
-                    st.warning(f"Skipping {uploaded_file.name} due to processing error: {str(e)}")
-
-                # Add filename and original image to info
-                info['filename'] = uploaded_file.name
-                info['original_image'] = image
-                st.session_state.processed_cards.append(info)
-
-        # Complete progress bar
-        progress_bar.progress(1.0, text="Processing complete!")
-
-        # Show export options immediately after processing
+        # Only files without a card (finished or on its way) need extraction
+        pending_files = [
+            (idx, uploaded_file) for idx, uploaded_file in enumerate(uploaded_files or [])
+            if upload_keys[idx] not in cards_by_key
+            and not (job and job.active and upload_keys[idx] in job.keys)
+        ]
+
+        if pending_files:
+            if job is None:
+                job = job_queue.create()
+                st.session_state.job_id = job.job_id
+                st.query_params['job'] = job.job_id
+            job.max_parallel = max_workers
+            # Cards the session already has belong to the job too, so a refresh brings all of them back
+            for key in upload_keys:
+                if key in cards_by_key and key not in job.results:
+                    job_queue.record(job, key, cards_by_key[key])
+
+            if stream_results:
+                # Streaming renders from the script thread, so cards go one at a time
+                summary = ExtractionMetrics()
+                started = time.monotonic()
+                for idx, uploaded_file in pending_files:
+                    with collect() as metrics:
+                        info = stream_uploaded_file(uploaded_file, idx)
+                    summary.merge(metrics)
+                    job_queue.record(job, upload_keys[idx], info)
+                    attach_job_results(job, [upload_keys[idx]])
+                st.session_state.batch_metrics = {
+                    'cards': len(pending_files),
+                    'seconds': time.monotonic() - started,
+                    'metrics': summary.as_dict(),
+                }
+            else:
+                # Group pending files into model requests of up to batch_size cards; the job
+                # queue's workers extract them while this script run (and any later one) goes on
+                batches = [pending_files[i:i + batch_size] for i in range(0, len(pending_files), batch_size)]
+                for batch in batches:
+                    job_queue.submit(
+                        job, [upload_keys[idx] for idx, _ in batch], process_uploaded_files,
+                        [uploaded_file for _, uploaded_file in batch], output_mode, vision_detail
+                    )
+        if job and uploaded_files:
+            job.keys = list(upload_keys)
+
+        # Store results in upload order regardless of completion order
+        st.session_state.processed_cards = [cards_by_key[key] for key in upload_keys if key in cards_by_key]
+
+        if job and job.active:
+            job_progress(job.job_id, len(st.session_state.processed_cards))
+        else:
+            st.progress(1.0, text="Processing complete!")
+            # Summarize each finished run of the job once
+            if job and job.run_keys and st.session_state.job_run != (job.job_id, job.run_started):
+                st.session_state.job_run = (job.job_id, job.run_started)
+                st.session_state.batch_metrics = {
+                    'cards': job.run_keys,
+                    'seconds': job.finished_at - job.run_started,
+                    'metrics': job.metrics.as_dict(),
+                }
+        if st.session_state.batch_metrics:
+            display_batch_metrics(st.session_state.batch_metrics)
+
+        # Show export options as soon as there are cards
         if st.session_state.processed_cards:
             st.subheader("💾 Export Options")
 
-            # Convert to DataFrame for export
-            export_data = []
-            for card in st.session_state.processed_cards:
-                # Create a copy without the image to avoid CSV export issues
-                card_data = {}
-                base_card = card.copy()
-                base_card.pop('original_image', None)
-                base_card.pop('display_image', None)
-
-                # Flatten company_address
-                if base_card.get('company_address'):
-                    for i, addr in enumerate(base_card['company_address']):
-                        suffix = f"_{i+1}" if len(base_card['company_address']) > 1 else ""
-                        for key, value in addr.items():
-                            card_data[f'company_address_{key}{suffix}'] = value
-
-                # Flatten contact_person
-                if base_card.get('contact_person'):
-                    for i, person in enumerate(base_card['contact_person']):
-                        suffix = f"_{i+1}" if len(base_card['contact_person']) > 1 else ""
-                        for key, value in person.items():
-                            if isinstance(value, list):
-                                # Handle nested arrays like personal_phone and personal_email
-                                for j, item in enumerate(value):
-                                    if isinstance(item, dict):
-                                        item_value = next(iter(item.values()), '')
-                                    else:
-                                        item_value = item
-                                    card_data[f'contact_person_{key}{suffix}_{j+1}'] = item_value
-                            else:
-                                card_data[f'contact_person_{key}{suffix}'] = value
-
-                # Handle other array fields
-                array_fields = ['company_email', 'company_phone', 'company_fax', 
-                              'company_website', 'company_gstin', 'company_details_if_any']
-                for field in array_fields:
-                    if base_card.get(field):
-                        for i, item in enumerate(base_card[field]):
-                            suffix = f"_{i+1}" if len(base_card[field]) > 1 else ""
-                            if isinstance(item, dict):
-                                item_value = next(iter(item.values()), '')
-                            else:
-                                item_value = item
-                            card_data[f'{field}{suffix}'] = item_value
-
-                # Add non-array fields
-                for key, value in base_card.items():
-                    if key not in array_fields + ['company_address', 'contact_person', 'original_image', 'display_image']:
-                        card_data[key] = value
-
-                export_data.append(card_data)
-
-            df = pd.DataFrame(export_data)
-
-            # CSV export button
-            csv = df.to_csv(index=False)
+            export_format = st.selectbox(
+                "Format",
+                available_formats(),
+                key="export_format",
+                help="CSV and Parquet have one column per field, JSONL keeps the nested structure, "
+                     "vCard has one contact per person for phones and CRMs. "
+                     "Parquet is listed when pyarrow is installed (pip install '.[parquet]')"
+            )
+            extension, mime = EXPORT_FORMATS[export_format]
+            merge_duplicates = st.checkbox(
+                "Merge duplicates",
+                key="merge_duplicates",
+                help="Cards sharing an email, phone number or company domain, or the company "
+                     "name and a pincode, are exported as one record"
+            )
+            if merge_duplicates:
+                merged = st.session_state.export_cache.merged(st.session_state.processed_cards)
+                st.caption(f"{len(st.session_state.processed_cards)} cards merged into {len(merged)} records")
+
+            # Rows are flattened once per card and each export is reused until the cards change
+            data = st.session_state.export_cache.export(
+                st.session_state.processed_cards, export_format, merge_duplicates=merge_duplicates
+            )
+
             st.download_button(
-                label="Download CSV",
-                data=csv,
-                file_name="business_cards.csv",
-                mime="text/csv",
-                help="Download all extracted information as CSV"
+                label=f"Download {export_format}",
+                data=data,
+                file_name=f"business_cards.{extension}",
+                mime=mime,
+                help=f"Download all extracted information as {export_format}"
             )
 
     except Exception as e:
@@ -313,9 +762,87 @@ if uploaded_files:
 
 # Always display processed cards if they exist
 if st.session_state.processed_cards:
-    # Display all processed cards
-    for idx, info in enumerate(st.session_state.processed_cards):
-        display_card_info(info, idx)
+    list_cols = st.columns([2, 1, 1])
+    failed_only = list_cols[0].checkbox("Show failed cards only", key="failed_only")
+    visible = [
+        idx for idx, card in enumerate(st.session_state.processed_cards)
+        if not failed_only or card.get('processing_status') == 'failed'
+    ]
+    page_size = list_cols[1].selectbox("Cards per page", PAGE_SIZES, key="page_size")
+    page_count = max(1, math.ceil(len(visible) / page_size))
+    # The page is set through session state only (no value=), so clamping it does not warn
+    if 'card_page' not in st.session_state:
+        st.session_state.card_page = 1
+    # The page can fall out of range when the filter or page size changes
+    if st.session_state.card_page > page_count:
+        st.session_state.card_page = page_count
+    page = list_cols[2].number_input("Page", min_value=1, max_value=page_count, key="card_page")
+
+    # Only the current page is rendered, one fragment per card
+    page_cards = visible[(page - 1) * page_size:page * page_size]
+    st.caption(f"Page {page} of {page_count} · {len(visible)} matching cards")
+    for idx in page_cards:
+        card_fragment(idx)
+
+def session_image_memory(cards):
+    """Bytes of image data held for these cards, and roughly what decoded images would take"""
+    stored = decoded = 0
+    for card in cards:
+        stored += sum(len(card.get(key) or b'') for key in ('image_bytes', 'thumbnail', 'display_image'))
+        stats = card.get('image_stats')
+        if stats:
+            width, height = map(int, stats['original_size'].split('x'))
+            decoded += width * height * 3
+    return stored, decoded
+
+# Per-session image memory
+if st.session_state.processed_cards:
+    stored_bytes, decoded_bytes = session_image_memory(st.session_state.processed_cards)
+    st.sidebar.caption(
+        f"Session images: {format_bytes(stored_bytes)} stored "
+        f"(~{format_bytes(decoded_bytes)} if kept decoded)"
+    )
+
+# Result cache counters for this server process
+result_cache = get_result_cache()
+if result_cache:
+    cache_stats = result_cache.stats()
+    st.sidebar.caption(
+        f"Result cache: {cache_stats['hits']} hits, {cache_stats['misses']} misses, "
+        f"{cache_stats['entries']} stored"
+    )
+
+# Model request scheduling for this server process
+scheduler_stats = request_scheduler.stats()
+if scheduler_stats['calls']:
+    st.sidebar.caption(
+        f"Model requests: {scheduler_stats['calls']} calls, {scheduler_stats['retries']} retries, "
+        f"{scheduler_stats['failures']} failed, avg queue {scheduler_stats['avg_queued']:.2f}s"
+    )
+
+# Extraction job queue for this server process
+queue_stats = job_queue.stats()
+if queue_stats['completed_tasks'] or queue_stats['queued_tasks'] or queue_stats['busy']:
+    st.sidebar.caption(
+        f"Job queue: {queue_stats['queued_tasks']} queued, {queue_stats['busy']}/{queue_stats['workers']} "
+        f"workers busy, {queue_stats['utilization']:.0%} utilization, {queue_stats['active_jobs']} active jobs"
+    )
+
+# Background S3 deletions for this server process
+cleanup_stats = get_cleanup_queue().stats()
+if cleanup_stats['pending'] or cleanup_stats['failed']:
+    st.sidebar.caption(
+        f"S3 cleanup: {cleanup_stats['pending']} pending, {cleanup_stats['failed']} failed"
+    )
+
+# Prometheus snapshot of the process-wide metrics
+st.sidebar.download_button(
+    "Download metrics",
+    data=registry.render(),
+    file_name="card_reader_metrics.txt",
+    mime="text/plain",
+    help="Stage timings, image bytes, tokens and retries in the Prometheus text format"
+)
 
 # Add footer
 st.markdown("""
@@ -0,0 +1,81 @@
+import re
+
+from utils.card_schema import CARD_FIELDS
+
+
+# 15 characters: state code, PAN, entity number, 'Z', checksum character
+GSTIN_PATTERN = re.compile(r'^\d{2}[A-Z]{5}\d{4}[A-Z][1-9A-Z]Z[0-9A-Z]$')
+EMAIL_PATTERN = re.compile(r'^[^@\s]+@[^@\s]+\.[A-Za-z]{2,}$')
+
+# Characters allowed around the digits of a phone number, and an optional extension
+PHONE_PUNCTUATION = re.compile(r'[\s().\-/]')
+PHONE_EXTENSION = re.compile(r'\s*(?:ext\.?|x|extn\.?)\s*\d+$', re.IGNORECASE)
+
+
+# Fields that can be required of a card (see card_problems)
+REQUIRED_FIELD_NAMES = ('email', 'phone', 'website', 'address', 'gstin')
+
+
+def required_fields(value):
+    """Parse a comma separated list of REQUIRED_FIELD_NAMES (e.g. from the environment)"""
+    fields = tuple(field.strip() for field in value.split(',') if field.strip())
+    unknown = [field for field in fields if field not in REQUIRED_FIELD_NAMES]
+    if unknown:
+        raise ValueError(f"Unknown required card fields {unknown}, expected some of {list(REQUIRED_FIELD_NAMES)}")
+    return fields
+
+
+def is_valid_phone(phone):
+    """E.164-sized number (7-15 digits, optional leading +) once punctuation and extensions are removed"""
+    digits = PHONE_PUNCTUATION.sub('', PHONE_EXTENSION.sub('', phone))
+    if digits.startswith('+'):
+        digits = digits[1:]
+    return digits.isdigit() and 7 <= len(digits) <= 15
+
+
+def card_problems(card, required=()):
+    """
+    Validity problems in a normalized card: nothing but a company name (the
+    prompt asks for that when the image is unreadable), no name at all, or
+    an email, phone number or GSTIN that is malformed
+
+    Fields that are simply absent (many cards print no email or GSTIN) are
+    only problems when listed in `required`.
+
+    Args:
+        card: Normalized card dict
+        required: REQUIRED_FIELD_NAMES the card must have, e.g. ('email',)
+
+    Returns:
+        list: Human readable problems; empty when the card looks valid
+    """
+    problems = []
+    people = card.get('contact_person') or []
+
+    # An unreadable image comes back as a description of the issue in company_name
+    if card.get('company_name') and not any(card.get(field) for field in CARD_FIELDS if field != 'company_name'):
+        problems.append("unreadable")
+    elif not card.get('company_name') and not any(person.get('name') for person in people):
+        problems.append("missing name")
+
+    emails = list(card.get('company_email') or [])
+    phones = list(card.get('company_phone') or [])
+    for person in people:
+        emails += person.get('personal_email') or []
+        phones += person.get('personal_phone') or []
+
+    present = {
+        'email': emails,
+        'phone': phones,
+        'website': card.get('company_website'),
+        'address': card.get('company_address'),
+        'gstin': card.get('company_gstin'),
+    }
+    problems += [f"missing {field}" for field in required if not present[field]]
+    problems += [f"invalid email: {email}" for email in emails if not EMAIL_PATTERN.match(email)]
+    problems += [f"unparseable phone: {phone}" for phone in phones if not is_valid_phone(phone)]
+    problems += [
+        f"invalid GSTIN: {gstin}" for gstin in card.get('company_gstin') or []
+        if not GSTIN_PATTERN.match(gstin.replace(' ', '').upper())
+    ]
+    return problems
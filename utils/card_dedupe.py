@@ -0,0 +1,324 @@
+from collections import Counter, defaultdict
+import os
+import re
+
+from utils.card_export import ARRAY_FIELDS, INTERNAL_FIELDS, item_value
+
+
+# Blocking keys shared by more cards than this are treated as non-identifying
+# (a reception number or OCR noise would otherwise chain unrelated cards together)
+MAX_BLOCK_SIZE = int(os.environ.get('DEDUPE_MAX_BLOCK', 100))
+
+# Email domains that say nothing about the company
+FREE_EMAIL_DOMAINS = {
+    'gmail.com', 'googlemail.com', 'yahoo.com', 'yahoo.co.in', 'yahoo.co.uk', 'hotmail.com', 'outlook.com',
+    'live.com', 'msn.com', 'icloud.com', 'me.com', 'aol.com', 'rediffmail.com', 'protonmail.com', 'proton.me',
+    'zoho.com', 'gmx.com', 'mail.com', 'yandex.com',
+}
+
+# Legal-form words dropped from company names before comparing them
+COMPANY_SUFFIXES = {
+    'pvt', 'private', 'ltd', 'limited', 'llp', 'llc', 'inc', 'incorporated', 'co', 'corp', 'corporation',
+    'company', 'plc', 'gmbh', 'pte', 'the',
+}
+
+# Shorter phone numbers are extensions or OCR fragments, not identities
+MIN_PHONE_DIGITS = 7
+PHONE_KEY_DIGITS = 10
+
+# Key kinds that identify a company on their own; a shared company name alone does not
+STRONG_KEYS = ('email:', 'phone:', 'domain:')
+
+_NON_DIGITS = re.compile(r'\D')
+_NON_WORD = re.compile(r'[^\w]+', re.UNICODE)
+
+
+def normalize_phone(phone):
+    """Comparable form of a phone number: its last PHONE_KEY_DIGITS digits (country code and trunk 0 dropped)"""
+    digits = _NON_DIGITS.sub('', str(item_value(phone) or ''))
+    if len(digits) < MIN_PHONE_DIGITS:
+        return None
+    return digits[-PHONE_KEY_DIGITS:].lstrip('0') or None
+
+
+def normalize_email(email):
+    email = str(item_value(email) or '').strip().lower().rstrip('.')
+    if email.startswith('mailto:'):
+        email = email[len('mailto:'):]
+    return email if '@' in email else None
+
+
+def normalize_domain(value):
+    """Registered host of a website or email address, without scheme, www., port or path"""
+    value = str(item_value(value) or '').strip().lower()
+    if '@' in value:
+        value = value.rsplit('@', 1)[1]
+    value = re.sub(r'^[a-z]+://', '', value).split('/')[0].split(':')[0].strip('.')
+    if value.startswith('www.'):
+        value = value[4:]
+    return value if '.' in value else None
+
+
+def normalize_company(name):
+    """Company name in lower case without punctuation or legal-form words"""
+    words = _NON_WORD.sub(' ', str(name or '').lower().replace('&', ' and ')).split()
+    name = ' '.join(word for word in words if word not in COMPANY_SUFFIXES)
+    return name if len(name) >= 3 else None
+
+
+def normalize_name(name):
+    return ' '.join(_NON_WORD.sub(' ', str(name or '').lower()).split()) or None
+
+
+def _emails(card):
+    emails = list(card.get('company_email') or [])
+    for person in card.get('contact_person') or []:
+        emails += person.get('personal_email') or []
+    return emails
+
+
+def _phones(card):
+    phones = list(card.get('company_phone') or [])
+    for person in card.get('contact_person') or []:
+        phones += person.get('personal_phone') or []
+    return phones
+
+
+def blocking_keys(card):
+    """
+    Keys two cards of the same company share: normalized emails, phone
+    numbers, company web/email domains and the company name
+
+    Returns:
+        set: Strings prefixed with their kind, e.g. 'phone:9876543210'
+    """
+    keys = set()
+    for email in map(normalize_email, _emails(card)):
+        if email:
+            keys.add('email:' + email)
+            domain = normalize_domain(email)
+            if domain and domain not in FREE_EMAIL_DOMAINS:
+                keys.add('domain:' + domain)
+    keys.update('phone:' + phone for phone in map(normalize_phone, _phones(card)) if phone)
+    for website in card.get('company_website') or []:
+        domain = normalize_domain(website)
+        if domain and domain not in FREE_EMAIL_DOMAINS:
+            keys.add('domain:' + domain)
+    company = normalize_company(card.get('company_name'))
+    if company:
+        keys.add('company:' + company)
+    return keys
+
+
+def card_places(card):
+    """Pincodes of a card's addresses, digits only"""
+    pincodes = set()
+    for address in card.get('company_address') or []:
+        pincode = _NON_DIGITS.sub('', str(address.get('pincode') or ''))
+        if pincode:
+            pincodes.add(pincode)
+    return pincodes
+
+
+def _same_place(a, b):
+    # A city names too large an area (every branch office of a chain shares it),
+    # so only a common pincode counts, and a card without one never matches
+    return bool(a and b) and not a.isdisjoint(b)
+
+
+def same_company(keys_a, places_a, keys_b, places_b):
+    """
+    Whether two candidate cards belong to the same company: they share an
+    email, phone number or domain, or the company name and a pincode (and
+    do not name different domains)
+
+    Args:
+        keys_a, keys_b: Output of blocking_keys for each card
+        places_a, places_b: Output of card_places for each card
+    """
+    shared = keys_a & keys_b
+    if any(key.startswith(STRONG_KEYS) for key in shared):
+        return True
+    if not any(key.startswith('company:') for key in shared):
+        return False
+    # Cards that both name a domain, and no common one, are different firms
+    if _has_kind(keys_a, 'domain:') and _has_kind(keys_b, 'domain:'):
+        return False
+    return _same_place(places_a, places_b)
+
+
+def _has_kind(keys, kind):
+    return any(key.startswith(kind) for key in keys)
+
+
+class DisjointSet:
+    """Union-find over 0..n-1 with path halving and union by size"""
+
+    def __init__(self, n):
+        self.parent = list(range(n))
+        self.size = [1] * n
+
+    def find(self, x):
+        parent = self.parent
+        while parent[x] != x:
+            parent[x] = parent[parent[x]]
+            x = parent[x]
+        return x
+
+    def union(self, a, b):
+        a, b = self.find(a), self.find(b)
+        if a == b:
+            return a
+        if self.size[a] < self.size[b]:
+            a, b = b, a
+        self.parent[b] = a
+        self.size[a] += self.size[b]
+        return a
+
+
+def find_duplicates(cards, max_block=MAX_BLOCK_SIZE):
+    """
+    Group cards of the same company, without comparing every pair of cards
+
+    Cards sharing a blocking key are only candidates: each pair inside a
+    block is checked with same_company before it is joined, so two firms
+    with the same name in different cities stay apart. Blocks are capped at
+    max_block cards, which keeps the work linear in the number of keys.
+    Failed cards are never grouped.
+
+    Args:
+        cards: Processed cards or exported records
+        max_block: Keys shared by more cards than this are ignored
+
+    Returns:
+        list: Groups of card indices (in input order) with more than one card
+    """
+    keys, places = {}, {}
+    blocks = defaultdict(list)
+    for index, card in enumerate(cards):
+        if card.get('processing_status') == 'failed':
+            continue
+        keys[index] = blocking_keys(card)
+        places[index] = card_places(card)
+        for key in keys[index]:
+            blocks[key].append(index)
+
+    groups = DisjointSet(len(cards))
+    for members in blocks.values():
+        if not 1 < len(members) <= max_block:
+            continue
+        for position, a in enumerate(members):
+            for b in members[position + 1:]:
+                if groups.find(a) != groups.find(b) and same_company(keys[a], places[a], keys[b], places[b]):
+                    groups.union(a, b)
+
+    clusters = defaultdict(list)
+    for index in range(len(cards)):
+        if groups.size[groups.find(index)] > 1:
+            clusters[groups.find(index)].append(index)
+    return sorted(clusters.values())
+
+
+def _union(values, normalize):
+    """Values in first-seen order, dropping ones that normalize to something already kept"""
+    seen, kept = set(), []
+    for value in values:
+        value = item_value(value)
+        if not value:
+            continue
+        key = normalize(value) or str(value).strip().lower()
+        if key not in seen:
+            seen.add(key)
+            kept.append(value)
+    return kept or None
+
+
+# How list fields are compared when merging
+_FIELD_NORMALIZERS = {
+    'company_email': normalize_email,
+    'company_phone': normalize_phone,
+    'company_fax': normalize_phone,
+    'company_website': normalize_domain,
+}
+
+
+def _merge_people(cards):
+    """Contact persons of all cards, one entry per distinct name"""
+    merged, by_name = [], {}
+    for card in cards:
+        for person in card.get('contact_person') or []:
+            name = normalize_name(person.get('name'))
+            target = by_name.get(name) if name else None
+            if target is None:
+                target = {'name': person.get('name'), 'position': None, 'personal_phone': [], 'personal_email': []}
+                merged.append(target)
+                if name:
+                    by_name[name] = target
+            target['position'] = target['position'] or person.get('position')
+            target['personal_phone'] += person.get('personal_phone') or []
+            target['personal_email'] += person.get('personal_email') or []
+    for person in merged:
+        person['personal_phone'] = _union(person['personal_phone'], normalize_phone)
+        person['personal_email'] = _union(person['personal_email'], normalize_email)
+    return merged or None
+
+
+def _address_key(address):
+    return tuple(normalize_name(address.get(key)) for key in ('remaining', 'city', 'pincode'))
+
+
+def merge_cards(cards):
+    """
+    Merge the cards of one duplicate group into a single record
+
+    The most common company name wins; list fields, people and addresses are
+    unioned with duplicates (by normalized value) removed. merged_from lists
+    the file names of the merged cards.
+    """
+    merged = {}
+    names = Counter(card.get('company_name') for card in cards if card.get('company_name'))
+    merged['company_name'] = names.most_common(1)[0][0] if names else None
+    merged['contact_person'] = _merge_people(cards)
+
+    addresses, seen = [], set()
+    for card in cards:
+        for address in card.get('company_address') or []:
+            key = _address_key(address)
+            if key not in seen:
+                seen.add(key)
+                addresses.append(address)
+    merged['company_address'] = addresses or None
+
+    for field in ARRAY_FIELDS:
+        merged[field] = _union(
+            [value for card in cards for value in card.get(field) or []],
+            _FIELD_NORMALIZERS.get(field, normalize_name)
+        )
+
+    # Anything else (status, file name, ...) comes from the first card
+    for key, value in cards[0].items():
+        if key not in merged and key not in INTERNAL_FIELDS:
+            merged[key] = value
+    merged['duplicate_count'] = len(cards)
+    merged['merged_from'] = '; '.join(str(card.get('filename')) for card in cards if card.get('filename'))
+    return merged
+
+
+def dedupe_cards(cards, max_block=MAX_BLOCK_SIZE):
+    """
+    Cards with every duplicate group replaced by one merged record (at the
+    position of its first card); cards without duplicates are kept as they are
+
+    Returns:
+        tuple: (records, groups) where groups is the output of find_duplicates
+    """
+    groups = find_duplicates(cards, max_block)
+    first_of = {group[0]: group for group in groups}
+    merged_away = {index for group in groups for index in group[1:]}
+    records = []
+    for index, card in enumerate(cards):
+        if index in first_of:
+            records.append(merge_cards([cards[i] for i in first_of[index]]))
+        elif index not in merged_away:
+            records.append(card)
+    return records, groups
@@ -0,0 +1,309 @@
+import csv
+import importlib.util
+import io
+import json
+
+
+# Card keys holding images or bookkeeping rather than extracted data
+INTERNAL_FIELDS = {'card_key', 'source_key', 'image_bytes', 'thumbnail', 'display_image', 'image_stats', 'export_row',
+                   'routing', 'edit'}
+
+# Download formats: (file extension, MIME type)
+EXPORT_FORMATS = {
+    'CSV': ('csv', 'text/csv'),
+    'JSONL': ('jsonl', 'application/x-ndjson'),
+    'vCard': ('vcf', 'text/vcard'),
+    'Parquet': ('parquet', 'application/vnd.apache.parquet'),
+}
+
+# Parquet rows written per row group
+PARQUET_ROW_GROUP = 1000
+
+# List fields flattened into numbered columns
+ARRAY_FIELDS = ['company_email', 'company_phone', 'company_fax',
+                'company_website', 'company_gstin', 'company_details_if_any']
+
+
+def parquet_available():
+    """Parquet export needs pyarrow, installed with the optional extra: pip install '.[parquet]'"""
+    return importlib.util.find_spec('pyarrow') is not None
+
+
+def available_formats():
+    """Names of the EXPORT_FORMATS that can be written in this environment"""
+    return [name for name in EXPORT_FORMATS if name != 'Parquet' or parquet_available()]
+
+
+def item_value(item):
+    """Plain value of a list entry, unwrapping {"label": value} style dicts"""
+    if isinstance(item, dict):
+        return next(iter(item.values()), '')
+    return item
+
+
+def flatten_card(card):
+    """Flatten a processed card into a single export row"""
+    card_data = {}
+
+    # Flatten company_address
+    if card.get('company_address'):
+        for i, addr in enumerate(card['company_address']):
+            suffix = f"_{i+1}" if len(card['company_address']) > 1 else ""
+            for key, value in addr.items():
+                card_data[f'company_address_{key}{suffix}'] = value
+
+    # Flatten contact_person
+    if card.get('contact_person'):
+        for i, person in enumerate(card['contact_person']):
+            suffix = f"_{i+1}" if len(card['contact_person']) > 1 else ""
+            for key, value in person.items():
+                if isinstance(value, list):
+                    # Handle nested arrays like personal_phone and personal_email
+                    for j, item in enumerate(value):
+                        card_data[f'contact_person_{key}{suffix}_{j+1}'] = item_value(item)
+                else:
+                    card_data[f'contact_person_{key}{suffix}'] = value
+
+    # Handle other array fields
+    for field in ARRAY_FIELDS:
+        if card.get(field):
+            for i, item in enumerate(card[field]):
+                suffix = f"_{i+1}" if len(card[field]) > 1 else ""
+                card_data[f'{field}{suffix}'] = item_value(item)
+
+    # Add non-array fields
+    for key, value in card.items():
+        if key not in ARRAY_FIELDS + ['company_address', 'contact_person'] and key not in INTERNAL_FIELDS:
+            card_data[key] = value
+
+    return card_data
+
+
+def card_row(card):
+    """Flattened row for a card, computed once and kept on the card"""
+    row = card.get('export_row')
+    if row is None:
+        row = card['export_row'] = flatten_card(card)
+    return row
+
+
+def union_columns(rows):
+    """Every column used by any row, in order of first appearance"""
+    columns = {}
+    for row in rows:
+        columns.update(dict.fromkeys(row))
+    return list(columns)
+
+
+def _drain(buffer):
+    text = buffer.getvalue()
+    buffer.seek(0)
+    buffer.truncate()
+    return text
+
+
+def iter_csv(rows, columns):
+    """CSV text for rows with the given column order, yielded a line at a time"""
+    buffer = io.StringIO()
+    writer = csv.DictWriter(buffer, fieldnames=columns, lineterminator='\n')
+    writer.writeheader()
+    yield _drain(buffer)
+    for row in rows:
+        writer.writerow(row)
+        yield _drain(buffer)
+
+
+def rows_to_csv(rows, columns):
+    """Serialize rows to CSV text with the given column order"""
+    return ''.join(iter_csv(rows, columns))
+
+
+def export_record(card):
+    """Extracted data of a card, nested as returned by the model"""
+    return {key: value for key, value in card.items() if key not in INTERNAL_FIELDS}
+
+
+def iter_jsonl(cards):
+    """One JSON line per card"""
+    for card in cards:
+        yield json.dumps(export_record(card), ensure_ascii=False) + '\n'
+
+
+def _vcard_escape(value):
+    return (str(value).replace('\\', '\\\\').replace('\n', '\\n')
+            .replace(',', '\\,').replace(';', '\\;'))
+
+
+def _vcard_line(name, *values):
+    """One content line, folded at 75 octets as RFC 6350 requires"""
+    line = f"{name}:{';'.join(_vcard_escape(value or '') for value in values)}"
+    folded, width = [], 0
+    for char in line:
+        size = len(char.encode('utf-8'))
+        if width + size > 75:
+            folded.append('\r\n ')
+            width = 1
+        folded.append(char)
+        width += size
+    return ''.join(folded) + '\r\n'
+
+
+def _values(items):
+    return [str(item_value(item)) for item in items or [] if item_value(item)]
+
+
+def card_vcards(card):
+    """vCard 3.0 entries for a card: one per contact person, or one for the company"""
+    company = card.get('company_name')
+    company_lines = []
+    if company:
+        company_lines.append(_vcard_line('ORG', company))
+    for phone in _values(card.get('company_phone')):
+        company_lines.append(_vcard_line('TEL;TYPE=WORK,VOICE', phone))
+    for fax in _values(card.get('company_fax')):
+        company_lines.append(_vcard_line('TEL;TYPE=WORK,FAX', fax))
+    for email in _values(card.get('company_email')):
+        company_lines.append(_vcard_line('EMAIL;TYPE=INTERNET,WORK', email))
+    for website in _values(card.get('company_website')):
+        company_lines.append(_vcard_line('URL', website))
+    for addr in card.get('company_address') or []:
+        # Post office box; extended address; street; locality; region; postal code; country
+        company_lines.append(_vcard_line(
+            'ADR;TYPE=WORK', '', '', addr.get('remaining'), addr.get('city'),
+            addr.get('state'), addr.get('pincode'), addr.get('country')
+        ))
+    notes = [f"GSTIN: {gstin}" for gstin in _values(card.get('company_gstin'))]
+    notes += _values(card.get('company_details_if_any'))
+    if notes:
+        company_lines.append(_vcard_line('NOTE', '\n'.join(notes)))
+
+    entries = []
+    for person in card.get('contact_person') or [{}]:
+        name = person.get('name') or company
+        if not name:
+            continue
+        lines = ['BEGIN:VCARD\r\n', 'VERSION:3.0\r\n', _vcard_line('FN', name)]
+        if person.get('name'):
+            given, _, family = name.rpartition(' ')
+            # Family; given; additional; prefixes; suffixes
+            lines.append(_vcard_line('N', family, given, '', '', ''))
+        else:
+            lines.append(_vcard_line('N', '', '', '', '', ''))
+        if person.get('position'):
+            lines.append(_vcard_line('TITLE', person['position']))
+        for phone in _values(person.get('personal_phone')):
+            lines.append(_vcard_line('TEL;TYPE=CELL,VOICE', phone))
+        for email in _values(person.get('personal_email')):
+            lines.append(_vcard_line('EMAIL;TYPE=INTERNET', email))
+        lines += company_lines
+        lines.append('END:VCARD\r\n')
+        entries.append(''.join(lines))
+    return entries
+
+
+def iter_vcard(cards):
+    """vCard entries for every successfully extracted card"""
+    for card in cards:
+        if card.get('processing_status') == 'failed':
+            continue
+        yield from card_vcards(card)
+
+
+def _text(value):
+    return None if value is None else str(value)
+
+
+def write_parquet(rows, columns, target):
+    """
+    Write rows as Parquet with one string column per export column, a row
+    group at a time, so only PARQUET_ROW_GROUP rows are held in Arrow memory
+
+    Args:
+        rows: Iterable of flattened rows
+        columns: Column order (e.g. from union_columns)
+        target: File path or binary file object
+    """
+    # Deferred: pyarrow is only needed for this export
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    schema = pa.schema([(column, pa.string()) for column in columns])
+    with pq.ParquetWriter(target, schema) as writer:
+        batch = []
+        for row in rows:
+            batch.append({column: _text(row.get(column)) for column in columns})
+            if len(batch) == PARQUET_ROW_GROUP:
+                writer.write_table(pa.Table.from_pylist(batch, schema=schema))
+                batch = []
+        if batch:
+            writer.write_table(pa.Table.from_pylist(batch, schema=schema))
+
+
+def write_export(cards, export_format, f, rows=None):
+    """
+    Write cards to an open file in one of EXPORT_FORMATS, incrementally
+
+    Args:
+        cards: Processed cards; iterated twice for CSV and Parquet (once
+            to find the columns), so pass a list rather than a generator
+        export_format: A key of EXPORT_FORMATS
+        f: Text file for CSV, JSONL and vCard (open vCard files with
+            newline='' to keep the CRLF line endings), binary file for Parquet
+        rows: Function returning the flattened rows of the cards, if they
+            are already cached (defaults to flattening them on the fly)
+    """
+    if export_format not in EXPORT_FORMATS:
+        raise ValueError(f"Unknown export format: {export_format}")
+    rows = rows or (lambda: (flatten_card(card) for card in cards))
+    if export_format == 'CSV':
+        for chunk in iter_csv(rows(), union_columns(rows())):
+            f.write(chunk)
+    elif export_format == 'Parquet':
+        write_parquet(rows(), union_columns(rows()), f)
+    else:
+        for chunk in (iter_jsonl if export_format == 'JSONL' else iter_vcard)(cards):
+            f.write(chunk)
+
+
+class ExportCache:
+    """Serialized exports that are only rebuilt when the set of cards changes
+
+    Keep one instance per session (e.g. in st.session_state) and call
+    export() (or csv()) on every rerun; rows are flattened once per card and
+    each format is only serialized when it is asked for.
+    """
+
+    def __init__(self):
+        self._cards = []
+        self._merged = None
+        self._exports = {}
+
+    def _update(self, cards):
+        # Compare by identity; holding the cards keeps their ids from being reused
+        if len(cards) != len(self._cards) or any(a is not b for a, b in zip(cards, self._cards)):
+            self._cards = list(cards)
+            self._merged = None
+            self._exports = {}
+
+    def merged(self, cards):
+        """The cards with each group of duplicates merged into one record (see card_dedupe)"""
+        self._update(cards)
+        if self._merged is None:
+            # Deferred: card_dedupe builds on this module
+            from utils.card_dedupe import dedupe_cards
+            self._merged = dedupe_cards(self._cards)[0]
+        return self._merged
+
+    def export(self, cards, export_format, merge_duplicates=False):
+        """The export of cards as str (CSV, JSONL, vCard) or bytes (Parquet), optionally with duplicates merged"""
+        self._update(cards)
+        key = (export_format, merge_duplicates)
+        if key not in self._exports:
+            records = self.merged(cards) if merge_duplicates else self._cards
+            buffer = io.BytesIO() if export_format == 'Parquet' else io.StringIO()
+            write_export(records, export_format, buffer, rows=lambda: map(card_row, records))
+            self._exports[key] = buffer.getvalue()
+        return self._exports[key]
+
+    def csv(self, cards):
+        return self.export(cards, 'CSV')
@@ -0,0 +1,137 @@
+from utils.card_export import item_value
+
+
+# JSON Schema for one card, usable as a strict structured-output response format:
+# every field is required and nullable, no other keys are allowed
+_STRING = {"type": ["string", "null"]}
+_STRING_LIST = {"type": ["array", "null"], "items": {"type": "string"}}
+
+
+def _object_list(fields):
+    return {
+        "type": ["array", "null"],
+        "items": {
+            "type": "object",
+            "properties": fields,
+            "required": list(fields),
+            "additionalProperties": False
+        }
+    }
+
+
+PERSON_FIELDS = {
+    "name": _STRING,
+    "position": _STRING,
+    "personal_phone": _STRING_LIST,
+    "personal_email": _STRING_LIST
+}
+
+ADDRESS_FIELDS = {
+    "remaining": _STRING,
+    "city": _STRING,
+    "state": _STRING,
+    "country": _STRING,
+    "pincode": _STRING
+}
+
+CARD_FIELDS = {
+    "company_name": _STRING,
+    "contact_person": _object_list(PERSON_FIELDS),
+    "company_address": _object_list(ADDRESS_FIELDS),
+    "company_email": _STRING_LIST,
+    "company_phone": _STRING_LIST,
+    "company_fax": _STRING_LIST,
+    "company_website": _STRING_LIST,
+    "company_gstin": _STRING_LIST,
+    "company_details_if_any": _STRING_LIST
+}
+
+CARD_SCHEMA = {
+    "type": "object",
+    "properties": CARD_FIELDS,
+    "required": list(CARD_FIELDS),
+    "additionalProperties": False
+}
+
+# Several cards in one request come back as {"cards": [...]}
+BATCH_SCHEMA = {
+    "type": "object",
+    "properties": {"cards": {"type": "array", "items": CARD_SCHEMA}},
+    "required": ["cards"],
+    "additionalProperties": False
+}
+
+
+def json_schema_format(name, schema):
+    """Strict json_schema response_format for chat.completions.create"""
+    return {"type": "json_schema", "json_schema": {"name": name, "strict": True, "schema": schema}}
+
+
+def _string(value):
+    """Plain string for a scalar field; empty values become None"""
+    value = item_value(value)
+    if isinstance(value, list):
+        value = next((item for item in map(_string, value) if item), None)
+    if value is None:
+        return None
+    value = str(value).strip()
+    return value or None
+
+
+def _string_list(value):
+    """List of non-empty strings for a list field; an empty list becomes None"""
+    if value is None:
+        return None
+    items = value if isinstance(value, list) else [value]
+    strings = [string for string in map(_string, items) if string]
+    return strings or None
+
+
+def _object_list_value(value, fields):
+    if value is None:
+        return None
+    items = value if isinstance(value, list) else [value]
+    objects = [_normalize_object(item, fields) for item in items if isinstance(item, dict)]
+    # Drop entries the model filled entirely with nulls
+    objects = [obj for obj in objects if any(v is not None for v in obj.values())]
+    return objects or None
+
+
+def _normalize_object(data, fields):
+    normalized = {}
+    for field, schema in fields.items():
+        value = data.get(field)
+        if 'properties' in schema.get('items', {}):
+            normalized[field] = _object_list_value(value, schema['items']['properties'])
+        elif 'array' in schema['type']:
+            normalized[field] = _string_list(value)
+        else:
+            normalized[field] = _string(value)
+    return normalized
+
+
+def normalize_card(data):
+    """
+    Validate a parsed model reply and coerce it to the card schema
+
+    A list is reduced to its first object. Every schema field is present
+    afterwards; unknown keys are dropped, {"label": value} entries are
+    unwrapped, single values become lists where the schema has a list, and
+    empty strings or lists become None.
+
+    Raises:
+        ValueError: If the reply does not contain a JSON object
+    """
+    if isinstance(data, list):
+        data = next((item for item in data if isinstance(item, dict)), None)
+    if not isinstance(data, dict):
+        raise ValueError(f"Expected a JSON object for the card, got {type(data).__name__}")
+    return _normalize_object(data, CARD_FIELDS)
+
+
+def normalize_field(field, value):
+    """Normalize one top-level field of a streamed card (unknown fields are passed through)"""
+    schema = CARD_FIELDS.get(field)
+    if schema is None:
+        return value
+    return _normalize_object({field: value}, {field: schema})[field]
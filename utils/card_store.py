@@ -0,0 +1,278 @@
+import json
+import os
+import re
+import sqlite3
+import threading
+import time
+
+from utils.card_export import export_record, item_value
+
+
+# Store configuration (an empty path disables the store)
+STORE_PATH = os.environ.get('CARD_STORE_PATH', os.path.join('.cache', 'cards.sqlite3'))
+SEARCH_LIMIT = 50
+
+# Lookup values indexed per card: person names, emails and phone digits
+CONTACT_KINDS = ('person', 'email', 'phone')
+
+_NON_DIGITS = re.compile(r'\D')
+_SEARCH_TERM = re.compile(r'\w[\w.@+-]*', re.UNICODE)
+
+
+def phone_digits(phone):
+    """Digits of a phone number, the form phones are indexed and looked up in"""
+    return _NON_DIGITS.sub('', str(phone))
+
+
+def _strings(values):
+    return [str(item_value(value)).strip() for value in values or [] if item_value(value)]
+
+
+def card_contacts(card):
+    """(kind, value) pairs indexed for a card"""
+    people = card.get('contact_person') or []
+    emails = _strings(card.get('company_email'))
+    phones = _strings(card.get('company_phone'))
+    names = []
+    for person in people:
+        if person.get('name'):
+            names.append(person['name'].strip())
+        emails += _strings(person.get('personal_email'))
+        phones += _strings(person.get('personal_phone'))
+
+    contacts = [('person', name) for name in names]
+    contacts += [('email', email.lower()) for email in emails]
+    contacts += [('phone', digits) for digits in map(phone_digits, phones) if digits]
+    return list(dict.fromkeys(contacts))
+
+
+def _search_text(card):
+    """Column values of the full-text index for a card"""
+    people = card.get('contact_person') or []
+    person_text = [
+        ' '.join(filter(None, [person.get('name'), person.get('position')])) for person in people
+    ]
+    contact = [value for kind, value in card_contacts(card) if kind != 'person']
+    contact += _strings(card.get('company_phone')) + _strings(card.get('company_website'))
+    for person in people:
+        contact += _strings(person.get('personal_phone'))
+    address = [
+        ' '.join(filter(None, (addr.get(key) for key in ('remaining', 'city', 'state', 'country', 'pincode'))))
+        for addr in card.get('company_address') or []
+    ]
+    details = _strings(card.get('company_details_if_any')) + _strings(card.get('company_gstin'))
+    return (
+        card.get('company_name') or '',
+        '\n'.join(person_text),
+        '\n'.join(contact),
+        '\n'.join(address),
+        '\n'.join(details),
+    )
+
+
+def fts_query(text):
+    """FTS5 MATCH expression requiring every term of the text, each as a prefix"""
+    terms = _SEARCH_TERM.findall(text)
+    return ' '.join('"' + term.replace('"', '""') + '"*' for term in terms)
+
+
+class CardStore:
+    """Persistent SQLite store of extracted cards with indexed lookups and full-text search
+
+    Each card is kept as its JSON record under its card key (the app's
+    upload key or the batch CLI's source key); writing the same key again
+    replaces it. Company names and the person names, emails and phone digits
+    of every card are indexed for exact and prefix lookups, and an FTS5
+    table covers names, positions, contact details, addresses and
+    company details.
+    """
+
+    def __init__(self, path=STORE_PATH):
+        self.path = path
+        self._lock = threading.Lock()
+
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA foreign_keys=ON")
+        self._conn.executescript(
+            "CREATE TABLE IF NOT EXISTS cards ("
+            " id INTEGER PRIMARY KEY,"
+            " card_key TEXT NOT NULL UNIQUE,"
+            " filename TEXT,"
+            " company_name TEXT COLLATE NOCASE,"
+            " record TEXT NOT NULL,"
+            " created_at REAL NOT NULL,"
+            " updated_at REAL NOT NULL);"
+            "CREATE INDEX IF NOT EXISTS cards_company ON cards (company_name);"
+            "CREATE INDEX IF NOT EXISTS cards_updated ON cards (updated_at);"
+            "CREATE TABLE IF NOT EXISTS contacts ("
+            " card_id INTEGER NOT NULL REFERENCES cards (id) ON DELETE CASCADE,"
+            " kind TEXT NOT NULL,"
+            " value TEXT NOT NULL COLLATE NOCASE);"
+            "CREATE INDEX IF NOT EXISTS contacts_lookup ON contacts (kind, value);"
+            "CREATE INDEX IF NOT EXISTS contacts_card ON contacts (card_id);"
+            "CREATE VIRTUAL TABLE IF NOT EXISTS cards_fts USING fts5 ("
+            " company_name, people, contact, address, details, tokenize='unicode61');"
+        )
+        self._conn.commit()
+
+    def _write(self, card, now):
+        key = card.get('card_key') or card.get('source_key')
+        if not key:
+            raise ValueError("Card has neither a card_key nor a source_key")
+        record = export_record(card)
+        self._conn.execute(
+            "INSERT INTO cards (card_key, filename, company_name, record, created_at, updated_at)"
+            " VALUES (?, ?, ?, ?, ?, ?)"
+            " ON CONFLICT (card_key) DO UPDATE SET filename = excluded.filename,"
+            " company_name = excluded.company_name, record = excluded.record, updated_at = excluded.updated_at",
+            (key, card.get('filename'), card.get('company_name'), json.dumps(record, ensure_ascii=False), now, now)
+        )
+        card_id = self._conn.execute("SELECT id FROM cards WHERE card_key = ?", (key,)).fetchone()[0]
+        self._conn.execute("DELETE FROM contacts WHERE card_id = ?", (card_id,))
+        self._conn.executemany(
+            "INSERT INTO contacts (card_id, kind, value) VALUES (?, ?, ?)",
+            [(card_id, kind, value) for kind, value in card_contacts(card)]
+        )
+        self._conn.execute("DELETE FROM cards_fts WHERE rowid = ?", (card_id,))
+        self._conn.execute(
+            "INSERT INTO cards_fts (rowid, company_name, people, contact, address, details) VALUES (?, ?, ?, ?, ?, ?)",
+            (card_id, *_search_text(card))
+        )
+
+    def put(self, card):
+        """Insert or replace one card (committed right away)"""
+        self.put_many([card])
+
+    def put_many(self, cards):
+        """Insert or replace several cards in one transaction"""
+        now = time.time()
+        with self._lock:
+            try:
+                for card in cards:
+                    self._write(card, now)
+            except Exception:
+                self._conn.rollback()
+                raise
+            self._conn.commit()
+
+    def delete(self, card_key):
+        """Remove a card and its index entries"""
+        with self._lock:
+            row = self._conn.execute("SELECT id FROM cards WHERE card_key = ?", (card_key,)).fetchone()
+            if row:
+                self._conn.execute("DELETE FROM cards_fts WHERE rowid = ?", row)
+                self._conn.execute("DELETE FROM cards WHERE id = ?", row)
+            self._conn.commit()
+
+    def _fetch(self, sql, params):
+        with self._lock:
+            rows = self._conn.execute(sql, params).fetchall()
+        results = []
+        for key, filename, record, updated_at in rows:
+            result = json.loads(record)
+            result.update(card_key=key, filename=filename, stored_at=updated_at)
+            results.append(result)
+        return results
+
+    def get(self, card_key):
+        """The stored record of a card, or None"""
+        results = self._fetch(
+            "SELECT card_key, filename, record, updated_at FROM cards WHERE card_key = ?", (card_key,)
+        )
+        return results[0] if results else None
+
+    def find(self, company=None, person=None, email=None, phone=None, limit=SEARCH_LIMIT):
+        """
+        Indexed lookup by company or person name prefix, exact email or phone number
+
+        Names and emails match case-insensitively, phones by their digits.
+        Every given criterion has to match.
+
+        Returns:
+            list: Stored records, most recently updated first
+        """
+        conditions, params = [], []
+        if company:
+            conditions.append("company_name LIKE ? ESCAPE '\\'")
+            params.append(_like_prefix(company))
+        for kind, value, operator in (
+            ('person', person and _like_prefix(person), "LIKE ? ESCAPE '\\'"),
+            ('email', email and email.strip().lower(), "= ?"),
+            ('phone', phone and phone_digits(phone), "= ?"),
+        ):
+            if value:
+                conditions.append(f"id IN (SELECT card_id FROM contacts WHERE kind = ? AND value {operator})")
+                params += [kind, value]
+        if not conditions:
+            return self.recent(limit)
+        return self._fetch(
+            f"SELECT card_key, filename, record, updated_at FROM cards WHERE {' AND '.join(conditions)}"
+            " ORDER BY updated_at DESC LIMIT ?",
+            params + [limit]
+        )
+
+    def search(self, text, limit=SEARCH_LIMIT):
+        """
+        Cards matching free text, best matches first
+
+        An email address or a phone number is looked up in the contact index;
+        anything else (or a lookup without results) goes to the full-text
+        index, where every word has to match the start of a word on the card.
+        """
+        text = text.strip()
+        if not text:
+            return self.recent(limit)
+        if '@' in text and ' ' not in text:
+            results = self.find(email=text, limit=limit)
+            if results:
+                return results
+        if len(phone_digits(text)) >= 7 and not re.search(r'[^\d\s()+.\-/]', text):
+            results = self.find(phone=text, limit=limit)
+            if results:
+                return results
+        query = fts_query(text)
+        if not query:
+            return []
+        return self._fetch(
+            "SELECT cards.card_key, cards.filename, cards.record, cards.updated_at"
+            " FROM cards_fts JOIN cards ON cards.id = cards_fts.rowid"
+            " WHERE cards_fts MATCH ? ORDER BY cards_fts.rank LIMIT ?",
+            (query, limit)
+        )
+
+    def recent(self, limit=SEARCH_LIMIT):
+        """Most recently stored cards"""
+        return self._fetch(
+            "SELECT card_key, filename, record, updated_at FROM cards ORDER BY updated_at DESC LIMIT ?", (limit,)
+        )
+
+    def count(self):
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM cards").fetchone()[0]
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+def _like_prefix(text):
+    """LIKE pattern matching values starting with text"""
+    return text.strip().replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_') + '%'
+
+
+_card_store = None
+_card_store_lock = threading.Lock()
+
+
+def get_card_store():
+    """Return the process-wide card store, or None if it is disabled"""
+    global _card_store
+    if not STORE_PATH:
+        return None
+    with _card_store_lock:
+        if _card_store is None:
+            _card_store = CardStore(STORE_PATH)
+    return _card_store
@@ -0,0 +1,213 @@
+from dataclasses import dataclass
+from io import BytesIO
+import os
+from PIL import Image, ImageOps
+
+
+# Preprocessing configuration
+MAX_LONG_EDGE = int(os.environ.get('IMAGE_MAX_EDGE', 1600))
+MAX_IMAGE_BYTES = int(os.environ.get('IMAGE_MAX_BYTES', 400 * 1024))
+MIN_LONG_EDGE = 640  # Below this card text stops being legible
+JPEG_QUALITIES = (85, 75, 65, 55)
+
+# Previews kept in the session instead of decoded images
+THUMBNAIL_EDGE = int(os.environ.get('THUMBNAIL_EDGE', 480))
+THUMBNAIL_BYTES = 64 * 1024
+
+# Longest side of the proxy image the crop editor works on
+EDITOR_PREVIEW_EDGE = int(os.environ.get('EDITOR_PREVIEW_EDGE', 1024))
+
+# EXIF orientation tag, values 5-8 swap width and height
+ORIENTATION_TAG = 0x0112
+INGEST_QUALITY = 95
+
+
+@dataclass
+class PreparedImage:
+    """JPEG bytes ready for transport plus before/after size information"""
+    data: bytes
+    size: tuple
+    original_size: tuple
+    original_bytes: int = None
+
+    @property
+    def stats(self):
+        """Before/after sizes as a plain dict for reporting"""
+        return {
+            'original_bytes': self.original_bytes,
+            'prepared_bytes': len(self.data),
+            'original_size': f"{self.original_size[0]}x{self.original_size[1]}",
+            'prepared_size': f"{self.size[0]}x{self.size[1]}"
+        }
+
+
+def _open(source):
+    """Open bytes, a file-like object or a PIL Image; return (image, byte count or None)"""
+    if isinstance(source, Image.Image):
+        return source, None
+    if isinstance(source, bytes):
+        data = source
+    elif hasattr(source, 'getvalue'):
+        data = source.getvalue()
+    else:
+        data = source.read()
+    return Image.open(BytesIO(data)), len(data)
+
+
+def _orientation(image):
+    try:
+        return image.getexif().get(ORIENTATION_TAG, 1)
+    except Exception:
+        return 1
+
+
+def _oriented_size(image):
+    """Size of the image once its EXIF orientation is applied"""
+    width, height = image.size
+    return (height, width) if _orientation(image) in (5, 6, 7, 8) else (width, height)
+
+
+def _upright(image):
+    """Apply the EXIF orientation (exif_transpose copies the image even when there is nothing to do)"""
+    if _orientation(image) in (None, 1):
+        return image
+    return ImageOps.exif_transpose(image)
+
+
+def normalize_orientation(data):
+    """
+    Apply the EXIF orientation of uploaded bytes once, at ingest
+
+    Returns:
+        bytes: The data unchanged when it is already upright, otherwise a
+        high quality JPEG with the rotation baked in (and no orientation tag).
+        Unreadable data is returned as is so the error surfaces in prepare_image.
+    """
+    try:
+        image = Image.open(BytesIO(data))
+    except Exception:
+        return data
+    if _orientation(image) in (None, 1):
+        return data
+    return _encode(to_rgb(_upright(image)), INGEST_QUALITY)
+
+
+def to_rgb(image):
+    """Convert palette, alpha and other exotic modes to RGB (or keep L)"""
+    if image.mode == 'P':
+        image = image.convert('RGBA' if 'transparency' in image.info else 'RGB')
+
+    if image.mode in ('RGBA', 'LA', 'PA', 'RGBa', 'La'):
+        # Flatten transparency onto white, JPEG has no alpha channel
+        rgba = image.convert('RGBA')
+        background = Image.new('RGB', rgba.size, (255, 255, 255))
+        background.paste(rgba, mask=rgba.getchannel('A'))
+        return background
+
+    if image.mode not in ('RGB', 'L'):
+        return image.convert('RGB')
+    return image
+
+
+def _encode(image, quality):
+    buffer = BytesIO()
+    image.save(buffer, format='JPEG', quality=quality, optimize=True)
+    return buffer.getvalue()
+
+
+def prepare_image(source, max_edge=None, max_bytes=None):
+    """
+    Downscale and recompress a business card image before it is sent to the model
+
+    Args:
+        source: PIL Image, raw image bytes or a file-like object (e.g. a Streamlit upload)
+        max_edge: Maximum length of the longest side in pixels (defaults to MAX_LONG_EDGE)
+        max_bytes: Byte budget for the encoded JPEG (defaults to MAX_IMAGE_BYTES)
+
+    Returns:
+        PreparedImage: Encoded JPEG with before/after size information
+    """
+    max_edge = max_edge or MAX_LONG_EDGE
+    max_bytes = max_bytes or MAX_IMAGE_BYTES
+
+    image, original_bytes = _open(source)
+    original_size = _oriented_size(image)
+
+    # Let the JPEG decoder skip detail we would throw away anyway (DCT scaling).
+    # Only for images we opened ourselves, draft() changes the caller's image in place
+    if image is not source and image.format == 'JPEG' and max(original_size) > max_edge:
+        image.draft(image.mode, (max_edge, max_edge))
+
+    # Phone photos are often stored sideways with an orientation tag the model never sees
+    image = to_rgb(_upright(image))
+    if max(image.size) > max_edge:
+        image = image.copy() if image is source else image
+        image.thumbnail((max_edge, max_edge), Image.LANCZOS)
+
+    # Step down JPEG quality, then resolution, until the byte budget is met
+    for quality in JPEG_QUALITIES:
+        data = _encode(image, quality)
+        if len(data) <= max_bytes:
+            break
+    while len(data) > max_bytes and max(image.size) > MIN_LONG_EDGE:
+        scale = max(0.75, MIN_LONG_EDGE / max(image.size))
+        image = image.resize((round(image.width * scale), round(image.height * scale)), Image.LANCZOS)
+        data = _encode(image, JPEG_QUALITIES[-1])
+
+    return PreparedImage(
+        data=data,
+        size=image.size,
+        original_size=original_size,
+        original_bytes=original_bytes
+    )
+
+
+def make_thumbnail(source, max_edge=THUMBNAIL_EDGE):
+    """Small JPEG preview (bytes) of a card image for display"""
+    return prepare_image(source, max_edge=max_edge, max_bytes=THUMBNAIL_BYTES).data
+
+
+def make_preview(data, max_edge=EDITOR_PREVIEW_EDGE):
+    """
+    Bounded-size RGB proxy of stored image bytes for interactive editing
+
+    Returns:
+        tuple: (preview, scale) where a full resolution coordinate is the preview coordinate times scale
+    """
+    image = Image.open(BytesIO(data))
+    full_width = _oriented_size(image)[0]
+    if image.format == 'JPEG':
+        image.draft(image.mode, (max_edge, max_edge))
+    image = to_rgb(_upright(image))
+    if max(image.size) > max_edge:
+        image.thumbnail((max_edge, max_edge), Image.LANCZOS)
+    return image, full_width / image.width
+
+
+def scale_box(box, scale):
+    """Map a crop box (left, top, width, height dict) from preview to full resolution coordinates"""
+    return {key: round(box[key] * scale) for key in ('left', 'top', 'width', 'height')}
+
+
+def apply_edit(data, box=None, rotation=0):
+    """
+    Crop and rotate stored image bytes at full resolution
+
+    Args:
+        data: Stored image bytes
+        box: Full resolution crop box (dict with left, top, width and height), None keeps the whole image
+        rotation: Counter-clockwise rotation in degrees
+
+    Returns:
+        PIL.Image: The edited image
+    """
+    image = to_rgb(_upright(Image.open(BytesIO(data))))
+    if box:
+        left = min(max(0, box['left']), image.width - 1)
+        top = min(max(0, box['top']), image.height - 1)
+        right = min(image.width, left + max(1, box['width']))
+        bottom = min(image.height, top + max(1, box['height']))
+        image = image.crop((left, top, right, bottom))
+    if rotation:
+        image = image.rotate(rotation, expand=True)
+    return image
@@ -0,0 +1,207 @@
+from collections import deque
+import os
+import threading
+import time
+import uuid
+
+from utils.metrics import ExtractionMetrics, collect, report
+
+
+# Queue configuration
+JOB_WORKERS = int(os.environ.get('JOB_WORKERS', 8))
+JOB_RETENTION = int(os.environ.get('JOB_RETENTION', 3600))  # seconds a finished job stays reattachable
+
+
+class Job:
+    """Results of one extraction job, filled in by the queue's workers
+
+    `keys` is the order the results belong in (the session decides it and
+    may extend it); `results` maps each finished key to its result.
+    """
+
+    def __init__(self, max_parallel=None):
+        self.job_id = uuid.uuid4().hex
+        self.created_at = time.time()
+        self.started_at = None
+        self.finished_at = None
+        self.keys = []
+        self.results = {}
+        self.metrics = ExtractionMetrics()
+        self.max_parallel = max_parallel
+        self.queued = 0      # tasks waiting for a worker
+        self.running = 0     # tasks being worked on
+        # The current run: tasks submitted since the job was last idle
+        self.run_started = None
+        self.run_keys = 0
+
+    @property
+    def active(self):
+        return bool(self.queued or self.running)
+
+    @property
+    def status(self):
+        if self.running or (self.queued and self.started_at):
+            return 'running'
+        return 'queued' if self.queued else 'done'
+
+    def progress(self):
+        """(finished, total) over the job's keys"""
+        return sum(key in self.results for key in self.keys), len(self.keys)
+
+
+class JobQueue:
+    """Process-local queue of extraction jobs served by a pool of worker threads
+
+    A job is a set of tasks, each a callable producing the results for a
+    list of keys. Tasks can be added to a job at any time; a job that was
+    idle starts a new run with fresh metrics. Jobs outlive the Streamlit script run (and session) that
+    submitted them, so a rerun or a browser refresh only has to look the job
+    up again by its ID. Tasks run in submission order; a job with
+    max_parallel set never has more tasks running at once. Finished jobs are
+    kept for `retention` seconds.
+
+    Args:
+        workers: Number of worker threads
+        retention: Seconds a finished job can still be looked up
+    """
+
+    def __init__(self, workers=JOB_WORKERS, retention=JOB_RETENTION):
+        self.workers = workers
+        self.retention = retention
+        self._jobs = {}
+        self._tasks = deque()
+        self._cond = threading.Condition()
+        self._busy = 0
+        self._busy_seconds = 0.0
+        self._busy_since = {}
+        self._started = time.monotonic()
+        self._completed_tasks = 0
+        self._threads = [
+            threading.Thread(target=self._run, name=f'job-worker-{n}', daemon=True) for n in range(workers)
+        ]
+        for thread in self._threads:
+            thread.start()
+
+    def create(self, max_parallel=None):
+        """Register a new, empty job"""
+        job = Job(max_parallel)
+        with self._cond:
+            self._prune()
+            self._jobs[job.job_id] = job
+        return job
+
+    def get(self, job_id):
+        """The job with this ID, or None if it is unknown or expired"""
+        with self._cond:
+            self._prune()
+            return self._jobs.get(job_id)
+
+    def submit(self, job, keys, fn, *args):
+        """
+        Queue fn(*args) as a task of job; it must return one result per key,
+        in order. If it raises, every key gets the exception as its result.
+        """
+        keys = list(keys)
+        with self._cond:
+            if not job.active:
+                job.run_started = time.time()
+                job.run_keys = 0
+                job.metrics = ExtractionMetrics()
+            job.keys += [key for key in keys if key not in job.keys]
+            job.run_keys += len(keys)
+            job.queued += 1
+            job.finished_at = None
+            self._tasks.append((job, keys, fn, args, time.monotonic()))
+            self._cond.notify()
+
+    def record(self, job, key, result):
+        """Store a result produced outside the queue (e.g. streamed in the script thread)"""
+        with self._cond:
+            if key not in job.keys:
+                job.keys.append(key)
+            job.results[key] = result
+
+    def cancel(self, job, keep=()):
+        """
+        Drop the job's tasks that have not started, except those covering any
+        of the keys in keep; returns how many were dropped
+        """
+        keep = set(keep)
+        with self._cond:
+            dropped = [task for task in self._tasks if task[0] is job and keep.isdisjoint(task[1])]
+            for task in dropped:
+                self._tasks.remove(task)
+                job.run_keys -= len(task[1])
+            job.queued -= len(dropped)
+            if not job.active:
+                job.finished_at = time.time()
+        return len(dropped)
+
+    def stats(self):
+        """Queue depth, worker utilization and job counts"""
+        with self._cond:
+            now = time.monotonic()
+            busy_seconds = self._busy_seconds + sum(now - since for since in self._busy_since.values())
+            return {
+                'workers': self.workers,
+                'busy': self._busy,
+                'queued_tasks': len(self._tasks),
+                'completed_tasks': self._completed_tasks,
+                'active_jobs': sum(job.active for job in self._jobs.values()),
+                'jobs': len(self._jobs),
+                'utilization': busy_seconds / (self.workers * (now - self._started)) if self.workers else 0.0,
+            }
+
+    def _prune(self):
+        cutoff = time.time() - self.retention
+        for job_id in [job_id for job_id, job in self._jobs.items()
+                       if job.finished_at is not None and job.finished_at < cutoff]:
+            del self._jobs[job_id]
+
+    def _next_task(self):
+        """First queued task whose job is below its parallelism limit (call with the lock held)"""
+        for task in self._tasks:
+            job = task[0]
+            if job.max_parallel is None or job.running < job.max_parallel:
+                self._tasks.remove(task)
+                return task
+        return None
+
+    def _run(self):
+        worker = threading.current_thread().name
+        while True:
+            with self._cond:
+                task = self._next_task()
+                while task is None:
+                    self._cond.wait()
+                    task = self._next_task()
+                job, keys, fn, args, queued_at = task
+                job.queued -= 1
+                job.running += 1
+                job.started_at = job.started_at or time.time()
+                self._busy += 1
+                self._busy_since[worker] = time.monotonic()
+
+            report('job_queue_seconds', time.monotonic() - queued_at)
+            with collect() as metrics:
+                try:
+                    results = list(fn(*args))
+                    if len(results) != len(keys):
+                        raise ValueError(f"Task returned {len(results)} results for {len(keys)} keys")
+                except Exception as e:
+                    results = [e] * len(keys)
+
+            with self._cond:
+                job.results.update(zip(keys, results))
+                job.metrics.merge(metrics)
+                job.running -= 1
+                if not job.active:
+                    job.finished_at = time.time()
+                elapsed = time.monotonic() - self._busy_since.pop(worker)
+                self._busy_seconds += elapsed
+                self._busy -= 1
+                self._completed_tasks += 1
+                # A slot of this job may have opened up for a task held back by max_parallel
+                self._cond.notify_all()
+            report('job_tasks', 1)
+            report('job_busy_seconds', elapsed)
@@ -0,0 +1,237 @@
+from collections import defaultdict
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import threading
+import time
+
+
+# Callbacks receiving (stage, seconds) for every timed stage of an extraction
+stage_listeners = []
+
+# Callbacks receiving (name, value, labels) for every reported quantity
+# (image_bytes, prompt_tokens, completion_tokens, model_calls, model_retries,
+# and the per-pass counters of adaptive vision detail)
+value_listeners = []
+
+# Collectors active on the current thread, innermost last
+_local = threading.local()
+
+
+# Compared by identity so nested collectors can be told apart
+@dataclass(eq=False)
+class ExtractionMetrics:
+    """Stage timings and reported quantities gathered by collect()"""
+    stages: dict = field(default_factory=lambda: defaultdict(float))   # stage -> total seconds
+    counts: dict = field(default_factory=lambda: defaultdict(int))     # stage -> times entered
+    values: dict = field(default_factory=lambda: defaultdict(float))   # name -> total
+    labeled: dict = field(default_factory=lambda: defaultdict(float))  # (name, sorted label pairs) -> total
+    models: set = field(default_factory=set)
+
+    def merge(self, other):
+        """Add another collection into this one (e.g. to summarize a batch of requests)"""
+        for stage, seconds in other.stages.items():
+            self.stages[stage] += seconds
+            self.counts[stage] += other.counts[stage]
+        for name, value in other.values.items():
+            self.values[name] += value
+        for key, value in other.labeled.items():
+            self.labeled[key] += value
+        self.models |= other.models
+        return self
+
+    def as_dict(self):
+        return {
+            'stages': dict(self.stages),
+            'counts': dict(self.counts),
+            'values': dict(self.values),
+            'labeled': [[name, dict(labels), value] for (name, labels), value in self.labeled.items()],
+            'models': sorted(self.models),
+        }
+
+
+def _collectors():
+    return getattr(_local, 'collectors', None) or []
+
+
+@contextmanager
+def collect():
+    """Gather every stage timed and value reported on this thread inside the block"""
+    metrics = ExtractionMetrics()
+    if not hasattr(_local, 'collectors'):
+        _local.collectors = []
+    _local.collectors.append(metrics)
+    try:
+        yield metrics
+    finally:
+        _local.collectors.remove(metrics)
+
+
+@contextmanager
+def timed_stage(stage):
+    """Time a block and report it to stage_listeners (free when nobody listens)"""
+    collectors = _collectors()
+    if not stage_listeners and not collectors:
+        yield
+        return
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - start
+        for metrics in collectors:
+            metrics.stages[stage] += elapsed
+            metrics.counts[stage] += 1
+        for listener in list(stage_listeners):
+            listener(stage, elapsed)
+
+
+def report(name, value, **labels):
+    """Report a quantity to value_listeners and the active collectors; a 'model' label is recorded"""
+    for metrics in _collectors():
+        metrics.values[name] += value
+        if labels:
+            metrics.labeled[(name, tuple(sorted(labels.items())))] += value
+        if labels.get('model'):
+            metrics.models.add(labels['model'])
+    for listener in list(value_listeners):
+        listener(name, value, labels)
+
+
+# Histogram buckets (seconds) for stage durations
+STAGE_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+# HELP lines for the counters fed by report()
+VALUE_HELP = {
+    'image_bytes': "Encoded image bytes sent to the model",
+    'prompt_tokens': "Prompt tokens billed by the provider",
+    'completion_tokens': "Completion tokens billed by the provider",
+    'model_calls': "Model requests made through the scheduler",
+    'model_retries': "Extra attempts spent retrying model requests",
+    'low_detail_accepted': "Cards whose low detail result passed the checks",
+    'detail_escalations': "Cards read again at high detail after failing the checks",
+    'low_pass_cards': "Cards read in adaptive low detail passes",
+    'low_pass_tokens': "Tokens spent on adaptive low detail passes",
+    'low_pass_seconds': "Seconds spent on adaptive low detail passes",
+    'high_pass_cards': "Cards read in adaptive high detail passes",
+    'high_pass_tokens': "Tokens spent on adaptive high detail passes",
+    'high_pass_seconds': "Seconds spent on adaptive high detail passes",
+    'cascade_routes': "Model cascade decisions by model and outcome",
+    'cascade_seconds': "Seconds spent per model of the cascade",
+    'job_tasks': "Extraction job tasks finished by the job queue workers",
+    'job_queue_seconds': "Seconds job tasks waited for a worker",
+    'job_busy_seconds': "Seconds job queue workers spent running tasks",
+    's3_staging_reuse': "Images staged without an upload, by source of the reused object",
+}
+
+
+def _format_labels(labels):
+    if not labels:
+        return ''
+    escaped = (
+        (key, str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n'))
+        for key, value in labels
+    )
+    return '{' + ','.join(f'{key}="{value}"' for key, value in escaped) + '}'
+
+
+class MetricsRegistry:
+    """Process-wide stage histograms and value counters in the Prometheus text format
+
+    install() subscribes the registry to stage_listeners and value_listeners;
+    nothing is recorded until then. Gauges are read when rendering.
+    """
+
+    def __init__(self, prefix='card_reader', buckets=STAGE_BUCKETS):
+        self.prefix = prefix
+        self.buckets = buckets
+        self._lock = threading.Lock()
+        self._histograms = {}                  # stage -> [bucket counts..., count, sum]
+        self._counters = defaultdict(float)    # (name, labels) -> total
+        self._gauges = {}                      # name -> (help, callable returning the current value)
+
+    def install(self):
+        """Start recording (safe to call on every rerun)"""
+        if self.observe_stage not in stage_listeners:
+            stage_listeners.append(self.observe_stage)
+        if self.observe_value not in value_listeners:
+            value_listeners.append(self.observe_value)
+        return self
+
+    def gauge(self, name, help_text, read):
+        """Expose the value returned by read() as a gauge, sampled on every render (replaces a gauge of that name)"""
+        with self._lock:
+            self._gauges[name] = (help_text, read)
+
+    def observe_stage(self, stage, seconds):
+        with self._lock:
+            histogram = self._histograms.setdefault(stage, [0] * (len(self.buckets) + 2))
+            for i, bound in enumerate(self.buckets):
+                if seconds <= bound:
+                    histogram[i] += 1
+            histogram[-2] += 1
+            histogram[-1] += seconds
+
+    def observe_value(self, name, value, labels):
+        with self._lock:
+            self._counters[(name, tuple(sorted(labels.items())))] += value
+
+    def render(self):
+        """All metrics in the Prometheus text exposition format"""
+        with self._lock:
+            histograms = {stage: list(values) for stage, values in self._histograms.items()}
+            counters = dict(self._counters)
+            gauges = dict(self._gauges)
+
+        lines = []
+        name = f'{self.prefix}_stage_seconds'
+        lines.append(f'# HELP {name} Time spent in each extraction stage')
+        lines.append(f'# TYPE {name} histogram')
+        for stage, histogram in sorted(histograms.items()):
+            for bound, count in zip(self.buckets, histogram):
+                lines.append(f'{name}_bucket{_format_labels([("stage", stage), ("le", bound)])} {count}')
+            lines.append(f'{name}_bucket{_format_labels([("stage", stage), ("le", "+Inf")])} {histogram[-2]}')
+            lines.append(f'{name}_sum{_format_labels([("stage", stage)])} {histogram[-1]}')
+            lines.append(f'{name}_count{_format_labels([("stage", stage)])} {histogram[-2]}')
+
+        for value_name in sorted({key[0] for key in counters}):
+            name = f'{self.prefix}_{value_name}_total'
+            lines.append(f'# HELP {name} {VALUE_HELP.get(value_name, value_name)}')
+            lines.append(f'# TYPE {name} counter')
+            for (counter, labels), total in sorted(counters.items()):
+                if counter == value_name:
+                    lines.append(f'{name}{_format_labels(labels)} {total:.15g}')
+
+        for gauge_name, (help_text, read) in sorted(gauges.items()):
+            name = f'{self.prefix}_{gauge_name}'
+            lines.append(f'# HELP {name} {help_text}')
+            lines.append(f'# TYPE {name} gauge')
+            lines.append(f'{name} {read():.15g}')
+        return '\n'.join(lines) + '\n'
+
+
+# Shared registry for the process
+registry = MetricsRegistry()
+
+
+def serve(port, host='0.0.0.0'):
+    """Expose registry.render() at /metrics on a daemon thread; returns the server"""
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path.split('?')[0] != '/metrics':
+                self.send_error(404)
+                return
+            body = registry.render().encode('utf-8')
+            self.send_response(200)
+            self.send_header('Content-Type', 'text/plain; version=0.0.4; charset=utf-8')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass
+
+    server = ThreadingHTTPServer((host, port), Handler)
+    threading.Thread(target=server.serve_forever, name='metrics-server', daemon=True).start()
+    return server
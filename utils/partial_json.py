@@ -0,0 +1,59 @@
+import json
+
+
+class PartialObjectParser:
+    """Incrementally parse a streamed JSON object, one top-level field at a time
+
+    Text is fed in arbitrary chunks. As soon as a top-level member of the
+    first JSON object in the stream is complete (its trailing ',' or the
+    closing '}' has arrived), feed() returns it as a (key, value) pair. A
+    leading '[' is allowed, in which case the first object in the array is
+    parsed. Anything before the first '{' (e.g. a code fence) is skipped.
+    """
+
+    def __init__(self):
+        self.buffer = ''
+        self.done = False
+        self._pos = 0
+        self._depth = 0
+        self._object_depth = None
+        self._member_start = None
+        self._in_string = False
+        self._escape = False
+
+    def feed(self, text):
+        """Add streamed text and return the newly completed (key, value) pairs"""
+        self.buffer += text
+        completed = []
+        while self._pos < len(self.buffer) and not self.done:
+            char = self.buffer[self._pos]
+            if self._in_string:
+                if self._escape:
+                    self._escape = False
+                elif char == '\\':
+                    self._escape = True
+                elif char == '"':
+                    self._in_string = False
+            elif char == '"':
+                self._in_string = True
+            elif char in '{[':
+                self._depth += 1
+                if char == '{' and self._object_depth is None:
+                    self._object_depth = self._depth
+                    self._member_start = self._pos + 1
+            elif char in '}]':
+                if self._depth == self._object_depth:
+                    completed.extend(self._member(self._pos))
+                    self.done = True
+                self._depth -= 1
+            elif char == ',' and self._depth == self._object_depth:
+                completed.extend(self._member(self._pos))
+                self._member_start = self._pos + 1
+            self._pos += 1
+        return completed
+
+    def _member(self, end):
+        text = self.buffer[self._member_start:end].strip()
+        if not text:
+            return []
+        return list(json.loads('{' + text + '}').items())
@@ -0,0 +1,103 @@
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+
+
+# Cache configuration
+CACHE_PATH = os.environ.get('RESULT_CACHE_PATH', os.path.join('.cache', 'card_results.sqlite3'))
+CACHE_MAX_ENTRIES = int(os.environ.get('RESULT_CACHE_MAX_ENTRIES', 10000))
+CACHE_MAX_AGE = int(os.environ.get('RESULT_CACHE_MAX_AGE', 30 * 24 * 3600))  # seconds
+
+
+def content_key(image_bytes, fingerprint):
+    """Cache key for normalized image bytes under a given prompt/model fingerprint"""
+    digest = hashlib.sha256(image_bytes)
+    digest.update(fingerprint.encode('utf-8'))
+    return digest.hexdigest()
+
+
+class ResultCache:
+    """On-disk cache of parsed extraction results keyed by image content hash
+
+    Entries are evicted when older than max_age seconds or, least recently
+    used first, when the cache holds more than max_entries results. The
+    prompt/model fingerprint is part of the key, so processes configured
+    with different models or detail share the file without evicting each
+    other: entries under another fingerprint simply miss.
+    """
+
+    def __init__(self, path=CACHE_PATH, max_entries=CACHE_MAX_ENTRIES, max_age=CACHE_MAX_AGE):
+        self.path = path
+        self.max_entries = max_entries
+        self.max_age = max_age
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS results ("
+            " key TEXT PRIMARY KEY,"
+            " fingerprint TEXT NOT NULL,"
+            " result TEXT NOT NULL,"
+            " created_at REAL NOT NULL,"
+            " last_used REAL NOT NULL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS results_last_used ON results (last_used)")
+        self._conn.commit()
+
+    def get(self, image_bytes, fingerprint):
+        """Return the cached result dict, or None on a miss"""
+        key = content_key(image_bytes, fingerprint)
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT result FROM results WHERE key = ? AND created_at >= ?",
+                (key, now - self.max_age)
+            ).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+            self._conn.execute("UPDATE results SET last_used = ? WHERE key = ?", (now, key))
+            self._conn.commit()
+            self.hits += 1
+        return json.loads(row[0])
+
+    def put(self, image_bytes, fingerprint, result):
+        """Store a parsed result and evict entries beyond the age/size limits"""
+        key = content_key(image_bytes, fingerprint)
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO results (key, fingerprint, result, created_at, last_used)"
+                " VALUES (?, ?, ?, ?, ?)",
+                (key, fingerprint, json.dumps(result), now, now)
+            )
+            self._evict(now)
+            self._conn.commit()
+
+    def _evict(self, now):
+        self._conn.execute("DELETE FROM results WHERE created_at < ?", (now - self.max_age,))
+        self._conn.execute(
+            "DELETE FROM results WHERE key IN ("
+            " SELECT key FROM results ORDER BY last_used DESC LIMIT -1 OFFSET ?)",
+            (self.max_entries,)
+        )
+
+    def clear(self):
+        """Remove every cached result"""
+        with self._lock:
+            self._conn.execute("DELETE FROM results")
+            self._conn.commit()
+
+    def stats(self):
+        """Hit/miss counters for this process and the number of stored entries"""
+        with self._lock:
+            entries = self._conn.execute("SELECT COUNT(*) FROM results").fetchone()[0]
+        return {'hits': self.hits, 'misses': self.misses, 'entries': entries}
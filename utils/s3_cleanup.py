@@ -0,0 +1,171 @@
+import heapq
+import queue
+import random
+import threading
+import time
+from utils.metrics import timed_stage
+
+
+# S3 accepts at most 1000 keys per DeleteObjects request
+MAX_DELETE_BATCH = 1000
+
+
+class S3CleanupQueue:
+    """Deletes staged S3 objects on a background thread
+
+    Keys are collected for up to `linger` seconds and removed with
+    multi-object DeleteObjects calls. Keys that fail are retried up to
+    max_attempts times, each retry waiting retry_delay * 2**(attempt - 1)
+    seconds with jitter (so a SlowDown is not answered with an immediate
+    new request), and then counted as failed (see failed_keys).
+
+    Args:
+        get_client: Callable returning the S3 client to use
+        bucket: Bucket the staged objects live in
+        claim: Optional callable given the keys of a batch right before they
+            are deleted; only the keys it returns are deleted, the others
+            are skipped (e.g. because the object is in use again)
+        released: Optional callable given the claimed keys once their
+            DeleteObjects call has returned, whatever its outcome
+    """
+
+    def __init__(self, get_client, bucket, batch_size=MAX_DELETE_BATCH, linger=0.5, max_attempts=3,
+                 retry_delay=1.0, claim=None, released=None):
+        self.get_client = get_client
+        self.bucket = bucket
+        self.batch_size = min(batch_size, MAX_DELETE_BATCH)
+        self.linger = linger
+        self.max_attempts = max_attempts
+        self.retry_delay = retry_delay
+        self.claim = claim
+        self.released = released
+        self.deleted = 0
+        self.skipped = 0
+        self.retried = 0
+        self.failed_keys = []
+        self._pending = 0
+        self._queue = queue.Queue()
+        self._retries = []  # heap of (not_before, key, attempt)
+        self._lock = threading.Condition()
+        self._closed = False
+        self._thread = threading.Thread(target=self._run, name='s3-cleanup', daemon=True)
+        self._thread.start()
+
+    def enqueue(self, key):
+        """Schedule a staged object for deletion"""
+        if self._closed:
+            raise RuntimeError("S3 cleanup queue is closed")
+        with self._lock:
+            self._pending += 1
+        self._queue.put((key, 1))
+
+    def flush(self):
+        """Block until every queued key has been deleted or given up on (retries included)"""
+        with self._lock:
+            while self._pending:
+                self._lock.wait()
+
+    def close(self):
+        """Drain outstanding deletions and stop the worker thread"""
+        if self._closed:
+            return
+        self._closed = True
+        self._queue.put(None)
+        self._thread.join()
+
+    def stats(self):
+        """Counts of pending, deleted, skipped, retried and failed deletions"""
+        with self._lock:
+            return {'pending': self._pending, 'deleted': self.deleted, 'skipped': self.skipped,
+                    'retried': self.retried, 'failed': len(self.failed_keys)}
+
+    def _due_retries(self, force=False):
+        """Pop the retries whose backoff has passed or ends within linger (all of them with force)"""
+        # Retries falling due close together share one request
+        cutoff = time.monotonic() + self.linger
+        due = []
+        with self._lock:
+            while self._retries and (force or self._retries[0][0] <= cutoff):
+                _, key, attempt = heapq.heappop(self._retries)
+                due.append((key, attempt))
+        return due
+
+    def _next_retry_in(self):
+        with self._lock:
+            return max(0.0, self._retries[0][0] - time.monotonic()) if self._retries else None
+
+    def _run(self):
+        while True:
+            try:
+                # Wake up for the next retry even when nothing new is queued
+                item = self._queue.get(timeout=self._next_retry_in())
+            except queue.Empty:
+                item = False
+
+            batch = self._due_retries()
+            stop = item is None
+            if item:
+                batch.append(item)
+                # Give other cards a moment to add their keys to the same request
+                while len(batch) < self.batch_size:
+                    try:
+                        item = self._queue.get(timeout=self.linger)
+                    except queue.Empty:
+                        break
+                    if item is None:
+                        stop = True
+                        break
+                    batch.append(item)
+
+            if batch:
+                self._delete(batch)
+
+            if stop:
+                # Deletions queued before close() and retries still waiting get one last try
+                batch = self._due_retries(force=True)
+                while not self._queue.empty():
+                    batch.append(self._queue.get())
+                for start in range(0, len(batch), self.batch_size):
+                    self._delete(batch[start:start + self.batch_size])
+                return
+
+    def _delete(self, batch):
+        # A key queued twice is deleted (and retried) once
+        attempts = {}
+        for key, attempt in batch:
+            attempts[key] = max(attempts.get(key, 0), attempt)
+        keys = list(attempts)
+        claimed = set(self.claim(keys)) if self.claim else set(keys)
+        errors = set()
+        if claimed:
+            try:
+                with timed_stage('delete'):
+                    response = self.get_client().delete_objects(
+                        Bucket=self.bucket,
+                        Delete={'Objects': [{'Key': key} for key in keys if key in claimed], 'Quiet': True}
+                    )
+                errors = {error['Key'] for error in response.get('Errors', [])}
+            except Exception:
+                errors = set(claimed)
+            finally:
+                if self.released:
+                    self.released(claimed)
+
+        with self._lock:
+            self._pending -= len(batch) - len(attempts)
+            for key, attempt in attempts.items():
+                if key not in claimed:
+                    self.skipped += 1
+                    self._pending -= 1
+                elif key not in errors:
+                    self.deleted += 1
+                    self._pending -= 1
+                elif attempt < self.max_attempts and not self._closed:
+                    # Still pending, retried once its backoff has passed
+                    delay = self.retry_delay * 2 ** (attempt - 1) * random.uniform(0.5, 1.5)
+                    heapq.heappush(self._retries, (time.monotonic() + delay, key, attempt + 1))
+                    self.retried += 1
+                else:
+                    self.failed_keys.append(key)
+                    self._pending -= 1
+            self._lock.notify_all()
@@ -0,0 +1,168 @@
+import hashlib
+import heapq
+from io import BytesIO
+import os
+import threading
+import time
+
+from utils.metrics import report, timed_stage
+
+
+# Staging configuration
+PRESIGN_EXPIRES = int(os.environ.get('S3_PRESIGN_EXPIRES', 36000))      # seconds (10 hours)
+PRESIGN_MIN_REMAINING = int(os.environ.get('S3_PRESIGN_MIN_REMAINING', 600))  # reuse URLs valid this much longer
+PRESIGN_CACHE_SIZE = int(os.environ.get('S3_PRESIGN_CACHE_SIZE', 10000))
+
+
+def staging_key(image_bytes):
+    """Content-addressed S3 key: identical images always stage under the same key"""
+    return f"card_{hashlib.sha256(image_bytes).hexdigest()}.jpg"
+
+
+def _not_found(error):
+    code = str(getattr(error, 'response', {}).get('Error', {}).get('Code', ''))
+    return code in ('404', 'NoSuchKey', 'NotFound')
+
+
+class S3Stager:
+    """Stages images in S3 under content-addressed keys and hands out presigned URLs
+
+    acquire() returns a URL for an image, uploading it only when no object
+    with its key exists yet, and release() gives it back. Every staged key
+    is reference counted; when the last user releases it the key is queued
+    for deletion, and a key acquired again before the deletion runs is
+    skipped by the cleanup queue (see claim()). Presigned URLs are cached per
+    key until they have less than min_remaining seconds left, and concurrent
+    acquires of one image wait for a single upload, so retries and duplicate
+    images skip the upload, the existence check and the signing. Reference
+    counts are per process: objects found with head_object may still be
+    deleted by the process that uploaded them.
+
+    Args:
+        get_client: Callable returning the S3 client to use
+        bucket: Bucket to stage images in
+        delete: Callable scheduling a key for deletion (e.g. S3CleanupQueue.enqueue)
+    """
+
+    def __init__(self, get_client, bucket, delete, expires=PRESIGN_EXPIRES,
+                 min_remaining=PRESIGN_MIN_REMAINING, max_urls=PRESIGN_CACHE_SIZE):
+        self.get_client = get_client
+        self.bucket = bucket
+        self.delete = delete
+        self.expires = expires
+        self.min_remaining = min_remaining
+        self.max_urls = max_urls
+        self.uploads = 0
+        self.existing = 0
+        self.url_hits = 0
+        self._refs = {}         # key -> extractions using the object
+        self._urls = {}         # key -> (url, expires_at)
+        self._deleting = set()  # keys claimed by the cleanup queue, not yet deleted
+        self._staging = set()   # keys being checked, uploaded and signed by a thread
+        self._cond = threading.Condition()
+
+    def acquire(self, image_bytes):
+        """Stage an image (if needed) and return (presigned URL, key); pair with release(key)"""
+        key = staging_key(image_bytes)
+        with self._cond:
+            # Wait for an object being deleted (it is uploaded again afterwards) or
+            # being staged by another thread (its URL is reused)
+            while key in self._deleting or key in self._staging:
+                self._cond.wait()
+            self._refs[key] = self._refs.get(key, 0) + 1
+            cached = self._urls.get(key)
+            if cached and cached[1] - time.time() > self.min_remaining:
+                self.url_hits += 1
+                report('s3_staging_reuse', 1, source='url_cache')
+                return cached[0], key
+            self._staging.add(key)
+
+        try:
+            s3 = self.get_client()
+            # Another server process may have staged the same image
+            exists = self._exists(s3, key)
+            if exists:
+                report('s3_staging_reuse', 1, source='existing_object')
+            else:
+                with timed_stage('upload'):
+                    s3.upload_fileobj(BytesIO(image_bytes), self.bucket, key)
+            with timed_stage('presign'):
+                url = s3.generate_presigned_url(
+                    'get_object',
+                    Params={'Bucket': self.bucket, 'Key': key},
+                    ExpiresIn=self.expires
+                )
+        except Exception:
+            with self._cond:
+                self._staging.discard(key)
+                self._cond.notify_all()
+            self.release(key)
+            raise
+
+        with self._cond:
+            if exists:
+                self.existing += 1
+            else:
+                self.uploads += 1
+            self._urls[key] = (url, time.time() + self.expires)
+            self._evict()
+            self._staging.discard(key)
+            self._cond.notify_all()
+        return url, key
+
+    def _exists(self, s3, key):
+        from botocore.exceptions import ClientError
+        try:
+            with timed_stage('head'):
+                s3.head_object(Bucket=self.bucket, Key=key)
+            return True
+        except ClientError as e:
+            if _not_found(e):
+                return False
+            raise
+
+    def release(self, key):
+        """Give back a staged object; the last release queues it for deletion"""
+        with self._cond:
+            refs = self._refs.get(key, 0) - 1
+            if refs > 0:
+                self._refs[key] = refs
+                return
+            self._refs.pop(key, None)
+        self.delete(key)
+
+    def claim(self, keys):
+        """Cleanup queue hook: the keys still unused, marked as being deleted (their URLs are dropped)"""
+        with self._cond:
+            claimed = [key for key in keys if key not in self._refs]
+            for key in claimed:
+                self._deleting.add(key)
+                self._urls.pop(key, None)
+            return claimed
+
+    def released(self, keys):
+        """Cleanup queue hook: the deletion of keys has finished"""
+        with self._cond:
+            self._deleting.difference_update(keys)
+            self._cond.notify_all()
+
+    def _evict(self):
+        """Drop URLs close to expiry, then the soonest to expire beyond max_urls (call with the lock held)"""
+        cutoff = time.time() + self.min_remaining
+        for key in [key for key, (_, expires_at) in self._urls.items() if expires_at <= cutoff]:
+            del self._urls[key]
+        excess = len(self._urls) - self.max_urls
+        if excess > 0:
+            for key, _ in heapq.nsmallest(excess, self._urls.items(), key=lambda item: item[1][1]):
+                del self._urls[key]
+
+    def stats(self):
+        """Uploads, reused objects and URL cache state"""
+        with self._cond:
+            return {
+                'uploads': self.uploads,
+                'existing': self.existing,
+                'url_hits': self.url_hits,
+                'in_use': len(self._refs),
+                'cached_urls': len(self._urls),
+            }
@@ -0,0 +1,212 @@
+from collections import deque
+from dataclasses import dataclass
+from email.utils import parsedate_to_datetime
+import random
+import threading
+import time
+
+
+# HTTP statuses worth retrying: timeouts, conflicts, rate limits and server errors
+RETRYABLE_STATUSES = {408, 409, 429, 500, 502, 503, 504}
+
+
+@dataclass
+class CallStats:
+    """What happened to one scheduled call"""
+    attempts: int = 0
+    queued: float = 0.0     # Seconds spent waiting for a rate token or concurrency slot
+    backoff: float = 0.0    # Seconds spent sleeping between attempts
+    duration: float = 0.0   # Wall time from submission to result
+    error: str = None
+
+
+class TokenBucket:
+    """Thread-safe token bucket allowing `rate` acquisitions per second with bursts up to `burst`"""
+
+    def __init__(self, rate, burst):
+        self.rate = rate
+        self.burst = burst
+        self._tokens = burst
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        """Take one token, sleeping until one is available"""
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                wait = (1 - self._tokens) / self.rate
+            time.sleep(wait)
+
+
+def retry_after(error):
+    """Seconds requested by a Retry-After / retry-after-ms header on the error's response, if any"""
+    response = getattr(error, 'response', None)
+    headers = getattr(response, 'headers', None)
+    if not headers:
+        return None
+
+    value = headers.get('retry-after-ms')
+    if value:
+        try:
+            return float(value) / 1000
+        except ValueError:
+            pass
+
+    value = headers.get('retry-after')
+    if not value:
+        return None
+    try:
+        return float(value)
+    except ValueError:
+        pass
+    try:
+        # HTTP-date form
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+def is_retryable(error):
+    """Rate limits, server errors, timeouts and dropped connections are retried"""
+    status = getattr(error, 'status_code', None)
+    if status is not None:
+        return status in RETRYABLE_STATUSES
+    return type(error).__name__ in ('APIConnectionError', 'APITimeoutError', 'ConnectionError', 'TimeoutError')
+
+
+class RequestScheduler:
+    """Shared scheduler for outbound model requests
+
+    Every attempt takes a token from a requests-per-second bucket and a slot
+    from a concurrency limit. Retryable failures are retried with jittered
+    exponential backoff, waiting at least as long as the provider's
+    Retry-After header asks. Streaming calls go through stream(), which holds
+    their slot until the stream ends. Per-call CallStats are passed to
+    listeners and summarized by stats().
+    """
+
+    def __init__(self, rate=5.0, burst=None, max_concurrent=8, max_retries=4,
+                 base_delay=0.5, max_delay=30.0):
+        self.bucket = TokenBucket(rate, burst or max(1, int(rate)))
+        self.max_concurrent = max_concurrent
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.listeners = []
+        self.recent = deque(maxlen=200)
+        self._slots = threading.BoundedSemaphore(max_concurrent)
+        self._lock = threading.Lock()
+        self._totals = {'calls': 0, 'attempts': 0, 'failures': 0, 'queued': 0.0, 'in_flight': 0}
+
+    def backoff_delay(self, attempt, error):
+        """Full-jitter exponential backoff, never shorter than Retry-After"""
+        delay = random.uniform(0, min(self.max_delay, self.base_delay * 2 ** (attempt - 1)))
+        requested = retry_after(error)
+        if requested is not None:
+            delay = max(delay, min(requested, self.max_delay))
+        return delay
+
+    def call(self, fn, *args, **kwargs):
+        """Run fn(*args, **kwargs) under the rate/concurrency limits, retrying transient failures"""
+        stats = CallStats()
+        start = time.monotonic()
+        try:
+            while True:
+                stats.attempts += 1
+                self._acquire(stats)
+                try:
+                    return fn(*args, **kwargs)
+                except Exception as e:
+                    if stats.attempts > self.max_retries or not is_retryable(e):
+                        stats.error = f"{type(e).__name__}: {e}"
+                        raise
+                    error = e
+                finally:
+                    self._release()
+
+                self._backoff(stats, error)
+        finally:
+            stats.duration = time.monotonic() - start
+            self._record(stats)
+
+    def stream(self, fn, *args, **kwargs):
+        """
+        Iterate over the chunks of a streaming call fn(*args, **kwargs)
+
+        The concurrency slot is held until the stream is exhausted, fails or
+        is closed, so streams count against max_concurrent like any call.
+        Failures before the first chunk are retried like call(); a failure
+        after chunks have been yielded is raised, not retried, because the
+        caller has already consumed part of the reply.
+        """
+        stats = CallStats()
+        start = time.monotonic()
+        try:
+            while True:
+                stats.attempts += 1
+                self._acquire(stats)
+                response = None
+                started = False
+                try:
+                    response = fn(*args, **kwargs)
+                    for chunk in response:
+                        started = True
+                        yield chunk
+                    return
+                except Exception as e:
+                    if started or stats.attempts > self.max_retries or not is_retryable(e):
+                        stats.error = f"{type(e).__name__}: {e}"
+                        raise
+                    error = e
+                finally:
+                    # Closing the response frees its connection when the reader stops early
+                    if hasattr(response, 'close'):
+                        response.close()
+                    self._release()
+
+                self._backoff(stats, error)
+        finally:
+            stats.duration = time.monotonic() - start
+            self._record(stats)
+
+    def _acquire(self, stats):
+        waiting = time.monotonic()
+        self.bucket.acquire()
+        self._slots.acquire()
+        stats.queued += time.monotonic() - waiting
+        with self._lock:
+            self._totals['in_flight'] += 1
+
+    def _release(self):
+        with self._lock:
+            self._totals['in_flight'] -= 1
+        self._slots.release()
+
+    def _backoff(self, stats, error):
+        delay = self.backoff_delay(stats.attempts, error)
+        stats.backoff += delay
+        time.sleep(delay)
+
+    def _record(self, stats):
+        with self._lock:
+            self._totals['calls'] += 1
+            self._totals['attempts'] += stats.attempts
+            self._totals['failures'] += stats.error is not None
+            self._totals['queued'] += stats.queued
+            self.recent.append(stats)
+        for listener in list(self.listeners):
+            listener(stats)
+
+    def stats(self):
+        """Totals since process start: calls, attempts, retries, failures, queueing time, in-flight"""
+        with self._lock:
+            totals = dict(self._totals)
+        totals['retries'] = totals['attempts'] - totals['calls']
+        totals['avg_queued'] = totals['queued'] / totals['calls'] if totals['calls'] else 0.0
+        return totals
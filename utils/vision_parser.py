@@ -1,153 +1,820 @@
+import atexit
 import base64
+from contextlib import closing
+import hashlib
 from io import BytesIO
 import json
 import os
-import uuid
-import boto3
-from botocore.exceptions import ClientError
-from openai import OpenAI
+import threading
+import time
+from utils.card_checks import card_problems, required_fields
+from utils.card_schema import BATCH_SCHEMA, CARD_FIELDS, CARD_SCHEMA, json_schema_format, normalize_card, normalize_field
+from utils.image_prep import PreparedImage, prepare_image
+from utils.metrics import collect, report, timed_stage
+from utils.partial_json import PartialObjectParser
+from utils.result_cache import CACHE_PATH, ResultCache
+from utils.s3_cleanup import S3CleanupQueue
+from utils.s3_staging import S3Stager
+from utils.scheduler import RequestScheduler
 
 
-# Initialize OpenAI client
-client = OpenAI(
-    base_url="https://openrouter.ai/api/v1",
-    api_key=os.environ.get('OPENAI_API_KEY')
-)
+# HTTP connections kept open per client, sized for the parallel extraction workers
+HTTP_POOL_SIZE = int(os.environ.get('HTTP_POOL_SIZE', 20))
 
-# Initialize S3 client
-s3_client = boto3.client(
-    's3',
-    aws_access_key_id=os.environ.get('AWS_ACCESS_KEY'),
-    aws_secret_access_key=os.environ.get('AWS_SECRET_KEY'),
-    region_name='us-east-1'
+# Shared limits for OpenRouter calls across all sessions and worker threads
+request_scheduler = RequestScheduler(
+    rate=float(os.environ.get('OPENROUTER_RPS', 5)),
+    burst=int(os.environ.get('OPENROUTER_BURST', 0)) or None,
+    max_concurrent=int(os.environ.get('OPENROUTER_MAX_CONCURRENCY', 8)),
+    max_retries=int(os.environ.get('OPENROUTER_MAX_RETRIES', 4))
 )
 
+def _report_call(stats):
+    # Listeners run on the calling thread, so this lands in that thread's collectors
+    report('model_calls', 1)
+    report('model_retries', stats.attempts - 1)
+
+request_scheduler.listeners.append(_report_call)
+
+# OpenAI and S3 clients, created once per process on first use and shared by
+# every session (assign these directly to substitute stand-ins)
+client = None
+s3_client = None
+_clients_lock = threading.Lock()
+
+def get_openai_client():
+    """Return the shared OpenRouter client, creating it on first use"""
+    global client
+    if client is None:
+        with _clients_lock:
+            if client is None:
+                # Deferred: importing openai costs around a second
+                import httpx
+                from openai import DefaultHttpxClient, OpenAI
+                client = OpenAI(
+                    base_url="https://openrouter.ai/api/v1",
+                    api_key=os.environ.get('OPENAI_API_KEY'),
+                    # Retries are handled by request_scheduler
+                    max_retries=0,
+                    http_client=DefaultHttpxClient(
+                        limits=httpx.Limits(
+                            max_connections=HTTP_POOL_SIZE,
+                            max_keepalive_connections=HTTP_POOL_SIZE
+                        )
+                    )
+                )
+    return client
+
+def get_s3_client():
+    """Return the shared S3 client, creating it on first use"""
+    global s3_client
+    if s3_client is None:
+        with _clients_lock:
+            if s3_client is None:
+                import boto3
+                from botocore.config import Config
+                s3_client = boto3.client(
+                    's3',
+                    aws_access_key_id=os.environ.get('AWS_ACCESS_KEY'),
+                    aws_secret_access_key=os.environ.get('AWS_SECRET_KEY'),
+                    region_name='us-east-1',
+                    config=Config(max_pool_connections=HTTP_POOL_SIZE)
+                )
+    return s3_client
+
 # S3 bucket configuration
 BUCKET_NAME = 'business-cards-bucket-mj'
 
+# Images are staged under content-addressed keys and deleted in batches by a
+# background queue once no extraction uses them
+_stager = None
+_stager_lock = threading.Lock()
+_cleanup_queue = None
+_cleanup_queue_lock = threading.Lock()
+
+# Image transport configuration:
+#   'inline' - send the image as a base64 data: URL inside the chat request
+#   's3'     - stage the image in S3 and send a presigned URL
+#   'auto'   - inline, falling back to S3 for images above INLINE_MAX_BYTES
+IMAGE_TRANSPORTS = ('inline', 's3', 'auto')
+IMAGE_TRANSPORT = os.environ.get('IMAGE_TRANSPORT', 'auto')
+INLINE_MAX_BYTES = int(os.environ.get('INLINE_MAX_BYTES', 3 * 1024 * 1024))
+
+# the newest OpenAI model is "gpt-4o" which was released May 13, 2024.
+# do not change this unless explicitly requested by the user
+# MODEL = "openai/gpt-4o-2024-08-06"
+MODEL = "google/gemini-2.0-flash-001"
+RESPONSE_FORMAT = {"type": "json_object"}
+
+# Model cascade: every card goes to the first model, and is re-run on the next
+# one only when extraction fails, the reply is malformed or the card fails the
+# utils.card_checks validation (unreadable, no name, malformed email/phone/GSTIN,
+# or missing one of CASCADE_REQUIRED_FIELDS). Comma separated; a single model
+# disables it, and an empty value falls back to MODEL alone.
+MODEL_CASCADE = [
+    model.strip() for model in
+    os.environ.get('MODEL_CASCADE', f"{MODEL},openai/gpt-4o-2024-08-06").split(',')
+    if model.strip()
+] or [MODEL]
+# Absent fields that send a card to the next model; none by default, since a
+# stronger model cannot read an email that is not printed on the card
+CASCADE_REQUIRED_FIELDS = required_fields(os.environ.get('CASCADE_REQUIRED_FIELDS', ''))
+
+# Structured output mode:
+#   'json_object' - the schema is spelled out in EXTRACTION_PROMPT, any JSON object is accepted
+#   'json_schema' - strict JSON schema response format (utils.card_schema) with COMPACT_PROMPT
+# Replies are normalized to the card schema in both modes.
+OUTPUT_MODES = ('json_object', 'json_schema')
+OUTPUT_MODE = os.environ.get('OUTPUT_MODE', 'json_object')
+
+# Vision detail:
+#   'high'     - every card is read at high detail
+#   'low'      - every card is read at low detail (fewest image tokens, may miss small print)
+#   'adaptive' - low detail first, reading the card again at high detail when
+#                utils.card_checks finds it invalid or missing one of
+#                DETAIL_REQUIRED_FIELDS
+DETAIL_MODES = ('high', 'low', 'adaptive')
+VISION_DETAIL = os.environ.get('VISION_DETAIL', 'high')
+# Absent fields that send a low detail read to high detail: small print such
+# as an email is what low detail misses. Comma separated, empty to disable.
+DETAIL_REQUIRED_FIELDS = required_fields(os.environ.get('DETAIL_REQUIRED_FIELDS', 'email'))
+
+# Maximum number of card images packed into one request by extract_cards_info
+CARD_BATCH_SIZE = int(os.environ.get('CARD_BATCH_SIZE', 4))
+
+EXTRACTION_PROMPT = (
+    "Extract details from each business card image and format them as JSON objects following this schema:\n"
+    "{\n"
+    "  \"company_name\": \"\",\n"
+    "  \"contact_person\": [\n"
+    "    {\n"
+    "      \"name\": \"\",\n"
+    "      \"position\": \"\",\n"
+    "      \"personal_phone\": [\"\"],\n"
+    "      \"personal_email\": [\"\"]\n"
+    "    }\n"
+    "  ],\n"
+    "  \"company_address\": [\n"
+    "    {\n"
+    "      \"remaining\": \"\",\n"
+    "      \"city\": \"\",\n"
+    "      \"state\": \"\",\n"
+    "      \"country\": \"\",\n"
+    "      \"pincode\": \"\"\n"
+    "    }\n"
+    "  ],\n"
+    "  \"company_email\": [\"\"],\n"
+    "  \"company_phone\": [\"\"],\n"
+    "  \"company_fax\": [\"\"],\n"
+    "  \"company_website\": [\"\"],\n"
+    "  \"company_gstin\": [\"\"],\n"
+    "  \"company_details_if_any\": [\"\"]\n"
+    "}\n"
+    "Follow these Instructions:\n"
+    "- Return only the JSON object without any explanations or additional text.\n"
+    "- If a field is missing or information is not available, use null for that field.\n"
+    "- If multiple images are uploaded, provide separate JSON objects for each image.\n"
+    "- For unreadable or unclear images: provide a json in which set all fields to null and include a description of the issue in the 'company_name' field.\n"
+    "- If the state or country is missing, infer them based on the city.\n"
+    "- Format phone numbers with the appropriate country code based on the country."
+)
+
+# Appended to EXTRACTION_PROMPT when several images share one request
+BATCH_INSTRUCTIONS = (
+    "\n- {count} images are attached, each preceded by its number. Return a JSON object of the form "
+    "{{\"cards\": [...]}} containing exactly {count} objects, one per image, in the same order as the images."
+)
+
+# Instructions for 'json_schema' mode; the field layout comes from the response format
+COMPACT_PROMPT = (
+    "Extract the business card in the image. "
+    "Use null for anything not on the card. "
+    "Infer a missing state or country from the city. "
+    "Write phone numbers with the country code. "
+    "If the image is unreadable, set every field to null and describe the problem in company_name."
+)
+
+# Appended to COMPACT_PROMPT when several images share one request
+COMPACT_BATCH_INSTRUCTIONS = (
+    " {count} images are attached, each preceded by its number. "
+    "Return exactly {count} cards, one per image, in the same order."
+)
+
+# Result cache, created on first use (set RESULT_CACHE_PATH to '' to disable)
+_result_cache = None
+_result_cache_lock = threading.Lock()
+
+def _request_format(output_mode, count=1):
+    """Return (prompt, response_format) for a request covering count images"""
+    if output_mode == 'json_schema':
+        if count == 1:
+            return COMPACT_PROMPT, json_schema_format('business_card', CARD_SCHEMA)
+        return (COMPACT_PROMPT + COMPACT_BATCH_INSTRUCTIONS.format(count=count),
+                json_schema_format('business_cards', BATCH_SCHEMA))
+    if count == 1:
+        return EXTRACTION_PROMPT, RESPONSE_FORMAT
+    return EXTRACTION_PROMPT + BATCH_INSTRUCTIONS.format(count=count), RESPONSE_FORMAT
+
+def prompt_fingerprint(output_mode=None, detail=None, models=None):
+    """Identify the prompt/model cascade/detail/required fields combination a result was produced with"""
+    output_mode = output_mode or OUTPUT_MODE
+    detail = detail or VISION_DETAIL
+    models = models or MODEL_CASCADE
+    payload = json.dumps(
+        [models, output_mode, detail, _request_format(output_mode), _request_format(output_mode, 2),
+         CASCADE_REQUIRED_FIELDS, DETAIL_REQUIRED_FIELDS if detail == 'adaptive' else ()],
+        sort_keys=True
+    )
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()[:16]
+
+def get_result_cache():
+    """Return the process-wide result cache, or None if caching is disabled"""
+    global _result_cache
+    if not CACHE_PATH:
+        return None
+    with _result_cache_lock:
+        if _result_cache is None:
+            # Other fingerprints (another process's cascade, an older prompt) just miss;
+            # they are not purged here and age out through the cache's own eviction
+            _result_cache = ResultCache(CACHE_PATH)
+    return _result_cache
+
+def encode_image(image):
+    """Encode PIL Image as JPEG bytes"""
+    buffer = BytesIO()
+    image.save(buffer, format='JPEG')
+    return buffer.getvalue()
+
+def to_data_url(image_bytes):
+    """Build a base64 data: URL from JPEG bytes"""
+    return "data:image/jpeg;base64," + base64.b64encode(image_bytes).decode('ascii')
+
 def upload_to_s3(image):
-    """Upload PIL Image to S3 and return URL"""
+    """
+    Stage PIL Image (or already encoded JPEG bytes) in S3 and return (URL, key)
+
+    Identical images share one object and presigned URL; the upload is
+    skipped when the object already exists. Pass the key to release_staged()
+    when the URL is no longer needed.
+    """
+    from botocore.exceptions import ClientError
+
     try:
         # Convert PIL Image to bytes
-        buffer = BytesIO()
-        image.save(buffer, format='JPEG')
-        buffer.seek(0)
+        image_bytes = image if isinstance(image, bytes) else encode_image(image)
+        return get_stager().acquire(image_bytes)
+    except ClientError as e:
+        raise Exception(f"Failed to upload image to S3: {str(e)}")
+
+def get_stager():
+    """Return the process-wide S3 stager, creating it on first use"""
+    global _stager
+    with _stager_lock:
+        if _stager is None:
+            _stager = S3Stager(get_s3_client, BUCKET_NAME, lambda key: get_cleanup_queue().enqueue(key))
+    return _stager
+
+def get_cleanup_queue():
+    """Return the process-wide background S3 deletion queue, creating it on first use"""
+    global _cleanup_queue
+    with _cleanup_queue_lock:
+        if _cleanup_queue is None:
+            # Objects staged again while their deletion was queued are left alone
+            _cleanup_queue = S3CleanupQueue(
+                get_s3_client, BUCKET_NAME,
+                claim=lambda keys: get_stager().claim(keys),
+                released=lambda keys: get_stager().released(keys)
+            )
+            # Drain outstanding deletions when the server process exits
+            atexit.register(_cleanup_queue.close)
+    return _cleanup_queue
 
-        # Generate unique filename
-        filename = f"card_{uuid.uuid4()}.jpg"
+def release_staged(filename):
+    """Hand back a staged file after processing; it is deleted once no extraction uses it"""
+    get_stager().release(filename)
 
-        # Upload to S3
-        s3_client.upload_fileobj(buffer, BUCKET_NAME, filename)
+def _resolve_transport(transport):
+    transport = transport or IMAGE_TRANSPORT
+    if transport not in IMAGE_TRANSPORTS:
+        raise ValueError(f"Unknown image transport: {transport}")
+    return transport
 
-        # Generate URL (valid for 5 minutes)
-        url = s3_client.generate_presigned_url(
-            'get_object',
-            Params={'Bucket': BUCKET_NAME, 'Key': filename},
-            ExpiresIn=36000  # 10 hours
+def _resolve_detail(detail):
+    detail = detail or VISION_DETAIL
+    if detail not in DETAIL_MODES:
+        raise ValueError(f"Unknown vision detail: {detail}")
+    return detail
+
+def _resolve_output_mode(output_mode):
+    output_mode = output_mode or OUTPUT_MODE
+    if output_mode not in OUTPUT_MODES:
+        raise ValueError(f"Unknown output mode: {output_mode}")
+    return output_mode
+
+def _cached(cache, prepared, fingerprint):
+    """Cached result for a prepared image, normalized in case it predates normalization"""
+    cached = cache.get(prepared.data, fingerprint) if cache else None
+    return normalize_card(cached) if cached is not None else None
+
+def _prepare(image):
+    """Downscale and recompress before the image leaves the process"""
+    if isinstance(image, PreparedImage):
+        return image
+    with timed_stage('prepare'):
+        return prepare_image(image)
+
+def _stage_image(image_bytes, transport):
+    """Return (image_url, s3_filename); s3_filename is None when the image is sent inline"""
+    report('image_bytes', len(image_bytes))
+    if transport == 'inline' or (transport == 'auto' and len(image_bytes) <= INLINE_MAX_BYTES):
+        # Send the image inside the request, no S3 round-trips needed
+        with timed_stage('inline_encode'):
+            return to_data_url(image_bytes), None
+    # Upload image to S3 and get URL
+    return upload_to_s3(image_bytes)
+
+def _image_part(image_url, detail):
+    return {
+        "type": "image_url",
+        "image_url": {
+            "url": image_url,
+            "detail": detail
+        }
+    }
+
+def _create(content, response_format, model, **kwargs):
+    """Send a single user message with the given content parts through the scheduler"""
+    with timed_stage('model'):
+        return request_scheduler.call(
+            get_openai_client().chat.completions.create,
+            model=model,
+            messages=[
+                {
+                    "role": "user",
+                    "content": content
+                }
+            ],
+            response_format=response_format,
+            **kwargs
         )
 
-        # Return both URL and filename for cleanup
-        return url, filename
-    except ClientError as e:
-        raise Exception(f"Failed to upload image to S3: {str(e)}")
+def _stream(content, response_format, model, **kwargs):
+    """Streaming _create: yields the reply's chunks, holding a scheduler slot until it ends or is closed"""
+    chunks = request_scheduler.stream(
+        get_openai_client().chat.completions.create,
+        model=model,
+        messages=[
+            {
+                "role": "user",
+                "content": content
+            }
+        ],
+        response_format=response_format,
+        stream=True,
+        **kwargs
+    )
+    try:
+        # The stage covers the wait for the first chunk, retries included
+        with timed_stage('model'):
+            chunk = next(chunks, None)
+        if chunk is None:
+            return
+        yield chunk
+        yield from chunks
+    finally:
+        chunks.close()
+
+def _report_usage(usage, model):
+    """Report the provider's token counts for one response; returns the total"""
+    if usage is None:
+        return 0
+    model = model or MODEL
+    report('prompt_tokens', usage.prompt_tokens or 0, model=model)
+    report('completion_tokens', usage.completion_tokens or 0, model=model)
+    return (usage.prompt_tokens or 0) + (usage.completion_tokens or 0)
+
+def _complete(content, response_format, model):
+    """Send a single user message and parse the JSON reply"""
+    response = _create(content, response_format, model)
+    _report_usage(getattr(response, 'usage', None), getattr(response, 'model', None) or model)
+    with timed_stage('parse'):
+        return json.loads(response.choices[0].message.content)
 
-def delete_from_s3(filename):
-    """Delete file from S3 after processing"""
+def _single_content(image_url, prompt, detail):
+    return [
+        {
+            "type": "text",
+            "text": prompt
+        },
+        _image_part(image_url, detail)
+    ]
+
+def _extract_staged(image_url, output_mode, detail, model):
+    """One model call for one already staged card image"""
+    prompt, response_format = _request_format(output_mode)
+    # Parse the response (an array reply is reduced to its first card)
+    return normalize_card(_complete(_single_content(image_url, prompt, detail), response_format, model))
+
+def _timed_pass(detail, cards, fn, *args):
+    """
+    Run one extraction pass, reporting its cards, tokens and time as '<detail>_pass_*'
+
+    A pass that returns None (a failed batch) is not reported: its cards are
+    read again one at a time, and those passes count them.
+    """
+    start = time.perf_counter()
+    with collect() as metrics:
+        try:
+            result = fn(*args)
+        except Exception:
+            _report_pass(detail, cards, metrics, start)
+            raise
+    if result is not None:
+        _report_pass(detail, cards, metrics, start)
+    return result
+
+def _report_pass(detail, cards, metrics, start):
+    report(f'{detail}_pass_cards', cards)
+    report(f'{detail}_pass_tokens', metrics.values['prompt_tokens'] + metrics.values['completion_tokens'])
+    report(f'{detail}_pass_seconds', time.perf_counter() - start)
+
+def _needs_escalation(low_result):
+    """True (and counted) when a low detail result is missing or fails the card checks"""
+    if not isinstance(low_result, Exception) and not card_problems(low_result, DETAIL_REQUIRED_FIELDS):
+        report('low_detail_accepted', 1)
+        return False
+    report('detail_escalations', 1)
+    return True
+
+def _extract_single(prepared, transport, output_mode, detail, model):
+    """One card image on one model: a single call, or up to two when detail is 'adaptive'"""
+    s3_filename = None
     try:
-        s3_client.delete_object(Bucket=BUCKET_NAME, Key=filename)
-    except ClientError:
-        pass  # Ignore deletion errors
+        image_url, s3_filename = _stage_image(prepared.data, transport)
+        if detail != 'adaptive':
+            return _extract_staged(image_url, output_mode, detail, model)
 
-def extract_card_info(image):
+        # The staged image is reused if the card has to be read again
+        try:
+            result = _timed_pass('low', 1, _extract_staged, image_url, output_mode, 'low', model)
+        except Exception as e:
+            result = e
+        if _needs_escalation(result):
+            result = _timed_pass('high', 1, _extract_staged, image_url, output_mode, 'high', model)
+        return result
+    finally:
+        # Release the staged S3 file, if any
+        if s3_filename:
+            release_staged(s3_filename)
+
+def _escalate(prepared, transport, output_mode, low_result, model):
+    """Keep a low detail result that passes the checks, otherwise read the card at high detail"""
+    if not _needs_escalation(low_result):
+        return low_result
+    return _timed_pass('high', 1, _extract_single, prepared, transport, output_mode, 'high', model)
+
+def _route_outcome(result):
+    """Cascade verdict for one model's result: (outcome, problems)"""
+    # Invalid JSON and replies that are not a card object both raise ValueError
+    if isinstance(result, ValueError):
+        return 'malformed', [str(result)]
+    if isinstance(result, Exception):
+        return 'failed', [str(result)]
+    problems = card_problems(result, CASCADE_REQUIRED_FIELDS)
+    return ('low_score' if problems else 'accepted'), problems
+
+def _route(prepared, transport, output_mode, detail, first_result=None, first_seconds=None):
+    """
+    Run a card down MODEL_CASCADE until one model's result passes the checks
+
+    Args:
+        first_result: The first model's result (dict or Exception) if it has
+            already been obtained, e.g. from a batched request
+        first_seconds: Time the first model took for first_result, if known
+
+    Returns:
+        dict: The accepted result, or else the one with the fewest problems
+            (later models win ties), with a 'routing' list recording each
+            model's outcome, problems and seconds
+
+    Raises:
+        Exception: The last error if no model produced a result
+    """
+    routing = []
+    best = best_problems = None
+    for position, model in enumerate(MODEL_CASCADE):
+        if position == 0 and first_result is not None:
+            result, seconds = first_result, first_seconds
+        else:
+            start = time.perf_counter()
+            try:
+                result = _extract_single(prepared, transport, output_mode, detail, model)
+            except Exception as e:
+                result = e
+            seconds = time.perf_counter() - start
+
+        outcome, problems = _route_outcome(result)
+        routing.append({
+            'model': model,
+            'outcome': outcome,
+            'problems': problems,
+            'seconds': round(seconds, 3) if seconds is not None else None
+        })
+        report('cascade_routes', 1, model=model, outcome=outcome)
+        if seconds is not None:
+            report('cascade_seconds', seconds, model=model)
+
+        if not isinstance(result, Exception) and (best is None or len(problems) <= len(best_problems)):
+            best, best_problems = result, problems
+        if outcome == 'accepted':
+            break
+
+    if best is None:
+        raise result
+    best['routing'] = routing
+    return best
+
+def adaptive_savings(values):
+    """
+    Estimate what adaptive detail saved compared with reading every card at high detail
+
+    The high detail cost per card is measured on the escalated cards, so
+    there is no estimate until at least one card has escalated.
+
+    Args:
+        values: Collected metric values (utils.metrics.ExtractionMetrics.values)
+
+    Returns:
+        dict: 'tokens' and 'seconds' saved (negative when adaptive cost more),
+            or None without enough data
+    """
+    low_cards = values.get('low_pass_cards', 0)
+    high_cards = values.get('high_pass_cards', 0)
+    if not low_cards or not high_cards:
+        return None
+    savings = {}
+    for unit in ('tokens', 'seconds'):
+        spent = values.get(f'low_pass_{unit}', 0) + values.get(f'high_pass_{unit}', 0)
+        all_high = low_cards * values.get(f'high_pass_{unit}', 0) / high_cards
+        savings[unit] = all_high - spent
+    return savings
+
+def _extract_batch(prepared_images, transport, output_mode, detail, model):
+    """
+    One model call for several prepared card images
+
+    Returns:
+        list: One parsed dict per image in input order, or None if the call
+            failed or the reply cannot be mapped back to the images by position
+    """
+    s3_filenames = []
+    prompt, response_format = _request_format(output_mode, len(prepared_images))
+    try:
+        content = [
+            {
+                "type": "text",
+                "text": prompt
+            }
+        ]
+        for number, prepared in enumerate(prepared_images, start=1):
+            image_url, s3_filename = _stage_image(prepared.data, transport)
+            if s3_filename:
+                s3_filenames.append(s3_filename)
+            content.append({"type": "text", "text": f"Image {number}:"})
+            content.append(_image_part(image_url, detail))
+
+        parsed = _complete(content, response_format, model)
+    except Exception:
+        return None
+    finally:
+        for s3_filename in s3_filenames:
+            release_staged(s3_filename)
+
+    cards = parsed.get('cards') if isinstance(parsed, dict) else parsed
+    if not isinstance(cards, list) or len(cards) != len(prepared_images):
+        return None
+    if not all(isinstance(card, dict) for card in cards):
+        return None
+    return [normalize_card(card) for card in cards]
+
+def extract_card_info(image, transport=None, use_cache=True, output_mode=None, detail=None):
     """
     Extract information from business card image using GPT-4o
 
     Args:
-        image: PIL Image object of the business card
+        image: PIL Image object of the business card, or a PreparedImage
+            already normalized by utils.image_prep.prepare_image
+        transport: 'inline', 's3' or 'auto' (defaults to IMAGE_TRANSPORT)
+        use_cache: Return a cached result for an identical image/prompt/model
+        output_mode: 'json_object' or 'json_schema' (defaults to OUTPUT_MODE)
+        detail: 'high', 'low' or 'adaptive' (defaults to VISION_DETAIL)
 
     Returns:
         dict: Contains extracted information based on the defined schema
     """
-    s3_filename = None
+    transport = _resolve_transport(transport)
+    output_mode = _resolve_output_mode(output_mode)
+    detail = _resolve_detail(detail)
     try:
-        # Upload image to S3 and get URL
-        image_url, s3_filename = upload_to_s3(image)
-
-        # the newest OpenAI model is "gpt-4o" which was released May 13, 2024.
-        # do not change this unless explicitly requested by the user
-        response = client.chat.completions.create(
-            # model="openai/gpt-4o-2024-08-06",
-            model="google/gemini-2.0-flash-001",
-            messages=[
-                {
-                    "role": "user",
-                    "content": [
-                        {
-                            "type": "text",
-                            "text": (
-                                "Extract details from each business card image and format them as JSON objects following this schema:\n"
-                                "{\n"
-                                "  \"company_name\": \"\",\n"
-                                "  \"contact_person\": [\n"
-                                "    {\n"
-                                "      \"name\": \"\",\n"
-                                "      \"position\": \"\",\n"
-                                "      \"personal_phone\": [\"\"],\n"
-                                "      \"personal_email\": [\"\"]\n"
-                                "    }\n"
-                                "  ],\n"
-                                "  \"company_address\": [\n"
-                                "    {\n"
-                                "      \"remaining\": \"\",\n"
-                                "      \"city\": \"\",\n"
-                                "      \"state\": \"\",\n"
-                                "      \"country\": \"\",\n"
-                                "      \"pincode\": \"\"\n"
-                                "    }\n"
-                                "  ],\n"
-                                "  \"company_email\": [\"\"],\n"
-                                "  \"company_phone\": [\"\"],\n"
-                                "  \"company_fax\": [\"\"],\n"
-                                "  \"company_website\": [\"\"],\n"
-                                "  \"company_gstin\": [\"\"],\n"
-                                "  \"company_details_if_any\": [\"\"]\n"
-                                "}\n"
-                                "Follow these Instructions:\n"
-                                "- Return only the JSON object without any explanations or additional text.\n"
-                                "- If a field is missing or information is not available, use null for that field.\n"
-                                "- If multiple images are uploaded, provide separate JSON objects for each image.\n"
-                                "- For unreadable or unclear images: provide a json in which set all fields to null and include a description of the issue in the 'company_name' field.\n"
-                                "- If the state or country is missing, infer them based on the city.\n"
-                                "- Format phone numbers with the appropriate country code based on the country."
-                            )
-                        },
-                        {
-                            "type": "image_url",
-                            "image_url": {
-                                "url": image_url,
-                                "detail": "high"
-                            }
-                        }
-                    ]
-                }
-            ],
-            response_format={"type": "json_object"}
-        )
+        prepared = _prepare(image)
+
+        # Identical image under the same prompt and model: skip S3 and the model call
+        cache = get_result_cache() if use_cache else None
+        fingerprint = prompt_fingerprint(output_mode, detail)
+        cached = _cached(cache, prepared, fingerprint)
+        if cached is not None:
+            return cached
 
-        # Parse the response
-        parsed = json.loads(response.choices[0].message.content)
-        
-        # Handle both array and object responses
-        if isinstance(parsed, list) and len(parsed) > 0:
-            # If it's an array, return the first object
-            return parsed[0]
+        result = _route(prepared, transport, output_mode, detail)
+
+        if cache:
+            cache.put(prepared.data, fingerprint, result)
+        return result
+
+    except Exception as e:
+        raise Exception(f"Failed to analyze image with GPT-4o: {str(e)}")
+
+def extract_cards_info(images, transport=None, use_cache=True, batch_size=None, output_mode=None, detail=None):
+    """
+    Extract information from several business card images, packing up to
+    batch_size images into each model request
+
+    The returned array is mapped back to the input cards by position. When a
+    batched call fails or returns the wrong number of cards, its cards are
+    retried with one request each. With adaptive detail the batch is read at
+    low detail and only the cards failing the checks are read again, one
+    request each, at high detail.
+
+    Args:
+        images: PIL Images or PreparedImages
+        transport: 'inline', 's3' or 'auto' (defaults to IMAGE_TRANSPORT)
+        use_cache: Return cached results for identical image/prompt/model
+        batch_size: Maximum cards per request (defaults to CARD_BATCH_SIZE)
+        output_mode: 'json_object' or 'json_schema' (defaults to OUTPUT_MODE)
+        detail: 'high', 'low' or 'adaptive' (defaults to VISION_DETAIL)
+
+    Returns:
+        list: One entry per input image, in input order. Each entry is the
+            extracted dict, or the Exception raised for that card.
+    """
+    transport = _resolve_transport(transport)
+    output_mode = _resolve_output_mode(output_mode)
+    detail = _resolve_detail(detail)
+    batch_size = max(1, batch_size or CARD_BATCH_SIZE)
+    results = [None] * len(images)
+
+    cache = get_result_cache() if use_cache else None
+    fingerprint = prompt_fingerprint(output_mode, detail)
+
+    # Prepare every image and answer what we can from the cache
+    pending = []
+    for idx, image in enumerate(images):
+        try:
+            prepared = _prepare(image)
+        except Exception as e:
+            results[idx] = Exception(f"Failed to analyze image with GPT-4o: {str(e)}")
+            continue
+        cached = _cached(cache, prepared, fingerprint)
+        if cached is not None:
+            results[idx] = cached
+        else:
+            pending.append((idx, prepared))
+
+    for start in range(0, len(pending), batch_size):
+        chunk = pending[start:start + batch_size]
+        first_model = MODEL_CASCADE[0]
+        batch_results = None
+        batch_start = time.perf_counter()
+        if len(chunk) > 1:
+            chunk_images = [prepared for _, prepared in chunk]
+            if detail == 'adaptive':
+                batch_results = _timed_pass(
+                    'low', len(chunk), _extract_batch, chunk_images, transport, output_mode, 'low', first_model
+                )
+            else:
+                batch_results = _extract_batch(chunk_images, transport, output_mode, detail, first_model)
+
+        if batch_results is None:
+            # Single card, failed batch or mismatched count: one request per card
+            batch_results = []
+            for _, prepared in chunk:
+                try:
+                    batch_results.append(_route(prepared, transport, output_mode, detail))
+                except Exception as e:
+                    batch_results.append(Exception(f"Failed to analyze image with GPT-4o: {str(e)}"))
         else:
-            # If it's already an object, return it directly
-            return parsed
+            # Each card is charged an equal share of the batched request
+            share = (time.perf_counter() - batch_start) / len(chunk)
+            for n, (_, prepared) in enumerate(chunk):
+                card_start = time.perf_counter()
+                first = batch_results[n]
+                if detail == 'adaptive':
+                    # Read the cards that failed the checks again at high detail
+                    try:
+                        first = _escalate(prepared, transport, output_mode, first, first_model)
+                    except Exception as e:
+                        first = e
+                seconds = share + time.perf_counter() - card_start
+                try:
+                    # Cards that still fail go down the rest of the model cascade
+                    batch_results[n] = _route(prepared, transport, output_mode, detail, first, seconds)
+                except Exception as e:
+                    batch_results[n] = Exception(f"Failed to analyze image with GPT-4o: {str(e)}")
+
+        for (idx, prepared), result in zip(chunk, batch_results):
+            results[idx] = result
+            if cache and not isinstance(result, Exception):
+                cache.put(prepared.data, fingerprint, result)
+
+    return results
+
+def stream_card_info(image, transport=None, use_cache=True, output_mode=None, detail=None):
+    """
+    Extract information from business card image, yielding each field as
+    soon as it has streamed in
+
+    Args:
+        image: PIL Image object of the business card, or a PreparedImage
+        transport: 'inline', 's3' or 'auto' (defaults to IMAGE_TRANSPORT)
+        use_cache: Replay a cached result for an identical image/prompt/model
+        output_mode: 'json_object' or 'json_schema' (defaults to OUTPUT_MODE)
+        detail: 'high', 'low' or 'adaptive' (defaults to VISION_DETAIL);
+            adaptive streams the low detail pass and, if the card escalates,
+            yields the fields the high detail pass changed afterwards
+
+    Yields:
+        tuple: (field, value) for each top-level schema field; together they
+            form the same dict extract_card_info returns (a field yielded
+            again replaces its earlier value)
+    """
+    transport = _resolve_transport(transport)
+    output_mode = _resolve_output_mode(output_mode)
+    detail = _resolve_detail(detail)
+    s3_filename = None
+    try:
+        prepared = _prepare(image)
+
+        cache = get_result_cache() if use_cache else None
+        fingerprint = prompt_fingerprint(output_mode, detail)
+        cached = _cached(cache, prepared, fingerprint)
+        if cached is not None:
+            yield from cached.items()
+            return
+
+        image_url, s3_filename = _stage_image(prepared.data, transport)
+        prompt, response_format = _request_format(output_mode)
+        first_model = MODEL_CASCADE[0]
+        yielded = {}
+        start = time.perf_counter()
+        tokens = 0
+        try:
+            # The final chunk carries token usage and no choices
+            stream = _stream(
+                _single_content(image_url, prompt, 'low' if detail == 'adaptive' else detail),
+                response_format, first_model, stream_options={"include_usage": True}
+            )
+
+            parser = PartialObjectParser()
+            received = []
+            with closing(stream):
+                for chunk in stream:
+                    tokens += _report_usage(getattr(chunk, 'usage', None), getattr(chunk, 'model', None) or first_model)
+                    if not chunk.choices or not chunk.choices[0].delta.content:
+                        continue
+                    received.append(chunk.choices[0].delta.content)
+                    for field, value in parser.feed(received[-1]):
+                        if field in CARD_FIELDS:
+                            yielded[field] = normalize_field(field, value)
+                            yield field, yielded[field]
+
+            # The complete reply must still be valid JSON before it is cached
+            result = normalize_card(json.loads(''.join(received)))
+        except Exception as e:
+            # A high detail pass or a later model may still read the card
+            result = e
+
+        if detail == 'adaptive':
+            report('low_pass_cards', 1)
+            report('low_pass_tokens', tokens)
+            report('low_pass_seconds', time.perf_counter() - start)
+            if _needs_escalation(result):
+                try:
+                    result = _timed_pass('high', 1, _extract_staged, image_url, output_mode, 'high', first_model)
+                except Exception as e:
+                    result = e
+
+        # Cards that still fail go down the rest of the model cascade
+        result = _route(prepared, transport, output_mode, detail, result, time.perf_counter() - start)
+        for field, value in result.items():
+            if field not in yielded or yielded[field] != value:
+                yield field, value
+
+        if cache:
+            cache.put(prepared.data, fingerprint, result)
 
     except Exception as e:
         raise Exception(f"Failed to analyze image with GPT-4o: {str(e)}")
     finally:
-        # Clean up S3 file if it was created
+        # Release the staged S3 file, if any
         if s3_filename:
-            delete_from_s3(s3_filename)
+            release_staged(s3_filename)